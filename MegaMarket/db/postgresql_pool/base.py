@@ -0,0 +1,54 @@
+import psycopg2
+import psycopg2.extras
+from django.conf import settings
+from django.db.backends.postgresql import base, creation
+from django.utils.asyncio import async_unsafe
+
+from MegaMarket.db.postgresql_pool import pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+	def _destroy_test_db(self, test_database_name, verbosity):
+		# Свободные соединения пула не дают удалить тестовую базу данных
+		pool.close_pools()
+		super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+	"""Бэкенд PostgreSQL, берущий соединения из пула процесса вместо открытия нового соединения на каждый запрос"""
+
+	creation_class = DatabaseCreation
+
+	def get_pool(self, conn_params: dict) -> pool.ConnectionPool:
+		# Пул общий для всех потоков процесса, отдельный для каждой базы данных и параметров подключения
+		key = f"{self.alias}:{conn_params.get('database')}@{conn_params.get('host')}:{conn_params.get('port')}"
+		return pool.get_pool(
+			key,
+			lambda: psycopg2.connect(**conn_params),
+			settings.DB_POOL_MAX_SIZE,
+			settings.DB_POOL_TIMEOUT,
+			settings.DB_POOL_CHECK_INTERVAL,
+		)
+
+	@async_unsafe
+	def get_new_connection(self, conn_params):
+		self.pool = self.get_pool(conn_params)
+		connection = self.pool.getconn()
+
+		options = self.settings_dict["OPTIONS"]
+		try:
+			self.isolation_level = options["isolation_level"]
+		except KeyError:
+			self.isolation_level = connection.isolation_level
+		else:
+			if self.isolation_level != connection.isolation_level:
+				connection.set_session(isolation_level=self.isolation_level)
+		psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+		return connection
+
+	def _close(self):
+		if self.connection is not None:
+			# Соединение, закрываемое внутри транзакции или после ошибки, может быть в неизвестном состоянии
+			discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+			with self.wrap_database_errors:
+				self.pool.putconn(self.connection, discard=discard)
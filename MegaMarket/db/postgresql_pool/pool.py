@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Callable
+
+import psycopg2
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+	"""Свободное соединение не появилось за время ожидания"""
+
+
+class ConnectionPool:
+	"""Потокобезопасный пул соединений psycopg2 с ожиданием свободного соединения и проверкой простаивавших соединений"""
+
+	def __init__(self, connect: Callable, max_size: int, timeout: float, check_interval: float):
+		self.connect = connect
+		self.max_size = max_size
+		self.timeout = timeout
+		self.check_interval = check_interval
+		self._idle = []
+		self._open = 0
+		self._condition = threading.Condition()
+		self._stats = {"checkouts": 0, "waits": 0, "wait_time": 0.0, "max_wait_time": 0.0, "timeouts": 0,
+			"connects": 0, "discards": 0}
+
+	def getconn(self):
+		"""Возвращает свободное соединение, открывая новое, если пул не заполнен, иначе ждёт возврата соединения"""
+
+		start = time.monotonic()
+		waited = False
+		with self._condition:
+			while True:
+				if self._idle:
+					connection, returned_at = self._idle.pop()
+					break
+				if self._open < self.max_size:
+					connection, returned_at = None, None
+					self._open += 1
+					break
+				remaining = start + self.timeout - time.monotonic()
+				if remaining <= 0:
+					self._stats["timeouts"] += 1
+					raise PoolTimeout(f"no free connection in the pool after {self.timeout} seconds")
+				waited = True
+				self._condition.wait(remaining)
+
+			wait_time = time.monotonic() - start
+			self._stats["checkouts"] += 1
+			self._stats["waits"] += waited
+			self._stats["wait_time"] += wait_time
+			self._stats["max_wait_time"] = max(self._stats["max_wait_time"], wait_time)
+
+		# Место в пуле уже занято, поэтому непригодное соединение заменяется новым без повторного ожидания
+		if connection is not None and not self._is_healthy(connection, returned_at):
+			self._close(connection)
+			connection = None
+		if connection is None:
+			try:
+				connection = self.connect()
+			except Exception:
+				self._release_slot()
+				raise
+			with self._condition:
+				self._stats["connects"] += 1
+		return connection
+
+	def putconn(self, connection, discard: bool = False) -> None:
+		"""Возвращает соединение в пул, откатывая незавершённую транзакцию, либо закрывает его при discard"""
+
+		if not discard and not connection.closed and \
+				connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+			try:
+				connection.rollback()
+			except psycopg2.Error:
+				discard = True
+
+		if discard or connection.closed:
+			self._close(connection)
+			self._release_slot()
+			return
+		with self._condition:
+			self._idle.append((connection, time.monotonic()))
+			self._condition.notify()
+
+	def close_idle(self) -> None:
+		"""Закрывает все свободные соединения"""
+
+		with self._condition:
+			idle, self._idle = self._idle, []
+			self._open -= len(idle)
+			self._condition.notify_all()
+		for connection, _ in idle:
+			self._close(connection)
+
+	def get_stats(self) -> dict:
+		with self._condition:
+			return {
+				**self._stats,
+				"open": self._open,
+				"idle": len(self._idle),
+				"in_use": self._open - len(self._idle),
+				"max_size": self.max_size,
+			}
+
+	def _is_healthy(self, connection, returned_at: float) -> bool:
+		if connection.closed:
+			return False
+		if time.monotonic() - returned_at < self.check_interval:
+			return True
+		try:
+			with connection.cursor() as cursor:
+				cursor.execute("SELECT 1;")
+			return True
+		except psycopg2.Error:
+			return False
+
+	def _close(self, connection) -> None:
+		with self._condition:
+			self._stats["discards"] += 1
+		try:
+			connection.close()
+		except psycopg2.Error:
+			pass
+
+	def _release_slot(self) -> None:
+		with self._condition:
+			self._open -= 1
+			self._condition.notify()
+
+
+def get_pool(key: str, connect: Callable, max_size: int, timeout: float, check_interval: float) -> ConnectionPool:
+	"""Возвращает пул процесса для заданных параметров подключения, создавая его при первом обращении"""
+
+	with _pools_lock:
+		if key not in _pools:
+			_pools[key] = ConnectionPool(connect, max_size, timeout, check_interval)
+		return _pools[key]
+
+
+def get_pools_stats() -> dict:
+	"""Возвращает метрики всех пулов процесса"""
+
+	with _pools_lock:
+		pools = dict(_pools)
+	return {key: pool.get_stats() for key, pool in pools.items()}
+
+
+def close_pools() -> None:
+	"""Закрывает свободные соединения всех пулов процесса"""
+
+	with _pools_lock:
+		pools = list(_pools.values())
+	for pool in pools:
+		pool.close_idle()
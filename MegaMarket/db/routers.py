@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+
+STICKY_COOKIE = "primary_until"
+
+_SAFE_METHODS = ("GET", "HEAD")
+
+# Разрешено ли читать с реплик в текущем запросе; вне запросов (команды, фоновые импорты) всё читается с основной базы
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+
+
+@contextlib.contextmanager
+def use_replicas(enabled: bool = True):
+	"""Разрешает (или запрещает) чтение с реплик внутри блока"""
+
+	token = _replica_reads.set(enabled)
+	try:
+		yield
+	finally:
+		_replica_reads.reset(token)
+
+
+def use_primary():
+	"""Направляет все запросы внутри блока на основную базу данных"""
+
+	return use_replicas(False)
+
+
+def replica_reads(view):
+	"""Помечает представление, которое не изменяет данные, хотя и вызывается не методом GET"""
+
+	view.replica_reads = True
+	return view
+
+
+class ReplicaRouter:
+	"""Направляет чтение на случайную реплику из DATABASE_REPLICAS, если оно разрешено, а запись на основную базу"""
+
+	def db_for_read(self, model, **hints):
+		if not settings.DATABASE_REPLICAS or not _replica_reads.get():
+			return DEFAULT_DB_ALIAS
+		# Внутри транзакции нужно видеть собственные незафиксированные изменения
+		if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+			return DEFAULT_DB_ALIAS
+		return random.choice(settings.DATABASE_REPLICAS)
+
+	def db_for_write(self, model, **hints):
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# Реплики содержат те же данные, что и основная база
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		return db == DEFAULT_DB_ALIAS
+
+
+def _is_sticky(request) -> bool:
+	"""Клиент недавно изменял данные, и реплики могут ещё не содержать его изменений"""
+
+	try:
+		return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+	except ValueError:
+		return False
+
+
+def _is_read(request) -> bool:
+	if request.method in _SAFE_METHODS:
+		return True
+	try:
+		return getattr(resolve(request.path_info).func, "replica_reads", False)
+	except Resolver404:
+		return False
+
+
+def _iter_with_replicas(content):
+	# Потоковый ответ читает базу данных уже после выхода из middleware
+	with use_replicas():
+		yield from content
+
+
+def _finish_response(response: HttpResponse, read: bool, replicas: bool) -> HttpResponse:
+	if replicas and response.streaming:
+		response.streaming_content = _iter_with_replicas(response.streaming_content)
+	if not read and response.status_code < 400:
+		sticky_seconds = settings.DB_REPLICA_STICKY_SECONDS
+		response.set_cookie(STICKY_COOKIE, f"{time.time() + sticky_seconds:.3f}", max_age=sticky_seconds)
+	return response
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+	"""Читает с реплик при запросах на чтение. После успешного изменения данных клиент получает cookie,
+	и в течение DB_REPLICA_STICKY_SECONDS его запросы идут на основную базу, чтобы он видел свои изменения"""
+
+	if asyncio.iscoroutinefunction(get_response):
+		async def middleware(request):
+			if not settings.DATABASE_REPLICAS:
+				return await get_response(request)
+			read = _is_read(request)
+			replicas = read and not _is_sticky(request)
+			with use_replicas(replicas):
+				response = await get_response(request)
+			return _finish_response(response, read, replicas)
+	else:
+		def middleware(request):
+			if not settings.DATABASE_REPLICAS:
+				return get_response(request)
+			read = _is_read(request)
+			replicas = read and not _is_sticky(request)
+			with use_replicas(replicas):
+				response = get_response(request)
+			return _finish_response(response, read, replicas)
+
+	return middleware
@@ -49,6 +49,7 @@ MIDDLEWARE = [
 	'django.middleware.common.CommonMiddleware',
 	'django.contrib.auth.middleware.AuthenticationMiddleware',
 	'django.contrib.messages.middleware.MessageMiddleware',
+	'MegaMarket.db.routers.replica_middleware',
 ]
 
 ROOT_URLCONF = 'MegaMarket.urls'
@@ -85,6 +86,40 @@ DATABASES = {
 	}
 }
 
+# DB_REPLICA_HOSTS is a comma-separated list of read replicas (host or host:port) with the same name and credentials
+# as the default database. Read requests (GET and the batch POST /nodes) are served from a random replica, while
+# imports, deletes and reads inside transactions use the default database. After a successful write, the client gets
+# a cookie that keeps its requests on the default database for DB_REPLICA_STICKY_SECONDS, so it reads its own writes.
+# Under tests the replicas are mirrors of the default database.
+
+DATABASE_REPLICAS = []
+
+for index, replica_host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+	replica_host, _, replica_port = replica_host.strip().partition(':')
+	DATABASE_REPLICAS.append(f'replica_{index}')
+	DATABASES[f'replica_{index}'] = {
+		**DATABASES['default'],
+		'HOST': replica_host,
+		'PORT': replica_port or DATABASES['default']['PORT'],
+		'TEST': {'MIRROR': 'default'},
+	}
+
+DATABASE_ROUTERS = ['MegaMarket.db.routers.ReplicaRouter']
+
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+
+# With DB_ENGINE=MegaMarket.db.postgresql_pool, every worker process takes connections from an in-process pool of at
+# most DB_POOL_MAX_SIZE connections instead of opening one per request. This covers both sync views and the threads
+# used by async views. A request waits up to DB_POOL_TIMEOUT seconds for a free connection. A connection that stayed
+# idle for more than DB_POOL_CHECK_INTERVAL seconds is checked with SELECT 1 before reuse. GET /metrics/db-pool
+# returns the pool metrics of the process that served it.
+
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+DB_POOL_CHECK_INTERVAL = float(os.getenv('DB_POOL_CHECK_INTERVAL', 30))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -116,6 +151,91 @@ USE_TZ = False
 
 DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
 
+# Shop unit import
+# Maximum number of rows written by a single bulk INSERT/UPDATE statement.
+
+BULK_BATCH_SIZE = 1000
+
+# Imports with a larger body are parsed from the request stream and saved in chunks of IMPORT_CHUNK_SIZE items.
+# The body is spooled to a temporary file, kept in memory up to IMPORT_SPOOL_MAX_SIZE bytes. An import with a JSON
+# value (one item or field) longer than IMPORT_MAX_VALUE_SIZE characters fails without reading the rest of the body.
+
+IMPORT_STREAMING_THRESHOLD = 10 * 1024 * 1024
+
+IMPORT_CHUNK_SIZE = 1000
+
+IMPORT_SPOOL_MAX_SIZE = 10 * 1024 * 1024
+
+IMPORT_MAX_VALUE_SIZE = 1024 * 1024
+
+# Transactions that fail with a deadlock or a serialization failure are retried up to IMPORT_RETRY_ATTEMPTS times,
+# waiting IMPORT_RETRY_DELAY seconds before the first retry and twice as long before each next one.
+
+IMPORT_RETRY_ATTEMPTS = 5
+
+IMPORT_RETRY_DELAY = 0.05
+
+# With IMPORT_GROUP_COMMIT_WINDOW greater than zero, imports arriving within this many seconds are applied in one
+# transaction of at most IMPORT_GROUP_COMMIT_MAX_SIZE imports. Requests are only combined inside one process,
+# so the application server has to run threaded workers (for example, gunicorn --threads).
+
+IMPORT_GROUP_COMMIT_WINDOW = float(os.getenv('IMPORT_GROUP_COMMIT_WINDOW', 0))
+
+IMPORT_GROUP_COMMIT_MAX_SIZE = 100
+
+# With CATALOG_CACHE_ENABLED, every worker process serves /nodes from an in-memory copy of the catalog tree.
+# Imports and deletes bump a catalog version after commit, and the copy is reloaded when the version changes.
+# GET /metrics/catalog-tree returns the hit, miss and reload counters of the process that served it.
+
+CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', 'false').lower() == 'true'
+
+# With NODES_CACHE_ENABLED, encoded /nodes responses are kept in the NODES_CACHE cache together with a version
+# of the subtree, which is sent as ETag. Imports and deletes reset the versions of changed units and their
+# ancestors after commit. With several worker processes the cache has to be shared (for example, memcached),
+# otherwise a process keeps serving responses invalidated in another one.
+
+CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+	},
+	'nodes': {
+		'BACKEND': os.getenv('NODES_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+		'LOCATION': os.getenv('NODES_CACHE_LOCATION', 'nodes'),
+		'TIMEOUT': None,
+	},
+}
+
+NODES_CACHE = 'nodes'
+
+NODES_CACHE_ENABLED = os.getenv('NODES_CACHE_ENABLED', 'false').lower() == 'true'
+
+# With ASYNC_VIEWS, the URLs are served by the async views from shop_unit.async_views, which run database work in a
+# thread pool instead of the single thread Django uses for sync views under ASGI. Enable it only for the ASGI
+# deployment (for example, gunicorn -k uvicorn.workers.UvicornWorker MegaMarket.asgi:application).
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Encoder of JSON responses: orjson, stdlib, or auto to use orjson when it is installed and the stdlib json otherwise.
+
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto')
+
+# Maximum number of ids in one batch POST /nodes request.
+
+NODES_BATCH_MAX_SIZE = 100
+
+# Shop unit history is partitioned by month of date (PostgreSQL only). The compact_statistic command creates
+# partitions up to STATISTIC_PARTITIONS_AHEAD months ahead, deletes history older than STATISTIC_RETENTION_DAYS
+# (0 keeps it forever) and rolls history older than STATISTIC_ROLLUP_AFTER_DAYS (0 disables it) into one row
+# per unit and STATISTIC_ROLLUP_INTERVAL (for example, 1h or 1d).
+
+STATISTIC_PARTITIONS_AHEAD = 3
+
+STATISTIC_RETENTION_DAYS = int(os.getenv('STATISTIC_RETENTION_DAYS', 0))
+
+STATISTIC_ROLLUP_AFTER_DAYS = int(os.getenv('STATISTIC_ROLLUP_AFTER_DAYS', 30))
+
+STATISTIC_ROLLUP_INTERVAL = os.getenv('STATISTIC_ROLLUP_INTERVAL', '1h')
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 
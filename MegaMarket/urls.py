@@ -1,5 +1,9 @@
 from django.urls import path, include
 
+from MegaMarket import views
+
 urlpatterns = [
 	path('', include('shop_unit.urls')),
+	path('metrics/db-pool', views.db_pool_stats, name='db_pool_stats'),
+	path('metrics/catalog-tree', views.catalog_tree_stats, name='catalog_tree_stats'),
 ]
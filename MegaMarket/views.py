@@ -0,0 +1,21 @@
+import os
+
+from django.views.decorators.http import require_http_methods
+
+from MegaMarket.db.postgresql_pool import pool
+from shop_unit import cache
+from shop_unit.responses import JsonResponse
+
+
+@require_http_methods(["GET"])
+def db_pool_stats(request):
+	"""Возвращает метрики пулов соединений процесса, обработавшего запрос"""
+
+	return JsonResponse({"pid": os.getpid(), "pools": pool.get_pools_stats()})
+
+
+@require_http_methods(["GET"])
+def catalog_tree_stats(request):
+	"""Возвращает счётчики дерева каталога в памяти процесса, обработавшего запрос"""
+
+	return JsonResponse({"pid": os.getpid(), **cache.get_catalog_tree_stats()})
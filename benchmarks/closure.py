@@ -0,0 +1,97 @@
+"""Сравнивает чтение поддерева через рекурсивный CTE (bfs_by_uuid) и через таблицу замыкания (subtree_by_uuid)
+
+Дерево строится во временной тестовой базе данных, рабочая база не изменяется.
+Запуск: python benchmarks/closure.py --sizes 10000 100000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "MegaMarket.settings")
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+
+from shop_unit import models
+
+
+def subtree_by_uuid(uuid: str):
+	"""Поддерево через таблицу замыкания в виде объектов ShopUnit"""
+
+	return models.ShopUnit.objects.raw("""
+		SELECT su.* FROM shop_unit_shopunitclosure AS c
+		INNER JOIN shop_unit_shopunit AS su ON su.uuid = c.descendant_id
+		WHERE c.ancestor_id = %s ORDER BY c.depth;
+	""", params=(uuid.replace("-", ""),))
+
+
+def build_tree(size: int, branching: int) -> list:
+	"""Создаёт дерево из size объектов: категории с branching потомками, в листьях товары. Возвращает уровни дерева"""
+
+	date = datetime.datetime(2022, 2, 1)
+	levels = [[models.ShopUnit(uuid=uuid4(), name="Root", date=date, unit_type=models.ShopUnitType.CATEGORY)]]
+	count = 1
+
+	while count < size:
+		level = []
+		for parent in levels[-1]:
+			for _ in range(min(branching, size - count - len(level))):
+				level.append(models.ShopUnit(
+					uuid=uuid4(), name="Unit", date=date, parent=parent, unit_type=models.ShopUnitType.CATEGORY
+				))
+		count += len(level)
+		levels.append(level)
+
+	for unit in levels[-1]:
+		unit.unit_type, unit.price = models.ShopUnitType.OFFER, 100
+
+	for level in levels:
+		models.ShopUnit.objects.bulk_create(level, batch_size=settings.BULK_BATCH_SIZE)
+	models.ShopUnitClosure.custom_objects.rebuild()
+	with connection.cursor() as cursor:
+		cursor.execute("ANALYZE shop_unit_shopunit; ANALYZE shop_unit_shopunitclosure;")
+	return levels
+
+
+def measure(func, uuid: str, repeat: int) -> float:
+	start = time.perf_counter()
+	for _ in range(repeat):
+		len(list(func(uuid)))
+	return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10 ** 4, 10 ** 5, 10 ** 6])
+	parser.add_argument("--branching", type=int, default=10)
+	parser.add_argument("--repeat", type=int, default=5)
+	args = parser.parse_args()
+
+	test_db = connection.creation.create_test_db(verbosity=0)
+	try:
+		print(f"{'units':>10} {'subtree':>10} {'CTE, s':>10} {'closure, s':>10}")
+		for size in args.sizes:
+			with connection.cursor() as cursor:
+				cursor.execute("TRUNCATE shop_unit_shopunitclosure, shop_unit_shopunitstatistic, shop_unit_shopunit;")
+			levels = build_tree(size, args.branching)
+			# Поддерево корня и поддерево узла на середине глубины
+			for unit in (levels[0][0], levels[len(levels) // 2][0]):
+				uuid = str(unit.uuid)
+				subtree_size = len(list(subtree_by_uuid(uuid)))
+				cte_time = measure(models.ShopUnit.custom_objects.bfs_by_uuid, uuid, args.repeat)
+				closure_time = measure(subtree_by_uuid, uuid, args.repeat)
+				print(f"{size:>10} {subtree_size:>10} {cte_time:>10.4f} {closure_time:>10.4f}")
+	finally:
+		connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == "__main__":
+	main()
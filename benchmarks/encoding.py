@@ -0,0 +1,84 @@
+"""Сравнивает кодирование больших ответов /nodes и /sales через DjangoJSONEncoder и кодировщики shop_unit.encoding
+
+Данные создаются в памяти, база данных не нужна.
+Запуск: python benchmarks/encoding.py --sizes 10000 100000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "MegaMarket.settings")
+
+import django
+
+django.setup()
+
+from django.http import JsonResponse as DjangoJsonResponse
+from django.test import override_settings
+
+from shop_unit import encoding
+from shop_unit.responses import JsonResponse
+
+
+def generate_tree(size: int, branching: int) -> dict:
+	"""Создаёт дерево ответа /nodes из size объектов: UUID и даты в виде строк, как их возвращают запросы services"""
+
+	date = "2022-02-01T12:00:00.000Z"
+	root = {"id": str(uuid4()), "name": "Root", "date": date, "parentId": None, "type": "CATEGORY", "price": 100,
+		"children": []}
+	level, count = [root], 1
+	while count < size:
+		next_level = []
+		for parent in level:
+			for _ in range(min(branching, size - count - len(next_level))):
+				unit = {"id": str(uuid4()), "name": "Категория", "date": date, "parentId": parent["id"],
+					"type": "CATEGORY", "price": 100, "children": []}
+				parent["children"].append(unit)
+				next_level.append(unit)
+		count += len(next_level)
+		level = next_level
+	for unit in level:
+		unit["type"], unit["children"] = "OFFER", None
+	return root
+
+
+def generate_sales(size: int) -> dict:
+	"""Создаёт ответ /sales из size товаров с UUID и датами в виде объектов"""
+
+	date = datetime.datetime(2022, 2, 1, 12)
+	return {"items": [
+		{"id": uuid4(), "name": "Товар", "date": date, "parentId": uuid4(), "price": 100, "type": "OFFER"}
+		for _ in range(size)
+	]}
+
+
+def measure(func, data, repeat: int) -> float:
+	start = time.perf_counter()
+	for _ in range(repeat):
+		func(data)
+	return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+	parser.add_argument("--branching", type=int, default=10)
+	parser.add_argument("--repeat", type=int, default=5)
+	args = parser.parse_args()
+
+	print(f"{'payload':>8} {'units':>8} {'django, s':>10} " + " ".join(f"{name + ', s':>10}" for name in encoding.ENCODERS))
+	for size in args.sizes:
+		for payload, data in (("nodes", generate_tree(size, args.branching)), ("sales", generate_sales(size))):
+			times = [measure(DjangoJsonResponse, data, args.repeat)]
+			for name in encoding.ENCODERS:
+				with override_settings(JSON_ENCODER=name):
+					times.append(measure(JsonResponse, data, args.repeat))
+			print(f"{payload:>8} {size:>8} " + " ".join(f"{value:>10.3f}" for value in times))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,79 @@
+"""Сравнивает сборку ответа /nodes из объектов ShopUnit (прежний путь) и из строк курсора (get_shop_unit_by_uuid)
+
+Дерево строится во временной тестовой базе данных, рабочая база не изменяется.
+Запуск: python benchmarks/nodes.py --sizes 10000 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from closure import build_tree, subtree_by_uuid
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+
+from shop_unit import models, services
+
+
+def get_shop_unit_by_uuid_models(uuid: str) -> dict:
+	"""Прежний путь: объекты ShopUnit из raw(), родитель через unit.parent и дата через strftime"""
+
+	parent_links = {}
+	head_unit = {}
+
+	for unit in subtree_by_uuid(uuid):
+		curr_unit = {
+			"id": unit.uuid,
+			"name": unit.name,
+			"date": unit.date.strftime(settings.DATETIME_FORMAT)[:-3] + "Z",
+			"parentId": unit.parent.uuid if unit.parent is not None else None,
+			"type": models.ShopUnitType[unit.unit_type],
+			"price": unit.price,
+			"children": None
+		}
+
+		if curr_unit["type"] == models.ShopUnitType.CATEGORY:
+			curr_unit["children"] = []
+			parent_links[curr_unit["id"]] = curr_unit["children"]
+
+		if not head_unit:
+			head_unit = curr_unit
+		else:
+			parent_links[curr_unit["parentId"]].append(curr_unit)
+	return head_unit
+
+
+def measure(func, uuid: str, repeat: int) -> float:
+	start = time.perf_counter()
+	for _ in range(repeat):
+		JsonResponse(func(uuid))
+	return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+	parser.add_argument("--branching", type=int, default=10)
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args()
+
+	test_db = connection.creation.create_test_db(verbosity=0)
+	try:
+		print(f"{'units':>10} {'models, s':>10} {'rows, s':>10}")
+		for size in args.sizes:
+			with connection.cursor() as cursor:
+				cursor.execute("TRUNCATE shop_unit_shopunitclosure, shop_unit_shopunitstatistic, shop_unit_shopunit;")
+			uuid = str(build_tree(size, args.branching)[0][0].uuid)
+			models_time = measure(get_shop_unit_by_uuid_models, uuid, args.repeat)
+			rows_time = measure(services.get_shop_unit_by_uuid, uuid, args.repeat)
+			print(f"{size:>10} {models_time:>10.3f} {rows_time:>10.3f}")
+	finally:
+		connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,80 @@
+"""Сравнивает время ответа /nodes (get_shop_unit_by_uuid) и снимка поддерева по истории (get_shop_unit_snapshot)
+
+Для каждого объекта дерева создаётся --versions записей истории, снимок берётся на середину истории.
+Дерево строится во временной тестовой базе данных, рабочая база не изменяется.
+Запуск: python benchmarks/snapshot.py --sizes 10000 50000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from closure import build_tree
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+
+from shop_unit import models, services
+
+
+def build_history(levels: list, versions: int) -> datetime.datetime:
+	"""Создаёт versions записей истории на объект с интервалом в час и возвращает дату середины истории"""
+
+	date = datetime.datetime(2022, 2, 1)
+	for version in range(versions):
+		models.ShopUnitStatistic.objects.bulk_create(
+			(
+				models.ShopUnitStatistic(
+					shop_unit=unit,
+					name=unit.name,
+					date=date + datetime.timedelta(hours=version),
+					parent_id=unit.parent_id,
+					unit_type=unit.unit_type,
+					price=unit.price
+				)
+				for level in levels for unit in level
+			),
+			batch_size=settings.BULK_BATCH_SIZE
+		)
+	with connection.cursor() as cursor:
+		cursor.execute("ANALYZE shop_unit_shopunitstatistic;")
+	return date + datetime.timedelta(hours=versions // 2)
+
+
+def measure(func, repeat: int) -> float:
+	start = time.perf_counter()
+	for _ in range(repeat):
+		JsonResponse(func())
+	return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+	parser.add_argument("--branching", type=int, default=10)
+	parser.add_argument("--versions", type=int, default=20)
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args()
+
+	test_db = connection.creation.create_test_db(verbosity=0)
+	try:
+		print(f"{'units':>10} {'history':>10} {'nodes, s':>10} {'snapshot, s':>12}")
+		for size in args.sizes:
+			with connection.cursor() as cursor:
+				cursor.execute("TRUNCATE shop_unit_shopunitclosure, shop_unit_shopunitstatistic, shop_unit_shopunit;")
+			levels = build_tree(size, args.branching)
+			date = build_history(levels, args.versions).isoformat()
+			uuid = str(levels[0][0].uuid)
+			nodes_time = measure(lambda: services.get_shop_unit_by_uuid(uuid), args.repeat)
+			snapshot_time = measure(lambda: services.get_shop_unit_snapshot(uuid, date), args.repeat)
+			print(f"{size:>10} {size * args.versions:>10} {nodes_time:>10.3f} {snapshot_time:>12.3f}")
+	finally:
+		connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == "__main__":
+	main()
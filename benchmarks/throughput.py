@@ -0,0 +1,108 @@
+"""Измеряет пропускную способность чтения (/nodes и /sales) запущенного сервера, пока идут медленные импорты
+
+Работает только через HTTP API, поэтому подходит для сравнения развертываний WSGI и ASGI на одной базе данных:
+  gunicorn -w 2 MegaMarket.wsgi:application --bind 0:8000
+  ASYNC_VIEWS=true gunicorn -w 2 -k uvicorn.workers.UvicornWorker MegaMarket.asgi:application --bind 0:8001
+  python benchmarks/throughput.py --url http://localhost:8000
+  python benchmarks/throughput.py --url http://localhost:8001
+Скрипт добавляет в каталог дерево из --size объектов и удаляет его в конце.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+DATE = "2022-02-01T12:00:00.000Z"
+
+
+def request(url: str, method: str = "GET", data: dict = None) -> int:
+	body = json.dumps(data).encode() if data is not None else None
+	req = urllib.request.Request(url, data=body, method=method, headers={"Content-Type": "application/json"})
+	try:
+		with urllib.request.urlopen(req, timeout=120) as response:
+			response.read()
+			return response.status
+	except urllib.error.HTTPError as e:
+		return e.code
+
+
+def build_catalog(url: str, size: int, branching: int) -> tuple[str, list[str]]:
+	"""Импортирует дерево категорий с товарами в листьях, возвращает UUID корня и UUID категорий"""
+
+	root_id = str(uuid4())
+	items = [{"id": root_id, "name": "Root", "type": "CATEGORY"}]
+	categories = [root_id]
+	level = [root_id]
+	while len(items) < size:
+		next_level = []
+		for parent_id in level:
+			for _ in range(branching):
+				if len(items) >= size:
+					break
+				unit_id = str(uuid4())
+				items.append({"id": unit_id, "parentId": parent_id, "name": "Category", "type": "CATEGORY"})
+				next_level.append(unit_id)
+		categories.extend(next_level)
+		level = next_level
+	request(f"{url}/imports", "POST", {"items": items, "updateDate": DATE})
+	return root_id, categories
+
+
+def run_reads(url: str, root_id: str, stop: threading.Event, latencies: list) -> None:
+	paths = [f"/nodes/{root_id}", f"/sales?date={DATE}"]
+	count = 0
+	while not stop.is_set():
+		start = time.perf_counter()
+		status = request(url + paths[count % len(paths)])
+		if status == 200:
+			latencies.append(time.perf_counter() - start)
+		count += 1
+
+
+def run_imports(url: str, categories: list[str], size: int, stop: threading.Event, done: list) -> None:
+	while not stop.is_set():
+		items = [
+			{"id": str(uuid4()), "parentId": categories[i % len(categories)], "name": "Offer", "type": "OFFER", "price": i}
+			for i in range(size)
+		]
+		if request(f"{url}/imports", "POST", {"items": items, "updateDate": DATE}) == 200:
+			done.append(size)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--url", default="http://localhost:8000")
+	parser.add_argument("--size", type=int, default=1000, help="Размер читаемого дерева")
+	parser.add_argument("--branching", type=int, default=10)
+	parser.add_argument("--readers", type=int, default=32)
+	parser.add_argument("--importers", type=int, default=4)
+	parser.add_argument("--import-size", type=int, default=2000, help="Товаров в одном импорте")
+	parser.add_argument("--duration", type=float, default=15)
+	args = parser.parse_args()
+
+	root_id, categories = build_catalog(args.url, args.size, args.branching)
+	stop = threading.Event()
+	latencies, imports_done = [], []
+	try:
+		with ThreadPoolExecutor(args.readers + args.importers) as executor:
+			for _ in range(args.importers):
+				executor.submit(run_imports, args.url, categories, args.import_size, stop, imports_done)
+			for _ in range(args.readers):
+				executor.submit(run_reads, args.url, root_id, stop, latencies)
+			time.sleep(args.duration)
+			stop.set()
+	finally:
+		request(f"{args.url}/delete/{root_id}", "DELETE")
+
+	latencies.sort()
+	percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+	print(f"reads/s: {len(latencies) / args.duration:.1f}, p50: {percentile(0.5):.1f} ms, p99: {percentile(0.99):.1f} ms")
+	print(f"imports: {len(imports_done)} ({sum(imports_done)} offers)")
+
+
+if __name__ == "__main__":
+	main()
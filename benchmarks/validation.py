@@ -0,0 +1,52 @@
+"""Сравнивает время проверки запроса импорта через pydantic и через быстрый путь services
+
+Запуск: python benchmarks/validation.py --sizes 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "MegaMarket.settings")
+
+import django
+
+django.setup()
+
+from shop_unit import services
+
+
+def generate_request(size: int) -> bytes:
+	"""Создаёт запрос импорта из одной категории и size - 1 товаров"""
+
+	category = str(uuid4())
+	items = [{"id": category, "name": "Категория", "type": "CATEGORY"}]
+	for i in range(size - 1):
+		items.append({"id": str(uuid4()), "parentId": category, "name": f"Товар {i}", "type": "OFFER", "price": i})
+	return json.dumps({"items": items, "updateDate": "2022-02-01T12:00:00.000Z"}).encode()
+
+
+def measure(func, data: bytes) -> float:
+	start = time.perf_counter()
+	func(data)
+	return time.perf_counter() - start
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+	args = parser.parse_args()
+
+	print(f"{'items':>10} {'pydantic, s':>12} {'fast path, s':>12}")
+	for size in args.sizes:
+		data = generate_request(size)
+		pydantic_time = measure(services.ShopUnitImportRequest.parse_raw, data)
+		fast_time = measure(services._parse_import_request, data)
+		print(f"{size:>10} {pydantic_time:>12.3f} {fast_time:>12.3f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,56 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+from shop_unit import views
+
+
+def database_sync_to_async(func):
+	"""Выполняет синхронную функцию, работающую с базой данных, в пуле потоков, не привязываясь к одному потоку.
+	Соединение потока закрывается до и после вызова по правилам CONN_MAX_AGE, как в начале и конце запроса WSGI"""
+
+	def wrapper(*args, **kwargs):
+		close_old_connections()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			close_old_connections()
+
+	return sync_to_async(wrapper, thread_sensitive=False)
+
+
+def _render_view(view, request, *args, **kwargs) -> HttpResponse:
+	"""Вызывает синхронное представление, дочитывая потоковый ответ в том же потоке.
+	Django 4.0 перебирает потоковый ответ в цикле событий, где обращения к базе данных запрещены"""
+
+	response = view(request, *args, **kwargs)
+	if response.streaming:
+		content = b"".join(response.streaming_content)
+		streaming_response = response
+		response = HttpResponse(content, status=streaming_response.status_code)
+		for header, value in streaming_response.items():
+			response[header] = value
+	return response
+
+
+def async_view(view):
+	"""Асинхронная версия представления: запросы к базе данных выполняются в отдельных потоках,
+	поэтому медленный импорт не блокирует чтение"""
+
+	@functools.wraps(view)
+	async def wrapper(request, *args, **kwargs):
+		return await database_sync_to_async(_render_view)(view, request, *args, **kwargs)
+
+	return wrapper
+
+
+imports = async_view(views.imports)
+import_job = async_view(views.import_job)
+delete = async_view(views.delete)
+nodes = async_view(views.nodes)
+nodes_batch = async_view(views.nodes_batch)
+sales = async_view(views.sales)
+node_snapshot = async_view(views.node_snapshot)
+node_statistic = async_view(views.node_statistic)
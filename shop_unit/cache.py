@@ -0,0 +1,167 @@
+import threading
+from typing import Iterable, Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from shop_unit import models
+
+_lock = threading.Lock()
+# Попадания считаются под отдельной блокировкой, чтобы читатели не ждали перезагрузки дерева
+_stats_lock = threading.Lock()
+_tree = None
+_stats = {"hits": 0, "misses": 0, "reloads": 0}
+
+
+class CatalogTree:
+	"""Снимок каталога в памяти процесса: узлы с ценами и списки дочерних узлов"""
+
+	def __init__(self, version: int):
+		self.version = version
+		self.nodes = {}
+		self.children = {}
+
+	@classmethod
+	def load(cls, version: int) -> "CatalogTree":
+		"""Загружает все объекты ShopUnit одним запросом"""
+
+		return cls.from_rows(version, models.ShopUnit.custom_objects.serialized_all())
+
+	@classmethod
+	def from_rows(cls, version: int, rows: Iterable[tuple]) -> "CatalogTree":
+		"""Строит дерево из сериализованных строк ShopUnit"""
+
+		tree = cls(version)
+		for uuid, name, date, parent_id, unit_type, price in rows:
+			tree.nodes[uuid] = {
+				"id": uuid,
+				"name": name,
+				"date": date,
+				"parentId": parent_id,
+				"type": unit_type,
+				"price": price,
+			}
+			if unit_type == models.ShopUnitType.CATEGORY:
+				tree.children.setdefault(uuid, [])
+			if parent_id is not None:
+				tree.children.setdefault(parent_id, []).append(uuid)
+		return tree
+
+	def get_subtree(self, uuid: str) -> dict:
+		"""Возвращает объект с указанным UUID и его дочерние объекты в формате ответа /nodes, либо {}, если объекта нет"""
+
+		if uuid not in self.nodes:
+			return {}
+
+		head_unit = self._get_node(uuid)
+		stack = [head_unit]
+		while stack:
+			curr_unit = stack.pop()
+			if curr_unit["children"] is not None:
+				for child_uuid in self.children[curr_unit["id"]]:
+					child = self._get_node(child_uuid)
+					curr_unit["children"].append(child)
+					stack.append(child)
+		return head_unit
+
+	def _get_node(self, uuid: str) -> dict:
+		node = self.nodes[uuid]
+		return {**node, "children": [] if node["type"] == models.ShopUnitType.CATEGORY else None}
+
+
+def get_catalog_version() -> int:
+	"""Возвращает текущую версию каталога"""
+
+	with connection.cursor() as cursor:
+		cursor.execute("SELECT last_value, is_called FROM shop_unit_catalog_version;")
+		last_value, is_called = cursor.fetchone()
+	return last_value if is_called else 0
+
+
+def bump_catalog_version() -> None:
+	"""Увеличивает версию каталога, вызывается после фиксации транзакции, изменившей каталог"""
+
+	with connection.cursor() as cursor:
+		cursor.execute("SELECT nextval('shop_unit_catalog_version');")
+
+
+def get_catalog_tree() -> CatalogTree:
+	"""Возвращает дерево каталога текущей версии, перезагружая его, если каталог изменился"""
+
+	global _tree
+
+	version = get_catalog_version()
+	tree = _tree
+	if tree is not None and tree.version == version:
+		_count("hits")
+		return tree
+
+	_count("misses")
+	with _lock:
+		# Пока поток ждал блокировку, дерево мог перезагрузить другой поток
+		if _tree is None or _tree.version != version:
+			_tree = CatalogTree.load(version)
+			_count("reloads")
+		return _tree
+
+
+def get_catalog_tree_stats() -> dict:
+	"""Возвращает счётчики попаданий, промахов и перезагрузок дерева каталога"""
+
+	with _stats_lock:
+		return dict(_stats)
+
+
+def reset_catalog_tree() -> None:
+	"""Сбрасывает дерево каталога и счётчики"""
+
+	global _tree
+
+	with _lock:
+		_tree = None
+	with _stats_lock:
+		_stats.update(hits=0, misses=0, reloads=0)
+
+
+def _count(name: str) -> None:
+	with _stats_lock:
+		_stats[name] += 1
+
+
+def get_node_version(uuid: str) -> str:
+	"""Возвращает версию поддерева объекта в кэше ответов /nodes, создавая её при первом обращении"""
+
+	nodes_cache = caches[settings.NODES_CACHE]
+	key = f"nodes:version:{uuid}"
+	version = nodes_cache.get(key)
+	if version is None:
+		# add не перезапишет версию, созданную параллельным запросом
+		nodes_cache.add(key, uuid4().hex)
+		version = nodes_cache.get(key)
+	return version
+
+
+def get_node_response(uuid: str, version: str) -> Optional[bytes]:
+	"""Возвращает закодированный ответ /nodes, если он сохранён для указанной версии поддерева"""
+
+	cached = caches[settings.NODES_CACHE].get(f"nodes:response:{uuid}")
+	if cached is not None and cached[0] == version:
+		return cached[1]
+	return None
+
+
+def set_node_response(uuid: str, version: str, content: bytes) -> None:
+	"""Сохраняет закодированный ответ /nodes для указанной версии поддерева"""
+
+	caches[settings.NODES_CACHE].set(f"nodes:response:{uuid}", (version, content))
+
+
+def invalidate_nodes(uuids: Iterable[str]) -> None:
+	"""Сбрасывает версии поддеревьев и сохранённые ответы /nodes для указанных объектов"""
+
+	keys = []
+	for uuid in uuids:
+		keys.extend((f"nodes:version:{uuid}", f"nodes:response:{uuid}"))
+	caches[settings.NODES_CACHE].delete_many(keys)
@@ -0,0 +1,59 @@
+import json
+import datetime
+import functools
+from typing import Any, Callable
+from uuid import UUID
+
+from django.conf import settings
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+
+@functools.lru_cache(maxsize=1024)
+def _format_datetime(value: datetime.datetime) -> str:
+	# Даты в ответе обычно повторяются (у всех объектов одного импорта она одна), поэтому форматируются один раз
+	return value.strftime(settings.DATETIME_FORMAT)[:-3] + "Z"
+
+
+def _default(value: Any) -> Any:
+	"""Кодирует значения, которые не поддерживаются кодировщиком JSON напрямую"""
+
+	if isinstance(value, datetime.datetime):
+		return _format_datetime(value)
+	if isinstance(value, UUID):
+		return str(value)
+	raise TypeError(f"object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps_stdlib(data: Any) -> bytes:
+	return json.dumps(data, default=_default).encode()
+
+
+def _dumps_orjson(data: Any) -> bytes:
+	# UUID orjson кодирует сам, даты - в формате ответов API через _default
+	return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+ENCODERS = {"stdlib": _dumps_stdlib}
+if orjson is not None:
+	ENCODERS["orjson"] = _dumps_orjson
+
+
+def get_encoder() -> Callable[[Any], bytes]:
+	"""Возвращает кодировщик из настройки JSON_ENCODER, при значении auto - самый быстрый из установленных"""
+
+	if settings.JSON_ENCODER == "auto":
+		return ENCODERS.get("orjson", _dumps_stdlib)
+	try:
+		return ENCODERS[settings.JSON_ENCODER]
+	except KeyError:
+		raise ValueError(f"JSON encoder '{settings.JSON_ENCODER}' is not available")
+
+
+def dumps(data: Any) -> bytes:
+	"""Кодирует данные в JSON выбранным кодировщиком"""
+
+	return get_encoder()(data)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from shop_unit import services
+
+
+class Command(BaseCommand):
+	help = "Создает партиции истории ShopUnit, удаляет устаревшую историю и сворачивает старую историю по интервалам"
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--interval",
+			help="Интервал сворачивания, например 1h или 1d (по умолчанию STATISTIC_ROLLUP_INTERVAL)",
+		)
+		parser.add_argument(
+			"--rollup-after-days",
+			type=int,
+			help="Сворачивать историю старше указанного числа дней (по умолчанию STATISTIC_ROLLUP_AFTER_DAYS)",
+		)
+		parser.add_argument(
+			"--retention-days",
+			type=int,
+			help="Удалять историю старше указанного числа дней (по умолчанию STATISTIC_RETENTION_DAYS)",
+		)
+
+	def handle(self, *args, **options):
+		result = services.compact_statistic(
+			interval=options["interval"],
+			rollup_after_days=options["rollup_after_days"],
+			retention_days=options["retention_days"],
+		)
+		self.stdout.write(
+			f"Partitions created: {result['partitions_created']}, dropped: {result['partitions_dropped']}; "
+			f"rows deleted: {result['deleted']}, rolled up: {result['rolled_up']}"
+		)
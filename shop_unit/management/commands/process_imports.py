@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shop_unit import services
+
+
+class Command(BaseCommand):
+	help = "Применяет отложенные задачи импорта в порядке возрастания updateDate"
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--once",
+			action="store_true",
+			help="Применить все ожидающие задачи и завершить работу",
+		)
+		parser.add_argument(
+			"--interval",
+			type=float,
+			default=1.0,
+			help="Пауза в секундах между проверками очереди, когда задач нет",
+		)
+
+	def handle(self, *args, **options):
+		while True:
+			try:
+				job = services.process_import_job()
+			except Exception as e:
+				# Ошибка базы данных не должна останавливать обработчик: очередь проверяется снова после паузы
+				if options["once"]:
+					raise
+				self.stderr.write(f"Import jobs processing failed: {e!r}")
+				time.sleep(options["interval"])
+				close_old_connections()
+				continue
+
+			if job is not None:
+				self.stdout.write(f"Import job {job.uuid}: {job.status}")
+			elif options["once"]:
+				return
+			else:
+				time.sleep(options["interval"])
+				close_old_connections()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop_unit import models
+
+
+class Command(BaseCommand):
+	help = "Заново строит таблицу замыкания дерева ShopUnit по полю parent"
+
+	def handle(self, *args, **options):
+		with transaction.atomic():
+			models.ShopUnitClosure.custom_objects.rebuild()
+		self.stdout.write(f"Closure table rebuilt: {models.ShopUnitClosure.objects.count()} links")
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0005_rename_parentid_shopunitstatistic_parent_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopunit',
+            name='offer_count',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Количество товаров в поддереве, для товара - единица'),
+        ),
+        migrations.AddField(
+            model_name='shopunit',
+            name='offer_sum',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Сумма цен всех товаров поддерева, для товара - его цена'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                WITH RECURSIVE tree(ancestor_id, uuid, unit_type, price) AS (
+                    SELECT uuid, uuid, unit_type, price
+                    FROM shop_unit_shopunit
+                  UNION ALL
+                    SELECT t.ancestor_id, su.uuid, su.unit_type, su.price
+                    FROM shop_unit_shopunit AS su INNER JOIN tree AS t ON su.parent_id = t.uuid
+                )
+                UPDATE shop_unit_shopunit
+                SET offer_sum = aggregate.offer_sum, offer_count = aggregate.offer_count
+                FROM (
+                    SELECT ancestor_id, SUM(price) AS offer_sum, COUNT(uuid) AS offer_count
+                    FROM tree WHERE unit_type = 'OFFER'
+                    GROUP BY ancestor_id
+                ) AS aggregate
+                WHERE shop_unit_shopunit.uuid = aggregate.ancestor_id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
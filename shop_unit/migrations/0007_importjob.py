@@ -0,0 +1,30 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:13
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0006_shopunit_offer_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, verbose_name='Уникальный идентификатор задачи импорта')),
+                ('update_date', models.DateTimeField(verbose_name='Время обновления элементов импорта (поле updateDate)')),
+                ('payload', models.BinaryField(verbose_name='Тело запроса импорта')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=8, verbose_name='Статус задачи импорта')),
+                ('statistic_count', models.PositiveBigIntegerField(default=None, null=True, verbose_name='Количество записей истории, добавленных импортом')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания задачи')),
+                ('finished_at', models.DateTimeField(default=None, null=True, verbose_name='Время завершения задачи')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(fields=['status', 'update_date', 'created_at'], name='shop_unit_i_status_d90500_idx'),
+        ),
+    ]
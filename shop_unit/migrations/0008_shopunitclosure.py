@@ -0,0 +1,43 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopUnitClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='Расстояние от предка до потомка')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='shop_unit.shopunit', verbose_name='Предок (для каждого объекта есть запись, где он предок самого себя)')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='shop_unit.shopunit', verbose_name='Потомок')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='shopunitclosure',
+            index=models.Index(fields=['ancestor', 'depth'], name='shop_unit_s_ancesto_66307e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shopunitclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_closure_link'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO shop_unit_shopunitclosure (ancestor_id, descendant_id, depth)
+                WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+                    SELECT uuid, uuid, 0 FROM shop_unit_shopunit
+                  UNION ALL
+                    SELECT t.ancestor_id, su.uuid, t.depth + 1
+                    FROM shop_unit_shopunit AS su INNER JOIN tree AS t ON su.parent_id = t.descendant_id
+                ) SELECT * FROM tree;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
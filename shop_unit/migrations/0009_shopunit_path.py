@@ -0,0 +1,36 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0008_shopunitclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopunit',
+            name='path',
+            field=models.TextField(default='', verbose_name='UUID предков от корня и самого объекта в виде /uuid/.../uuid/'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                WITH RECURSIVE tree(uuid, path) AS (
+                    SELECT uuid, '/' || uuid || '/'
+                    FROM shop_unit_shopunit WHERE parent_id IS NULL
+                  UNION ALL
+                    SELECT su.uuid, t.path || su.uuid || '/'
+                    FROM shop_unit_shopunit AS su INNER JOIN tree AS t ON su.parent_id = t.uuid
+                )
+                UPDATE shop_unit_shopunit SET path = tree.path
+                FROM tree WHERE shop_unit_shopunit.uuid = tree.uuid;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='shopunit',
+            index=models.Index(fields=['path'], name='shop_unit_path_idx', opclasses=['text_pattern_ops']),
+        ),
+    ]
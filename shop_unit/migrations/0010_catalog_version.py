@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0009_shopunit_path'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE SEQUENCE shop_unit_catalog_version;",
+            reverse_sql="DROP SEQUENCE shop_unit_catalog_version;",
+        ),
+    ]
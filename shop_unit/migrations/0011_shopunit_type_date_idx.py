@@ -0,0 +1,17 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0010_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shopunit',
+            index=models.Index(fields=['unit_type', 'date', 'uuid'], name='shop_unit_type_date_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0011_shopunit_type_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shopunitstatistic',
+            index=models.Index(fields=['shop_unit', 'date'], name='shop_unit_statistic_date_idx'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+TABLE = "shop_unit_shopunitstatistic"
+
+
+def rebuild_statistic_table(schema_editor, partitioned: bool):
+    """Пересоздает таблицу истории обычной или секционированной по date, сохраняя данные, индексы и внешние ключи"""
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_old;")
+        cursor.execute(f"""
+            SELECT pg_get_indexdef(i.indexrelid)
+            FROM pg_index AS i WHERE i.indrelid = '{TABLE}_old'::regclass AND NOT i.indisprimary;
+        """)
+        indexes = [row[0].replace(f"{TABLE}_old", TABLE) for row in cursor.fetchall()]
+        cursor.execute(f"""
+            SELECT conname, pg_get_constraintdef(oid)
+            FROM pg_constraint WHERE conrelid = '{TABLE}_old'::regclass AND contype = 'f';
+        """)
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f"""
+            CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            {"PARTITION BY RANGE (date)" if partitioned else ""};
+        """)
+        if partitioned:
+            # Месячные партиции создает команда compact_statistic, до этого все записи лежат в партиции по умолчанию
+            cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT;")
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_old;")
+        cursor.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id;")
+        cursor.execute(f"DROP TABLE {TABLE}_old CASCADE;")
+
+        # Первичный ключ секционированной таблицы должен включать ключ секционирования
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY ({'id, date' if partitioned else 'id'});")
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition};")
+        for definition in indexes:
+            cursor.execute(definition)
+
+
+def partition_statistic(apps, schema_editor):
+    rebuild_statistic_table(schema_editor, partitioned=True)
+
+
+def unpartition_statistic(apps, schema_editor):
+    rebuild_statistic_table(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0012_shopunitstatistic_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopunitstatistic',
+            name='max_price',
+            field=models.PositiveBigIntegerField(default=None, null=True, verbose_name='Максимальная цена свернутых записей (пусто у исходных записей)'),
+        ),
+        migrations.AddField(
+            model_name='shopunitstatistic',
+            name='min_price',
+            field=models.PositiveBigIntegerField(default=None, null=True, verbose_name='Минимальная цена свернутых записей (пусто у исходных записей)'),
+        ),
+        migrations.AddField(
+            model_name='shopunitstatistic',
+            name='price_count',
+            field=models.PositiveBigIntegerField(default=None, null=True, verbose_name='Количество свернутых записей с ценой (пусто у исходных записей)'),
+        ),
+        migrations.AddField(
+            model_name='shopunitstatistic',
+            name='price_sum',
+            field=models.DecimalField(decimal_places=0, default=None, max_digits=40, null=True, verbose_name='Сумма цен свернутых записей (пусто у исходных записей)'),
+        ),
+        migrations.AlterField(
+            model_name='shopunitstatistic',
+            name='parent_id',
+            field=models.UUIDField(default=None, null=True, verbose_name='UUID родительской категории'),
+        ),
+        migrations.RunPython(partition_statistic, unpartition_statistic),
+    ]
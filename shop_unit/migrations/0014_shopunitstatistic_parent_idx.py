@@ -0,0 +1,17 @@
+# Generated by Django 4.0.5 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_unit', '0013_statistic_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shopunitstatistic',
+            index=models.Index(fields=['parent_id', 'date'], name='shop_unit_statistic_parent_idx'),
+        ),
+    ]
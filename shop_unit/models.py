@@ -1,4 +1,8 @@
-from django.db import models
+import re
+import uuid
+import datetime
+
+from django.db import connection, connections, models, router
 
 
 class ShopUnitType(models.TextChoices):
@@ -6,6 +10,23 @@ class ShopUnitType(models.TextChoices):
 	CATEGORY = "CATEGORY"
 
 
+class ImportJobStatus(models.TextChoices):
+	PENDING = "PENDING"
+	DONE = "DONE"
+	FAILED = "FAILED"
+
+
+# Колонки объекта ShopUnit в виде, готовом для JSON-ответа: UUID строками, дата в формате ISO 8601 с миллисекундами
+SERIALIZED_COLUMNS = """
+	su.uuid::text, su.name, to_char(su.date, 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'), su.parent_id::text, su.unit_type, su.price
+"""
+
+
+def _read_connection(model):
+	# Запросы только на чтение идут в базу данных, выбранную роутером (реплику, если она настроена)
+	return connections[router.db_for_read(model)]
+
+
 class CustomManager(models.Manager):
 	def bfs_by_uuid(self, uuid: str):
 		return super().raw("""
@@ -18,18 +39,140 @@ class CustomManager(models.Manager):
 			) SELECT * FROM tree order by lvl;
 		""", params=(uuid.replace("-", ""),))
 
-	def get_parent_price(self, uuid: str):
-		return super().raw("""
-			WITH RECURSIVE tree(uuid, parent_id, unit_type, price) AS (
-				SELECT uuid, parent_id, unit_type, price
-				FROM shop_unit_shopunit WHERE uuid = %s
+	def serialized_subtree_by_uuid(self, uuid: str) -> list[tuple]:
+		with _read_connection(self.model).cursor() as cursor:
+			cursor.execute(f"""
+				SELECT {SERIALIZED_COLUMNS}
+				FROM shop_unit_shopunitclosure AS c
+				INNER JOIN shop_unit_shopunit AS su ON su.uuid = c.descendant_id
+				WHERE c.ancestor_id = %s ORDER BY c.depth;
+			""", (uuid,))
+			return cursor.fetchall()
+
+	def serialized_subtrees_by_uuids(self, uuids: list[str]) -> list[tuple]:
+		# Полусоединение возвращает каждый объект один раз, даже если его поддерево входит в поддерево другого UUID
+		with _read_connection(self.model).cursor() as cursor:
+			cursor.execute(f"""
+				SELECT {SERIALIZED_COLUMNS}
+				FROM shop_unit_shopunit AS su
+				WHERE su.uuid IN (
+					SELECT c.descendant_id FROM shop_unit_shopunitclosure AS c WHERE c.ancestor_id = ANY(%s::uuid[])
+				);
+			""", (uuids,))
+			return cursor.fetchall()
+
+	def serialized_subtree_cursor(self, uuid: str, depth: int = None, children_offset: int = 0, children_limit: int = None):
+		# Сортировка по материализованному пути даёт обход в глубину: поддерево каждого объекта идёт сразу за ним
+		cursor = _read_connection(self.model).chunked_cursor()
+		cursor.execute(f"""
+			SELECT {SERIALIZED_COLUMNS}, tree.depth FROM (
+				SELECT %(uuid)s::uuid AS uuid, 0 AS depth
 			  UNION ALL
-				SELECT su.uuid, su.parent_id, su.unit_type, su.price
-				FROM shop_unit_shopunit AS su INNER JOIN tree AS t on su.parent_id = t.uuid
-			)
-			SELECT '1' AS uuid, SUM(price) AS price, count(uuid) AS ch_count
-			FROM tree WHERE unit_type = 'OFFER'
-		""", params=(uuid.replace("-", ""),))[0]
+				SELECT c.descendant_id, c.depth + 1 FROM shop_unit_shopunitclosure AS c
+				WHERE c.ancestor_id IN (
+					SELECT uuid FROM shop_unit_shopunit WHERE parent_id = %(uuid)s
+					ORDER BY path LIMIT %(limit)s OFFSET %(offset)s
+				) AND (%(depth)s::int IS NULL OR c.depth + 1 <= %(depth)s::int)
+			) AS tree INNER JOIN shop_unit_shopunit AS su ON su.uuid = tree.uuid
+			ORDER BY su.path;
+		""", {"uuid": uuid, "depth": depth, "offset": children_offset, "limit": children_limit})
+		return cursor
+
+	def serialized_sales_cursor(
+			self,
+			date_start: datetime.datetime,
+			date_end: datetime.datetime,
+			after: tuple = None,
+			limit: int = None
+	):
+		# Последняя колонка - дата с микросекундами для курсора следующей страницы
+		after_date, after_uuid = after or (None, None)
+		cursor = _read_connection(self.model).chunked_cursor()
+		cursor.execute(f"""
+			SELECT {SERIALIZED_COLUMNS}, to_char(su.date, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+			FROM shop_unit_shopunit AS su
+			WHERE su.unit_type = 'OFFER' AND su.date >= %(start)s AND su.date <= %(end)s
+			  AND (%(after_date)s::timestamp IS NULL OR (su.date, su.uuid) > (%(after_date)s::timestamp, %(after_uuid)s::uuid))
+			ORDER BY su.date, su.uuid
+			LIMIT %(limit)s;
+		""", {
+			"start": date_start, "end": date_end, "after_date": after_date, "after_uuid": after_uuid, "limit": limit
+		})
+		return cursor
+
+	def serialized_all(self) -> list[tuple]:
+		# Всегда с основной базы данных: копия каталога в памяти сохраняется под текущей версией каталога
+		with connection.cursor() as cursor:
+			cursor.execute(f"SELECT {SERIALIZED_COLUMNS} FROM shop_unit_shopunit AS su;")
+			return cursor.fetchall()
+
+	def delete_subtree(self, uuid) -> None:
+		# Ограничения внешних ключей отложены до конца транзакции, поэтому порядок удаления не важен
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				DELETE FROM shop_unit_shopunitstatistic WHERE shop_unit_id IN (
+					SELECT descendant_id FROM shop_unit_shopunitclosure WHERE ancestor_id = %(uuid)s
+				);
+				DELETE FROM shop_unit_shopunit WHERE uuid IN (
+					SELECT descendant_id FROM shop_unit_shopunitclosure WHERE ancestor_id = %(uuid)s
+				);
+				DELETE FROM shop_unit_shopunitclosure WHERE descendant_id IN (
+					SELECT descendant_id FROM shop_unit_shopunitclosure WHERE ancestor_id = %(uuid)s
+				);
+			""", {"uuid": str(uuid)})
+
+	def move_paths(self, old_path: str, new_path: str) -> None:
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				UPDATE shop_unit_shopunit SET path = %(new_path)s || substr(path, %(length)s + 1)
+				WHERE path LIKE %(pattern)s;
+			""", {"new_path": new_path, "length": len(old_path), "pattern": old_path + "%"})
+
+	def lock_by_uuids(self, uuids: list):
+		return super().raw("""
+			SELECT su.* FROM shop_unit_shopunit AS su
+			INNER JOIN unnest(%s::uuid[]) WITH ORDINALITY AS lock_order(uuid, idx) ON su.uuid = lock_order.uuid
+			ORDER BY lock_order.idx
+			FOR UPDATE OF su
+		""", params=([str(uuid) for uuid in uuids],))
+
+
+class ClosureManager(models.Manager):
+	def rebuild(self) -> None:
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				DELETE FROM shop_unit_shopunitclosure;
+
+				INSERT INTO shop_unit_shopunitclosure (ancestor_id, descendant_id, depth)
+				WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+					SELECT uuid, uuid, 0 FROM shop_unit_shopunit
+				  UNION ALL
+					SELECT t.ancestor_id, su.uuid, t.depth + 1
+					FROM shop_unit_shopunit AS su INNER JOIN tree AS t ON su.parent_id = t.descendant_id
+				) SELECT * FROM tree;
+			""")
+
+	def detach_subtree(self, uuid) -> None:
+		# Удаляет связи поддерева с предками объекта, оставляя связи внутри поддерева
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				DELETE FROM shop_unit_shopunitclosure
+				WHERE descendant_id IN (SELECT descendant_id FROM shop_unit_shopunitclosure WHERE ancestor_id = %(uuid)s)
+				  AND ancestor_id IN (
+					SELECT ancestor_id FROM shop_unit_shopunitclosure WHERE descendant_id = %(uuid)s AND depth > 0
+				  );
+			""", {"uuid": str(uuid)})
+
+	def attach_subtree(self, uuid, ancestor_uuids: list) -> None:
+		# Связывает отсоединённое поддерево с новыми предками, перечисленными от родителя к корню
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				INSERT INTO shop_unit_shopunitclosure (ancestor_id, descendant_id, depth)
+				SELECT a.uuid, c.descendant_id, c.depth + a.depth
+				FROM shop_unit_shopunitclosure AS c
+				CROSS JOIN unnest(%(ancestors)s::uuid[]) WITH ORDINALITY AS a(uuid, depth)
+				WHERE c.ancestor_id = %(uuid)s;
+			""", {"uuid": str(uuid), "ancestors": [str(ancestor) for ancestor in ancestor_uuids]})
 
 
 class ShopUnit(models.Model):
@@ -60,9 +203,242 @@ class ShopUnit(models.Model):
 		default=None,
 		verbose_name="Целое число, для категории - это средняя цена всех дочерних товаров",
 	)
+	offer_sum = models.PositiveBigIntegerField(
+		default=0,
+		verbose_name="Сумма цен всех товаров поддерева, для товара - его цена",
+	)
+	offer_count = models.PositiveBigIntegerField(
+		default=0,
+		verbose_name="Количество товаров в поддереве, для товара - единица",
+	)
+	path = models.TextField(
+		default="",
+		verbose_name="UUID предков от корня и самого объекта в виде /uuid/.../uuid/",
+	)
 	objects = models.Manager()
 	custom_objects = CustomManager()
 
+	class Meta:
+		indexes = [
+			models.Index(fields=["path"], name="shop_unit_path_idx", opclasses=["text_pattern_ops"]),
+			models.Index(fields=["unit_type", "date", "uuid"], name="shop_unit_type_date_idx"),
+		]
+
+
+class ShopUnitClosure(models.Model):
+	ancestor = models.ForeignKey(
+		'ShopUnit',
+		on_delete=models.CASCADE,
+		related_name="descendant_links",
+		verbose_name="Предок (для каждого объекта есть запись, где он предок самого себя)",
+	)
+	descendant = models.ForeignKey(
+		'ShopUnit',
+		on_delete=models.CASCADE,
+		related_name="ancestor_links",
+		verbose_name="Потомок",
+	)
+	depth = models.PositiveIntegerField(
+		verbose_name="Расстояние от предка до потомка",
+	)
+	objects = models.Manager()
+	custom_objects = ClosureManager()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["ancestor", "descendant"], name="unique_closure_link"),
+		]
+		indexes = [
+			models.Index(fields=["ancestor", "depth"]),
+		]
+
+
+STATISTIC_DEFAULT_PARTITION = "shop_unit_shopunitstatistic_default"
+
+STATISTIC_ROLLUP_ORIGIN = datetime.datetime(2000, 1, 1)
+
+_PARTITION_NAME = re.compile(r"shop_unit_shopunitstatistic_p(\d{4})(\d{2})")
+
+
+def _partition_name(month: datetime.date) -> str:
+	return f"shop_unit_shopunitstatistic_p{month.year:04d}{month.month:02d}"
+
+
+def _month_range(month: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+	start = datetime.datetime(month.year, month.month, 1)
+	end = datetime.datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+	return start, end
+
+
+class StatisticManager(models.Manager):
+	def serialized_statistic_cursor(self, uuid: str, date_start: datetime.datetime, date_end: datetime.datetime):
+		cursor = _read_connection(self.model).chunked_cursor()
+		cursor.execute("""
+			SELECT st.shop_unit_id::text, st.name, to_char(st.date, 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'),
+				st.parent_id::text, st.unit_type, st.price
+			FROM shop_unit_shopunitstatistic AS st
+			WHERE st.shop_unit_id = %(uuid)s AND st.date >= %(start)s AND st.date < %(end)s
+			ORDER BY st.date;
+		""", {"uuid": uuid, "start": date_start, "end": date_end})
+		return cursor
+
+	def aggregated_statistic_cursor(
+			self,
+			uuid: str,
+			date_start: datetime.datetime,
+			date_end: datetime.datetime,
+			interval: datetime.timedelta
+	):
+		# Интервалы отсчитываются от начала полуинтервала, имя, родитель и цена берутся из последней записи интервала.
+		# Свернутые записи учитываются с минимальной, максимальной ценой и суммой цен всех записей, которые они заменили
+		cursor = _read_connection(self.model).chunked_cursor()
+		cursor.execute("""
+			SELECT st.shop_unit_id::text,
+				(array_agg(st.name ORDER BY st.date DESC))[1],
+				to_char(date_bin(%(interval)s, st.date, %(start)s), 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'),
+				(array_agg(st.parent_id::text ORDER BY st.date DESC))[1],
+				(array_agg(st.unit_type ORDER BY st.date DESC))[1],
+				(array_agg(st.price ORDER BY st.date DESC))[1],
+				min(coalesce(st.min_price, st.price)), max(coalesce(st.max_price, st.price)),
+				floor(sum(coalesce(st.price_sum, st.price)) / nullif(sum(coalesce(st.price_count, (st.price IS NOT NULL)::int)), 0))::bigint
+			FROM shop_unit_shopunitstatistic AS st
+			WHERE st.shop_unit_id = %(uuid)s AND st.date >= %(start)s AND st.date < %(end)s
+			GROUP BY st.shop_unit_id, date_bin(%(interval)s, st.date, %(start)s)
+			ORDER BY date_bin(%(interval)s, st.date, %(start)s);
+		""", {"uuid": uuid, "start": date_start, "end": date_end, "interval": interval})
+		return cursor
+
+	def serialized_snapshot_by_uuid(self, uuid: str, date: datetime.datetime) -> list[tuple]:
+		# Поддерево на момент date строится от объекта вниз по родителям из истории: кандидаты в дочерние
+		# объекты ищутся по индексу (parent_id, date), а их последняя запись не позже date - по (shop_unit_id, date).
+		# Поэтому в снимок попадают и объекты, которые после date перенесены в другую категорию
+		with _read_connection(self.model).cursor() as cursor:
+			cursor.execute("""
+				WITH RECURSIVE snapshot AS (
+					SELECT * FROM (
+						SELECT s.shop_unit_id, s.name, s.date, s.parent_id, s.unit_type, s.price
+						FROM shop_unit_shopunitstatistic AS s
+						WHERE s.shop_unit_id = %(uuid)s AND s.date <= %(date)s
+						ORDER BY s.date DESC, s.id DESC LIMIT 1
+					) AS head
+				  -- UNION вместо UNION ALL: несогласованная история не зациклит обход
+				  UNION
+					SELECT st.shop_unit_id, st.name, st.date, st.parent_id, st.unit_type, st.price
+					FROM snapshot AS p
+					CROSS JOIN LATERAL (
+						SELECT DISTINCT s.shop_unit_id FROM shop_unit_shopunitstatistic AS s
+						WHERE s.parent_id = p.shop_unit_id AND s.date <= %(date)s
+					) AS child
+					CROSS JOIN LATERAL (
+						SELECT * FROM shop_unit_shopunitstatistic AS s
+						WHERE s.shop_unit_id = child.shop_unit_id AND s.date <= %(date)s
+						ORDER BY s.date DESC, s.id DESC LIMIT 1
+					) AS st
+					WHERE p.unit_type = 'CATEGORY' AND st.parent_id = p.shop_unit_id
+				)
+				SELECT shop_unit_id::text, name, to_char(date, 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'),
+					parent_id::text, unit_type, price
+				FROM snapshot;
+			""", {"uuid": uuid, "date": date})
+			return cursor.fetchall()
+
+	def rollup_before(self, date: datetime.datetime, interval: datetime.timedelta) -> int:
+		# Граница выравнивается по интервалу, чтобы не разрезать интервал на свернутую и исходную части.
+		# Интервалы с одной записью не переписываются
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				WITH buckets AS (
+					SELECT shop_unit_id, date_bin(%(interval)s, date, %(origin)s) AS bucket
+					FROM shop_unit_shopunitstatistic
+					WHERE date < date_bin(%(interval)s, %(date)s, %(origin)s)
+					GROUP BY 1, 2 HAVING count(*) > 1
+				), compacted AS (
+					DELETE FROM shop_unit_shopunitstatistic AS st USING buckets AS b
+					WHERE st.date < date_bin(%(interval)s, %(date)s, %(origin)s) AND st.shop_unit_id = b.shop_unit_id
+					  AND date_bin(%(interval)s, st.date, %(origin)s) = b.bucket
+					RETURNING st.*
+				)
+				INSERT INTO shop_unit_shopunitstatistic (
+					shop_unit_id, name, date, parent_id, unit_type, price, min_price, max_price, price_sum, price_count
+				)
+				SELECT shop_unit_id,
+					(array_agg(name ORDER BY date DESC))[1],
+					max(date),
+					(array_agg(parent_id ORDER BY date DESC))[1],
+					(array_agg(unit_type ORDER BY date DESC))[1],
+					(array_agg(price ORDER BY date DESC))[1],
+					min(coalesce(min_price, price)),
+					max(coalesce(max_price, price)),
+					coalesce(sum(coalesce(price_sum, price)), 0),
+					sum(coalesce(price_count, (price IS NOT NULL)::int))
+				FROM compacted
+				GROUP BY shop_unit_id, date_bin(%(interval)s, date, %(origin)s);
+			""", {"date": date, "interval": interval, "origin": STATISTIC_ROLLUP_ORIGIN})
+			return cursor.rowcount
+
+	def delete_before(self, date: datetime.datetime) -> int:
+		with connection.cursor() as cursor:
+			cursor.execute("DELETE FROM shop_unit_shopunitstatistic WHERE date < %s;", [date])
+			return cursor.rowcount
+
+	def is_partitioned(self) -> bool:
+		if connection.vendor != "postgresql":
+			return False
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				SELECT EXISTS (
+					SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'shop_unit_shopunitstatistic'::regclass
+				);
+			""")
+			return cursor.fetchone()[0]
+
+	def get_partition_months(self) -> list[datetime.date]:
+		with connection.cursor() as cursor:
+			cursor.execute("""
+				SELECT c.relname
+				FROM pg_inherits AS i INNER JOIN pg_class AS c ON c.oid = i.inhrelid
+				WHERE i.inhparent = 'shop_unit_shopunitstatistic'::regclass;
+			""")
+			names = [row[0] for row in cursor.fetchall()]
+		months = []
+		for name in names:
+			match = _PARTITION_NAME.fullmatch(name)
+			if match is not None:
+				months.append(datetime.date(int(match.group(1)), int(match.group(2)), 1))
+		return sorted(months)
+
+	def get_default_partition_months(self) -> list[datetime.date]:
+		with connection.cursor() as cursor:
+			cursor.execute(f"""
+				SELECT DISTINCT date_trunc('month', date)::date FROM {STATISTIC_DEFAULT_PARTITION} ORDER BY 1;
+			""")
+			return [row[0] for row in cursor.fetchall()]
+
+	def create_partition(self, month: datetime.date) -> None:
+		# Записи этого месяца, попавшие в партицию по умолчанию, переносятся в новую партицию
+		start, end = _month_range(month)
+		with connection.cursor() as cursor:
+			cursor.execute(f"""
+				ALTER TABLE shop_unit_shopunitstatistic DETACH PARTITION {STATISTIC_DEFAULT_PARTITION};
+				CREATE TABLE {_partition_name(month)} PARTITION OF shop_unit_shopunitstatistic
+					FOR VALUES FROM (%(start)s) TO (%(end)s);
+				WITH moved AS (
+					DELETE FROM {STATISTIC_DEFAULT_PARTITION} WHERE date >= %(start)s AND date < %(end)s RETURNING *
+				)
+				INSERT INTO shop_unit_shopunitstatistic SELECT * FROM moved;
+				ALTER TABLE shop_unit_shopunitstatistic ATTACH PARTITION {STATISTIC_DEFAULT_PARTITION} DEFAULT;
+			""", {"start": start, "end": end})
+
+	def drop_partitions_before(self, date: datetime.datetime) -> int:
+		# Удаляются только партиции, целиком лежащие до date
+		months = [month for month in self.get_partition_months() if _month_range(month)[1] <= date]
+		with connection.cursor() as cursor:
+			# Партицию с отложенными в текущей транзакции проверками внешних ключей удалить нельзя
+			cursor.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+			for month in months:
+				cursor.execute(f"DROP TABLE {_partition_name(month)};")
+		return len(months)
+
 
 class ShopUnitStatistic(models.Model):
 	shop_unit = models.ForeignKey(
@@ -79,7 +455,6 @@ class ShopUnitStatistic(models.Model):
 	parent_id = models.UUIDField(
 		null=True,
 		default=None,
-		db_index=True,
 		verbose_name="UUID родительской категории",
 	)
 	unit_type = models.CharField(
@@ -92,3 +467,72 @@ class ShopUnitStatistic(models.Model):
 		default=None,
 		verbose_name="Целое число, для категории - это средняя цена всех дочерних товаров",
 	)
+	min_price = models.PositiveBigIntegerField(
+		null=True,
+		default=None,
+		verbose_name="Минимальная цена свернутых записей (пусто у исходных записей)",
+	)
+	max_price = models.PositiveBigIntegerField(
+		null=True,
+		default=None,
+		verbose_name="Максимальная цена свернутых записей (пусто у исходных записей)",
+	)
+	price_sum = models.DecimalField(
+		max_digits=40,
+		decimal_places=0,
+		null=True,
+		default=None,
+		verbose_name="Сумма цен свернутых записей (пусто у исходных записей)",
+	)
+	price_count = models.PositiveBigIntegerField(
+		null=True,
+		default=None,
+		verbose_name="Количество свернутых записей с ценой (пусто у исходных записей)",
+	)
+	objects = models.Manager()
+	custom_objects = StatisticManager()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=["shop_unit", "date"], name="shop_unit_statistic_date_idx"),
+			models.Index(fields=["parent_id", "date"], name="shop_unit_statistic_parent_idx"),
+		]
+
+
+class ImportJob(models.Model):
+	uuid = models.UUIDField(
+		primary_key=True,
+		default=uuid.uuid4,
+		verbose_name="Уникальный идентификатор задачи импорта",
+	)
+	update_date = models.DateTimeField(
+		verbose_name="Время обновления элементов импорта (поле updateDate)",
+	)
+	payload = models.BinaryField(
+		verbose_name="Тело запроса импорта",
+	)
+	status = models.CharField(
+		max_length=8,
+		choices=ImportJobStatus.choices,
+		default=ImportJobStatus.PENDING,
+		verbose_name="Статус задачи импорта",
+	)
+	statistic_count = models.PositiveBigIntegerField(
+		null=True,
+		default=None,
+		verbose_name="Количество записей истории, добавленных импортом",
+	)
+	created_at = models.DateTimeField(
+		auto_now_add=True,
+		verbose_name="Время создания задачи",
+	)
+	finished_at = models.DateTimeField(
+		null=True,
+		default=None,
+		verbose_name="Время завершения задачи",
+	)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=["status", "update_date", "created_at"]),
+		]
@@ -0,0 +1,190 @@
+import codecs
+import json
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Iterator, Optional, TextIO
+
+from django.conf import settings
+
+_decoder = json.JSONDecoder()
+
+# Длина хвоста буфера, в котором может оборваться токен (\uXXX, fals, 1.5e-) и ошибка разбора ещё может исчезнуть
+_MAX_PARTIAL_TOKEN = 6
+
+
+class JsonStreamReader:
+	"""Последовательно разбирает JSON-документ из текстового потока, держа в памяти только небольшой буфер"""
+
+	def __init__(self, stream: TextIO, buffer_size: int = 64 * 1024, max_value_size: Optional[int] = None):
+		self.stream = stream
+		self.buffer_size = buffer_size
+		self.max_value_size = max_value_size or settings.IMPORT_MAX_VALUE_SIZE
+		self.buffer = ""
+		self.pos = 0
+		self.eof = False
+
+	def read_value(self) -> Any:
+		"""Читает очередное JSON-значение"""
+
+		self._skip_whitespace()
+		while True:
+			try:
+				value, end = _decoder.raw_decode(self.buffer, self.pos)
+			except json.JSONDecodeError as e:
+				# Дочитывать поток имеет смысл, только если значение обрывается на конце буфера
+				if self.eof or not self._is_truncated(e):
+					raise
+				self._fill_value()
+				continue
+
+			# Значение у конца буфера может быть обрезано (например, число 1.5e-3 разобрано как 1.5)
+			if len(self.buffer) - end < _MAX_PARTIAL_TOKEN and not self.eof:
+				self._fill_value()
+				continue
+			self.pos = end
+			return value
+
+	def iter_object(self) -> Iterator[str]:
+		"""Перебирает ключи JSON-объекта, значение каждого ключа должно быть прочитано до перехода к следующему"""
+
+		self._expect("{")
+		if self._peek() == "}":
+			self.pos += 1
+			return
+
+		while True:
+			key = self.read_value()
+			if type(key) is not str:
+				raise ValueError("object key must be of type string")
+			self._expect(":")
+			yield key
+			if self._next_delimiter("}"):
+				return
+
+	def iter_array(self) -> Iterator[Any]:
+		"""Перебирает элементы JSON-массива"""
+
+		self._expect("[")
+		if self._peek() == "]":
+			self.pos += 1
+			return
+
+		while True:
+			yield self.read_value()
+			if self._next_delimiter("]"):
+				return
+
+	def expect_end(self) -> None:
+		"""Проверяет, что после документа нет ничего, кроме пробельных символов"""
+
+		self._skip_whitespace()
+		if self.pos < len(self.buffer):
+			raise ValueError("unexpected data after the end of JSON document")
+
+	def _is_truncated(self, error: json.JSONDecodeError) -> bool:
+		if error.msg.startswith("Unterminated string"):
+			return True
+		return error.pos >= len(self.buffer) - _MAX_PARTIAL_TOKEN
+
+	def _fill_value(self) -> None:
+		"""Дочитывает поток для текущего значения, не давая ему занять в памяти больше max_value_size символов"""
+
+		if len(self.buffer) - self.pos >= self.max_value_size:
+			raise ValueError(f"JSON value is larger than {self.max_value_size} characters")
+		self._fill()
+
+	def _next_delimiter(self, closing: str) -> bool:
+		char = self._next_char()
+		if char == closing:
+			return True
+		if char != ",":
+			raise ValueError(f"expected ',' or '{closing}' in JSON document")
+		return False
+
+	def _expect(self, expected: str) -> None:
+		if self._next_char() != expected:
+			raise ValueError(f"expected '{expected}' in JSON document")
+
+	def _next_char(self) -> str:
+		char = self._peek()
+		if not char:
+			raise ValueError("unexpected end of JSON document")
+		self.pos += 1
+		return char
+
+	def _peek(self) -> str:
+		self._skip_whitespace()
+		return self.buffer[self.pos] if self.pos < len(self.buffer) else ""
+
+	def _skip_whitespace(self) -> None:
+		while True:
+			self.pos = json.decoder.WHITESPACE.match(self.buffer, self.pos).end()
+			if self.pos < len(self.buffer) or self.eof:
+				return
+			self._fill()
+
+	def _fill(self) -> None:
+		chunk = self.stream.read(self.buffer_size)
+		if not chunk:
+			self.eof = True
+		self.buffer = self.buffer[self.pos:] + chunk
+		self.pos = 0
+
+
+def spool_stream(stream: BinaryIO) -> BinaryIO:
+	"""Возвращает поток с возможностью перемотки, копируя тело во временный файл, если исходный поток её не поддерживает"""
+
+	if getattr(stream, "seekable", None) is not None and stream.seekable():
+		return stream
+
+	spool = tempfile.SpooledTemporaryFile(max_size=settings.IMPORT_SPOOL_MAX_SIZE)
+	shutil.copyfileobj(stream, spool)
+	return spool
+
+
+def read_import_request(stream: BinaryIO) -> tuple[dict, Iterator[dict]]:
+	"""Возвращает поля запроса импорта, кроме items, и итератор по элементам items, читающий их из потока"""
+
+	# Поток должен поддерживать перемотку, так как поле updateDate может идти после items
+	stream = spool_stream(stream)
+	stream.seek(0)
+	# В отличие от TextIOWrapper, StreamReader не закрывает исходный поток при сборке мусора,
+	# поэтому один и тот же поток можно прочитать повторно
+	text = codecs.getreader("utf-8")(stream)
+
+	fields = {}
+	items_found = False
+	reader = JsonStreamReader(text)
+	keys = reader.iter_object()
+
+	for key in keys:
+		if key != "items":
+			fields[key] = reader.read_value()
+		elif "updateDate" in fields:
+			return fields, _iter_items(reader, keys)
+		else:
+			items_found = True
+			for _ in reader.iter_array():
+				pass
+	reader.expect_end()
+
+	if not items_found:
+		raise ValueError("field 'items' is required")
+
+	text.seek(0)
+	reader = JsonStreamReader(text)
+	keys = reader.iter_object()
+
+	for key in keys:
+		if key == "items":
+			return fields, _iter_items(reader, keys)
+		reader.read_value()
+
+
+def _iter_items(reader: JsonStreamReader, keys: Iterator[str]) -> Iterator[dict]:
+	"""Возвращает элементы массива items и дочитывает документ до конца, проверяя его корректность"""
+
+	yield from reader.iter_array()
+	for _ in keys:
+		reader.read_value()
+	reader.expect_end()
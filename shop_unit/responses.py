@@ -0,0 +1,23 @@
+from typing import Any
+
+from django.http import HttpResponse
+
+from shop_unit import encoding
+
+
+class JsonResponse(HttpResponse):
+	"""Ответ JSON, кодируемый кодировщиком из настройки JSON_ENCODER вместо DjangoJSONEncoder"""
+
+	def __init__(self, data: Any, **kwargs):
+		kwargs.setdefault("content_type", "application/json")
+		super().__init__(content=encoding.dumps(data), **kwargs)
+
+
+class ErrorResponse(JsonResponse):
+	def __init__(self, code: int, message: str, **kwargs):
+		self.code = code
+		self.message = message
+		super().__init__(self.get_data(), status=code, **kwargs)
+
+	def get_data(self):
+		return {"code": self.code, "message": self.message}
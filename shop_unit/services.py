@@ -1,12 +1,23 @@
+import io
+import json
+import base64
+import re
+import time
 import datetime
+import functools
+import threading
+from contextlib import contextmanager
 from uuid import UUID
-from typing import Iterable, Union
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional, Union
 
 from django.conf import settings
-from django.db import transaction
-from pydantic import BaseModel, Field, validator, root_validator
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from pydantic import BaseModel, Field, ValidationError, validator, root_validator
+from psycopg2 import errors
+from pydantic.error_wrappers import ErrorWrapper
 
-from shop_unit import models, validations
+from shop_unit import cache, encoding, models, parsers, validations
 
 
 class ShopUnitImport(BaseModel):
@@ -46,6 +57,16 @@ class ShopUnitImport(BaseModel):
 		return values
 
 
+class ImportItem(NamedTuple):
+	"""Проверенный элемент импорта с полями ShopUnitImport, создаётся быстрым путём без модели pydantic"""
+
+	uuid: UUID
+	parent_id: Optional[UUID]
+	unit_type: models.ShopUnitType
+	price: Optional[int]
+	name: str
+
+
 class ShopUnitImportRequest(BaseModel):
 	items: list[ShopUnitImport]
 	update_date: datetime.datetime = Field(alias="updateDate")
@@ -61,116 +82,639 @@ class ShopUnitImportRequest(BaseModel):
 		return v.replace('Z', '')
 
 
+_local = threading.local()
+
+
+class StatisticBuffer:
+	"""Накапливает записи истории изменений ShopUnit в рамках транзакции и сохраняет их одним запросом"""
+
+	def __init__(self):
+		self.statistics = []
+		self.count = 0
+
+	def add(self, unit: models.ShopUnit) -> None:
+		self.statistics.append(_get_unit_statistic(unit))
+
+	def flush(self) -> None:
+		models.ShopUnitStatistic.objects.bulk_create(self.statistics, batch_size=settings.BULK_BATCH_SIZE)
+		self.count += len(self.statistics)
+		self.statistics = []
+
+
+# Ошибки, после которых транзакцию можно повторить целиком
+_CONFLICT_ERRORS = (errors.DeadlockDetected, errors.SerializationFailure)
+
+# Нарушение первичного ключа ShopUnit возможно только при одновременном создании объекта с одним UUID, так как
+# внутри импорта UUID уникальны и проверяются заранее. Остальные нарушения уникальности повторятся при повторе
+_CONFLICT_UNIQUE_CONSTRAINTS = {f"{models.ShopUnit._meta.db_table}_pkey"}
+
+
+def _is_conflict(e: Exception) -> bool:
+	"""Проверяет, вызвана ли ошибка конфликтом с параллельной транзакцией"""
+
+	if not isinstance(e, DatabaseError):
+		return False
+	if isinstance(e.__cause__, errors.UniqueViolation):
+		return e.__cause__.diag.constraint_name in _CONFLICT_UNIQUE_CONSTRAINTS
+	return isinstance(e.__cause__, _CONFLICT_ERRORS)
+
+
+def _retry_on_conflict(func):
+	"""Повторяет транзакцию при взаимной блокировке или ошибке сериализации, если она не вложена в другую"""
+
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		delay = settings.IMPORT_RETRY_DELAY
+		for attempt in range(1, settings.IMPORT_RETRY_ATTEMPTS + 1):
+			try:
+				return func(*args, **kwargs)
+			except DatabaseError as e:
+				if not _is_conflict(e) or attempt == settings.IMPORT_RETRY_ATTEMPTS \
+						or transaction.get_connection().in_atomic_block:
+					raise
+			time.sleep(delay)
+			delay *= 2
+	return wrapper
+
+
+class _PendingImport:
+	"""Импорт, ожидающий применения в составе группы"""
+
+	def __init__(self, import_data: ShopUnitImportRequest):
+		self.import_data = import_data
+		self.error = None
+		self.done = threading.Event()
+
+
+class ImportCombiner:
+	"""Объединяет импорты, поступившие в течение окна IMPORT_GROUP_COMMIT_WINDOW, в одну транзакцию.
+	Первый поток в окне становится ведущим и применяет всю группу, остальные ждут результата своего импорта"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.group_full = threading.Event()
+		self.pending = []
+		self.has_leader = False
+
+	def submit(self, import_data: ShopUnitImportRequest) -> None:
+		pending_import = _PendingImport(import_data)
+		with self.lock:
+			self.pending.append(pending_import)
+			is_leader = not self.has_leader
+			self.has_leader = True
+			if len(self.pending) >= settings.IMPORT_GROUP_COMMIT_MAX_SIZE:
+				self.group_full.set()
+
+		if is_leader:
+			self.group_full.wait(settings.IMPORT_GROUP_COMMIT_WINDOW)
+			with self.lock:
+				group, self.pending = self.pending, []
+				self.has_leader = False
+				self.group_full.clear()
+			_apply_pending_imports(group)
+		else:
+			pending_import.done.wait()
+
+		if pending_import.error is not None:
+			raise pending_import.error
+
+
+_import_combiner = ImportCombiner()
+
+
+def create_or_update_units(data: Union[str, bytes]) -> int:
+	"""Создаёт новые объекты ShopUnit, а существующие обновляет. Возвращает количество добавленных записей истории"""
+
+	return _apply_import(_parse_import_request(data))
+
+
+def create_or_update_units_grouped(data: Union[str, bytes]) -> None:
+	"""Создаёт и обновляет объекты ShopUnit в одной транзакции с импортами, поступившими в то же окно группировки.
+	Ошибка в одном импорте не влияет на остальные импорты группы"""
+
+	_import_combiner.submit(_parse_import_request(data))
+
+
+@_retry_on_conflict
 @transaction.atomic
-def create_or_update_units(data: Union[str, bytes]) -> None:
-	"""Создаёт новые объекты ShopUnit, а существующие обновляет"""
+def _apply_import(import_data: ShopUnitImportRequest) -> int:
+	"""Применяет проверенный импорт в отдельной транзакции и возвращает количество добавленных записей истории"""
 
-	import_data = ShopUnitImportRequest.parse_raw(data)
-	unit_indexes = _get_unit_indexes(import_data)
+	units = {}
+	with _statistic_buffer() as buffer:
+		unit_set = _import_units(import_data, units)
+		_update_parent_price(unit_set, units, import_data.update_date)
+	return buffer.count
+
+
+@_retry_on_conflict
+@transaction.atomic
+def _apply_import_group(imports: list[ShopUnitImportRequest]) -> None:
+	"""Применяет импорты по порядку в одной транзакции, пересчитывая цены затронутых категорий один раз в конце.
+	Каждая категория получает дату последнего затронувшего её импорта"""
+
+	units = {}
 	unit_set = set()
+	with _statistic_buffer():
+		for import_data in imports:
+			import_unit_set = _import_units(import_data, units)
+			for unit in import_unit_set:
+				for curr_unit in (unit, *_get_ancestors(unit, units)):
+					curr_unit.date = import_data.update_date
+			unit_set.update(import_unit_set)
+		_update_parent_price(unit_set, units)
 
-	for idx in range(len(import_data.items)):
-		parent, item = _get_parent_and_item(idx, import_data, unit_indexes)
-		unit, created = models.ShopUnit.objects.get_or_create(
-			uuid=item.uuid,
-			defaults={
-				"name": item.name,
-				"date": import_data.update_date,
-				"parent": parent,
-				"unit_type": models.ShopUnitType[item.unit_type],
-				"price": item.price
-			}
-		)
 
-		if not created:
-			validations.validate_type(unit.unit_type, item.unit_type)
-			unit.name = item.name
-			unit.date = import_data.update_date
-			unit.parent = parent
-			unit.unit_type = models.ShopUnitType[item.unit_type]
-			unit.price = item.price
+def _apply_pending_imports(group: list[_PendingImport]) -> None:
+	"""Применяет группу импортов, а при ошибке повторяет каждый импорт группы в отдельной транзакции"""
 
-		validations.validate_parent(unit.parent)
+	try:
+		if len(group) > 1:
+			try:
+				_apply_import_group([pending_import.import_data for pending_import in group])
+				return
+			except Exception:
+				pass
 
-		if unit.unit_type == models.ShopUnitType.CATEGORY:
-			curr_unit = unit
-		else:
-			curr_unit = unit.parent
-			_add_unit_statistic(unit)
+		for pending_import in group:
+			try:
+				_apply_import(pending_import.import_data)
+			except Exception as e:
+				pending_import.error = e
+	finally:
+		for pending_import in group:
+			pending_import.done.set()
 
-		if curr_unit is not None:
-			unit_set.add(curr_unit)
-			if curr_unit.parent is not None and curr_unit.parent in unit_set:
-				unit_set.remove(curr_unit.parent)
-		unit.save()
-	_update_parent_price(unit_set, import_data.update_date)
 
+def create_or_update_units_from_stream(stream: BinaryIO, chunk_size: int = None) -> int:
+	"""Создаёт новые объекты ShopUnit и обновляет существующие, читая и сохраняя элементы импорта частями"""
+
+	# Тело сохраняется заранее, чтобы при повторе транзакции прочитать его ещё раз
+	return _create_or_update_units_from_stream(parsers.spool_stream(stream), chunk_size)
+
+
+@_retry_on_conflict
+@transaction.atomic
+def _create_or_update_units_from_stream(stream: BinaryIO, chunk_size: int = None) -> int:
+	"""Применяет импорт из потока с возможностью перемотки в одной транзакции"""
+
+	fields, items = parsers.read_import_request(stream)
+	update_date = ShopUnitImportRequest.parse_obj({"items": [], "updateDate": fields.get("updateDate")}).update_date
+	units = {}
+	unit_set = set()
+	imported_uuids = set()
+	deferred_items = []
+
+	with _statistic_buffer() as buffer:
+		for chunk in _iter_chunks(items, chunk_size or settings.IMPORT_CHUNK_SIZE):
+			import_data = ShopUnitImportRequest.construct(items=_validate_import_items(chunk), update_date=update_date)
+			for item in import_data.items:
+				if item.uuid in imported_uuids:
+					raise ValueError("there should not be multiple units with the same uuid")
+				imported_uuids.add(item.uuid)
 
-def delete_shop_unit(uuid: str) -> None:
+			import_data.items = deferred_items + import_data.items
+			deferred_items = []
+			unit_set.update(_import_units(import_data, units, deferred_items))
+			_evict_offers(units)
+
+		if deferred_items:
+			raise ValueError("parent with given uuid not found")
+		_update_parent_price(unit_set, units, update_date)
+	return buffer.count
+
+
+@_retry_on_conflict
+@transaction.atomic
+def delete_shop_unit(uuid: str) -> int:
 	"""Удаляет объект ShopUnit с указанным UUID, все его дочерние объекты и его статистику обновлений"""
 
 	validations.validate_uuid(uuid)
-	unit = models.ShopUnit.objects.get(uuid=uuid)
-	parent = unit.parent
-	unit.delete()
-	_update_parent_price((parent,))
+	with _statistic_buffer() as buffer:
+		unit = models.ShopUnit.objects.get(uuid=uuid)
+		units = {unit.uuid: unit}
+		_load_ancestors(units)
+		_lock_units(units, set(units))
+		if unit.uuid not in units:
+			raise models.ShopUnit.DoesNotExist("unit was deleted by a concurrent request")
+		unit = units[unit.uuid]
+		_add_offer_aggregates(unit, -unit.offer_sum, -unit.offer_count, units)
+		parent = units.get(unit.parent_id)
+		if settings.NODES_CACHE_ENABLED:
+			_invalidate_nodes(models.ShopUnitClosure.objects.filter(ancestor=unit).values_list("descendant_id", flat=True))
+		models.ShopUnit.custom_objects.delete_subtree(unit.uuid)
+		transaction.on_commit(cache.bump_catalog_version)
+		_update_parent_price((parent,) if parent is not None else (), units)
+	return buffer.count
+
+
+def create_import_job(data: bytes) -> models.ImportJob:
+	"""Сохраняет запрос импорта для последующего применения фоновым обработчиком и возвращает созданную задачу"""
+
+	fields, _ = parsers.read_import_request(io.BytesIO(data))
+	update_date = ShopUnitImportRequest.parse_obj({"items": [], "updateDate": fields.get("updateDate")}).update_date
+	return models.ImportJob.objects.create(update_date=update_date, payload=data)
+
+
+def get_import_job(uuid: str) -> dict:
+	"""Возвращает информацию о задаче импорта с указанным UUID"""
+
+	validations.validate_uuid(uuid)
+	job = models.ImportJob.objects.defer("payload").get(uuid=uuid)
+	return {
+		"id": job.uuid,
+		"status": job.status,
+		"updateDate": job.update_date,
+		"statisticCount": job.statistic_count,
+	}
+
+
+def process_import_job() -> Optional[models.ImportJob]:
+	"""Применяет ожидающую задачу импорта с самым ранним updateDate и возвращает её, либо None, если задач нет"""
+
+	try:
+		return _apply_import_job()
+	except DatabaseError as e:
+		job_uuid = getattr(e, "import_job_uuid", None)
+		if not _is_conflict(e) or job_uuid is None:
+			raise
+	# Задача не применилась и после всех повторов: она завершается с ошибкой, чтобы не блокировать очередь
+	return _fail_import_job(job_uuid) or process_import_job()
+
+
+@_retry_on_conflict
+@transaction.atomic
+def _apply_import_job() -> Optional[models.ImportJob]:
+	# Без skip_locked: обработчики применяют задачи строго по очереди, сохраняя порядок updateDate
+	job = models.ImportJob.objects.select_for_update().filter(
+		status=models.ImportJobStatus.PENDING
+	).order_by("update_date", "created_at").first()
+
+	if job is None:
+		return None
+
+	payload = bytes(job.payload)
+	try:
+		if len(payload) > settings.IMPORT_STREAMING_THRESHOLD:
+			job.statistic_count = create_or_update_units_from_stream(io.BytesIO(payload))
+		else:
+			job.statistic_count = create_or_update_units(payload)
+		job.status = models.ImportJobStatus.DONE
+	except Exception as e:
+		# Конфликт с параллельной транзакцией откатывает всю задачу, и она применяется повторно
+		if _is_conflict(e):
+			e.import_job_uuid = job.uuid
+			raise
+		job.status = models.ImportJobStatus.FAILED
+
+	return _finish_import_job(job)
+
+
+@transaction.atomic
+def _fail_import_job(uuid: UUID) -> Optional[models.ImportJob]:
+	# Задачу мог уже применить другой обработчик
+	job = models.ImportJob.objects.select_for_update().filter(
+		uuid=uuid, status=models.ImportJobStatus.PENDING
+	).first()
+
+	if job is None:
+		return None
+
+	job.status = models.ImportJobStatus.FAILED
+	return _finish_import_job(job)
+
+
+def _finish_import_job(job: models.ImportJob) -> models.ImportJob:
+	job.payload = b""
+	job.finished_at = timezone.now()
+	job.save()
+	return job
 
 
 def get_shop_unit_by_uuid(uuid: str) -> dict:
 	"""Возвращает информацию об объекте ShopUnit с указанным UUID и информацию о его дочерних объектах"""
 
 	validations.validate_uuid(uuid)
-	units = models.ShopUnit.custom_objects.bfs_by_uuid(uuid=uuid)
+	if settings.CATALOG_CACHE_ENABLED:
+		return cache.get_catalog_tree().get_subtree(str(UUID(uuid)))
+
+	# Строки уже содержат UUID и дату в виде строк, поэтому объекты ShopUnit и datetime не создаются
 	parent_links = {}
 	head_unit = {}
 
-	for unit in units:
+	for unit_uuid, name, date, parent_id, unit_type, price in models.ShopUnit.custom_objects.serialized_subtree_by_uuid(uuid):
+		children = [] if unit_type == models.ShopUnitType.CATEGORY else None
 		curr_unit = {
-			"id": unit.uuid,
-			"name": unit.name,
-			"date": unit.date.strftime(settings.DATETIME_FORMAT)[:-3] + "Z",
-			"parentId": unit.parent.uuid if unit.parent is not None else None,
-			"type": models.ShopUnitType[unit.unit_type],
-			"price": unit.price,
-			"children": None
+			"id": unit_uuid,
+			"name": name,
+			"date": date,
+			"parentId": parent_id,
+			"type": unit_type,
+			"price": price,
+			"children": children
 		}
 
-		if curr_unit["type"] == models.ShopUnitType.CATEGORY:
-			curr_unit["children"] = []
-			parent_links[curr_unit["id"]] = curr_unit["children"]
+		if children is not None:
+			parent_links[unit_uuid] = children
 
 		if not head_unit:
 			head_unit = curr_unit
 		else:
-			parent_links[curr_unit["parentId"]].append(curr_unit)
+			parent_links[parent_id].append(curr_unit)
 	return head_unit
 
 
-def get_sales(date_str: str) -> dict:
-	"""Возвращает списка товаров, цена которых была обновлена за последние 24 часа включительно от времени переданном в запросе"""
+def get_shop_units_by_uuids(uuids: list[str]) -> dict[str, Optional[dict]]:
+	"""Возвращает поддеревья объектов ShopUnit с указанными UUID, загружая их одним запросом.
+	Для каждого UUID - поддерево в формате ответа /nodes, {}, если объект не найден, либо None, если UUID некорректен"""
+
+	if type(uuids) is not list or any(type(uuid) is not str for uuid in uuids):
+		raise ValueError("ids must be a list of strings")
+	if len(uuids) > settings.NODES_BATCH_MAX_SIZE:
+		raise ValueError(f"ids must contain at most {settings.NODES_BATCH_MAX_SIZE} items")
+
+	valid_uuids = {}
+	for uuid in uuids:
+		try:
+			valid_uuids[uuid] = str(UUID(uuid))
+		except ValueError:
+			pass
+
+	if settings.CATALOG_CACHE_ENABLED:
+		tree = cache.get_catalog_tree()
+	else:
+		tree = cache.CatalogTree.from_rows(
+			0, models.ShopUnit.custom_objects.serialized_subtrees_by_uuids(list(set(valid_uuids.values())))
+		)
+	return {uuid: tree.get_subtree(valid_uuids[uuid]) if uuid in valid_uuids else None for uuid in uuids}
+
+
+def get_shop_unit_snapshot(uuid: str, date_str: str) -> dict:
+	"""Возвращает объект ShopUnit с указанным UUID и его дочерние объекты в формате ответа /nodes по истории
+	на заданный момент времени, либо {}, если у объекта нет истории до этого момента.
+	Поддерево строится по родителям на заданный момент, включая объекты, позже перенесённые в другую категорию"""
 
+	validations.validate_uuid(uuid)
 	try:
 		date = datetime.datetime.fromisoformat(date_str.replace('Z', ''))
 	except ValueError:
 		raise ValueError("date does not conform to ISO 8601 format")
 
-	start = date - datetime.timedelta(days=1)
-	response_data = {"items": []}
-
-	for unit in models.ShopUnit.objects.filter(date__gte=start, date__lte=date, unit_type=models.ShopUnitType.OFFER):
-		response_data["items"].append({
-			"id": unit.uuid,
-			"name": unit.name,
-			"date": unit.date.strftime(settings.DATETIME_FORMAT)[:-3] + "Z",
-			"parentId": unit.parent.uuid if unit.parent is not None else None,
-			"price": unit.price,
-			"type": unit.unit_type
-		})
+	units = {}
+	for unit_uuid, name, unit_date, parent_id, unit_type, price in \
+			models.ShopUnitStatistic.custom_objects.serialized_snapshot_by_uuid(uuid, date):
+		units[unit_uuid] = {
+			"id": unit_uuid,
+			"name": name,
+			"date": unit_date,
+			"parentId": parent_id,
+			"type": unit_type,
+			"price": price,
+			"children": [] if unit_type == models.ShopUnitType.CATEGORY else None
+		}
+
+	head_unit = units.get(str(UUID(uuid)), {})
+	for unit in units.values():
+		if unit is not head_unit:
+			units[unit["parentId"]]["children"].append(unit)
+	return head_unit
+
+
+def iter_shop_unit_json(
+		uuid: str,
+		depth: int = None,
+		children_offset: int = 0,
+		children_limit: int = None
+) -> Optional[Iterator[bytes]]:
+	"""Возвращает итератор по частям JSON-ответа /nodes, читающий строки серверным курсором, либо None, если объекта нет.
+	depth ограничивает глубину поддерева, children_offset и children_limit - страницу дочерних объектов"""
+
+	validations.validate_uuid(uuid)
+	for value in (depth, children_offset, children_limit):
+		if value is not None and value < 0:
+			raise ValueError("depth and children paging parameters must be greater than or equal to zero")
+
+	cursor = models.ShopUnit.custom_objects.serialized_subtree_cursor(uuid, depth, children_offset, children_limit)
+	rows = cursor.fetchmany(settings.BULK_BATCH_SIZE)
+	if not rows:
+		cursor.close()
+		return None
+	return _iter_tree_json(cursor, rows, depth)
+
+
+def get_sales(date_str: str, limit: int = None, cursor: str = None) -> dict:
+	"""Возвращает списка товаров, цена которых была обновлена за последние 24 часа включительно от времени переданном в запросе.
+	При заданном limit возвращает одну страницу и курсор следующей страницы в поле nextCursor"""
+
+	db_cursor = _get_sales_cursor(date_str, limit, cursor)
+	with db_cursor:
+		rows = db_cursor.fetchall()
+
+	response_data = {"items": [_get_sales_item(row) for row in rows[:limit]]}
+	if limit is not None and len(rows) > limit:
+		response_data["nextCursor"] = _encode_sales_cursor(rows[limit - 1])
 	return response_data
 
 
-def get_node_statistic(uuid: str, date_start_str: str, date_end_str: str) -> dict:
-	"""Возвращает список обновления объекта ShopUnit с указанным UUID за заданный полуинтервал"""
+def iter_sales_json(date_str: str, limit: int = None, cursor: str = None) -> Iterator[bytes]:
+	"""Возвращает итератор по частям JSON-ответа /sales, читающий товары серверным курсором"""
+
+	return _iter_sales_json(_get_sales_cursor(date_str, limit, cursor), limit)
+
+
+def get_node_statistic(uuid: str, date_start_str: str, date_end_str: str, interval: str = None) -> dict:
+	"""Возвращает список обновления объекта ShopUnit с указанным UUID за заданный полуинтервал.
+	При заданном interval (например, 1h или 1d) возвращает обновления, агрегированные по интервалам"""
+
+	cursor = _get_statistic_cursor(uuid, date_start_str, date_end_str, interval)
+	with cursor:
+		rows = cursor.fetchall()
+
+	if not rows:
+		raise models.ShopUnitStatistic.DoesNotExist("units with given parameters were not found")
+	return {"items": [_get_statistic_item(row) for row in rows]}
+
+
+def iter_node_statistic_json(
+		uuid: str,
+		date_start_str: str,
+		date_end_str: str,
+		interval: str = None
+) -> Iterator[bytes]:
+	"""Возвращает итератор по частям JSON-ответа /node/{id}/statistic, читающий записи серверным курсором"""
+
+	cursor = _get_statistic_cursor(uuid, date_start_str, date_end_str, interval)
+	rows = cursor.fetchmany(settings.BULK_BATCH_SIZE)
+	if not rows:
+		cursor.close()
+		raise models.ShopUnitStatistic.DoesNotExist("units with given parameters were not found")
+	return _iter_statistic_json(cursor, rows)
+
+
+def compact_statistic(
+		now: datetime.datetime = None,
+		interval: str = None,
+		rollup_after_days: int = None,
+		retention_days: int = None
+) -> dict:
+	"""Создает месячные партиции истории, удаляет историю старше срока хранения и сворачивает старую историю
+	в одну запись на объект за interval. Незаданные параметры берутся из настроек STATISTIC_*"""
+
+	now = now or timezone.now()
+	interval = _parse_interval(interval or settings.STATISTIC_ROLLUP_INTERVAL)
+	rollup_after_days = settings.STATISTIC_ROLLUP_AFTER_DAYS if rollup_after_days is None else rollup_after_days
+	retention_days = settings.STATISTIC_RETENTION_DAYS if retention_days is None else retention_days
+	manager = models.ShopUnitStatistic.custom_objects
+	result = {"partitions_created": 0, "partitions_dropped": 0, "deleted": 0, "rolled_up": 0}
+
+	# Шаги выполняются в отдельных транзакциях, чтобы не держать блокировку таблицы на время сворачивания
+	partitioned = manager.is_partitioned()
+	if partitioned:
+		with transaction.atomic():
+			months = set(manager.get_default_partition_months()) | set(_iter_months(now, settings.STATISTIC_PARTITIONS_AHEAD))
+			for month in sorted(months - set(manager.get_partition_months())):
+				manager.create_partition(month)
+				result["partitions_created"] += 1
+
+	if retention_days:
+		retention_date = now - datetime.timedelta(days=retention_days)
+		with transaction.atomic():
+			if partitioned:
+				result["partitions_dropped"] = manager.drop_partitions_before(retention_date)
+			result["deleted"] = manager.delete_before(retention_date)
+
+	if rollup_after_days:
+		with transaction.atomic():
+			result["rolled_up"] = manager.rollup_before(now - datetime.timedelta(days=rollup_after_days), interval)
+	return result
+
+
+def _iter_months(date: datetime.datetime, count: int) -> Iterator[datetime.date]:
+	"""Перебирает первые дни месяца date и count следующих месяцев"""
+
+	month = datetime.date(date.year, date.month, 1)
+	for _ in range(count + 1):
+		yield month
+		month = datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _iter_tree_json(cursor, rows: list[tuple], depth_limit: Optional[int]) -> Iterator[bytes]:
+	"""Кодирует строки поддерева, упорядоченные обходом в глубину, в JSON по частям, закрывая курсор в конце.
+	У категорий на последнем уровне при ограничении глубины поле children отсутствует"""
+
+	open_depths = []
+	need_comma = False
+	try:
+		while rows:
+			parts = []
+			for unit_uuid, name, date, parent_id, unit_type, price, depth in rows:
+				while open_depths and open_depths[-1] >= depth:
+					open_depths.pop()
+					parts.append(b"]}")
+					need_comma = True
+				if need_comma:
+					parts.append(b",")
+
+				curr_unit = {"id": unit_uuid, "name": name, "date": date, "parentId": parent_id, "type": unit_type, "price": price}
+				if unit_type == models.ShopUnitType.OFFER:
+					curr_unit["children"] = None
+				elif depth_limit is None or depth < depth_limit:
+					parts.append(encoding.dumps(curr_unit)[:-1] + b',"children":[')
+					open_depths.append(depth)
+					need_comma = False
+					continue
+				parts.append(encoding.dumps(curr_unit))
+				need_comma = True
+
+			yield b"".join(parts)
+			rows = cursor.fetchmany(settings.BULK_BATCH_SIZE)
+		yield b"]}" * len(open_depths)
+	finally:
+		cursor.close()
+
+
+def _get_sales_cursor(date_str: str, limit: Optional[int], cursor: Optional[str]):
+	"""Проверяет параметры запроса /sales и возвращает серверный курсор по товарам, упорядоченным по (date, uuid)"""
+
+	try:
+		date = datetime.datetime.fromisoformat(date_str.replace('Z', ''))
+	except ValueError:
+		raise ValueError("date does not conform to ISO 8601 format")
+	if limit is not None and limit <= 0:
+		raise ValueError("limit must be greater than zero")
+
+	after = _decode_sales_cursor(cursor) if cursor is not None else None
+	# Лишняя строка показывает, есть ли следующая страница
+	return models.ShopUnit.custom_objects.serialized_sales_cursor(
+		date - datetime.timedelta(days=1), date, after, limit + 1 if limit is not None else None
+	)
+
+
+def _get_sales_item(row: tuple) -> dict:
+	unit_uuid, name, date, parent_id, unit_type, price, _ = row
+	return {"id": unit_uuid, "name": name, "date": date, "parentId": parent_id, "price": price, "type": unit_type}
+
+
+def _encode_sales_cursor(row: tuple) -> str:
+	"""Кодирует позицию последнего товара страницы в непрозрачный курсор"""
+
+	return base64.urlsafe_b64encode(f"{row[-1]}|{row[0]}".encode()).decode()
+
+
+def _decode_sales_cursor(cursor: str) -> tuple[datetime.datetime, UUID]:
+	"""Возвращает дату и UUID последнего товара предыдущей страницы из курсора"""
+
+	try:
+		date, uuid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+		return datetime.datetime.fromisoformat(date), UUID(uuid)
+	except ValueError:
+		raise ValueError("cursor is not valid")
+
+
+def _iter_sales_json(db_cursor, limit: Optional[int]) -> Iterator[bytes]:
+	"""Кодирует товары из курсора в JSON по частям, добавляя в конце курсор следующей страницы, и закрывает курсор"""
+
+	count = 0
+	has_more = False
+	last_row = None
+	try:
+		yield b'{"items":['
+		rows = db_cursor.fetchmany(settings.BULK_BATCH_SIZE)
+		while rows:
+			if limit is not None and count + len(rows) > limit:
+				rows = rows[:limit - count]
+				has_more = True
+			if rows:
+				items = b",".join(encoding.dumps(_get_sales_item(row)) for row in rows)
+				yield (b"," if count else b"") + items
+				count += len(rows)
+				last_row = rows[-1]
+			if has_more:
+				break
+			rows = db_cursor.fetchmany(settings.BULK_BATCH_SIZE)
+
+		if has_more:
+			yield f'],"nextCursor":"{_encode_sales_cursor(last_row)}"}}'.encode()
+		else:
+			yield b"]}"
+	finally:
+		db_cursor.close()
+
+
+_INTERVAL_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def _parse_interval(interval: str) -> datetime.timedelta:
+	"""Возвращает длительность интервала, заданного числом и единицей измерения (s, m, h или d)"""
+
+	match = re.fullmatch(r"([1-9][0-9]*)([smhd])", interval)
+	if match is None:
+		raise ValueError("interval is not valid")
+	return datetime.timedelta(**{_INTERVAL_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def _get_statistic_cursor(uuid: str, date_start_str: str, date_end_str: str, interval: Optional[str]):
+	"""Проверяет параметры запроса статистики и возвращает серверный курсор по записям, упорядоченным по дате"""
 
 	validations.validate_uuid(uuid)
 	try:
@@ -179,26 +723,247 @@ def get_node_statistic(uuid: str, date_start_str: str, date_end_str: str) -> dic
 	except ValueError:
 		raise ValueError("date does not conform to ISO 8601 format")
 
-	response_data = {"items": []}
-	unit_statistic = models.ShopUnitStatistic.objects.filter(
-		date__gte=date_start,
-		date__lt=date_end,
-		shop_unit__uuid=uuid
+	if interval is None:
+		return models.ShopUnitStatistic.custom_objects.serialized_statistic_cursor(uuid, date_start, date_end)
+	return models.ShopUnitStatistic.custom_objects.aggregated_statistic_cursor(
+		uuid, date_start, date_end, _parse_interval(interval)
 	)
 
-	if len(unit_statistic) == 0:
-		raise models.ShopUnitStatistic.DoesNotExist("units with given parameters were not found")
 
-	for unit in unit_statistic:
-		response_data["items"].append({
-			"id": unit.shop_unit.uuid,
-			"name": unit.name,
-			"date": unit.date.strftime(settings.DATETIME_FORMAT)[:-3] + "Z",
-			"parentId": unit.parent_id,
-			"price": unit.price,
-			"type": unit.unit_type
-		})
-	return response_data
+def _get_statistic_item(row: tuple) -> dict:
+	unit_uuid, name, date, parent_id, unit_type, price, *aggregates = row
+	item = {"id": unit_uuid, "name": name, "date": date, "parentId": parent_id, "price": price, "type": unit_type}
+	if aggregates:
+		item["minPrice"], item["maxPrice"], item["avgPrice"] = aggregates
+	return item
+
+
+def _iter_statistic_json(cursor, rows: list[tuple]) -> Iterator[bytes]:
+	"""Кодирует записи статистики из курсора в JSON по частям и закрывает курсор"""
+
+	try:
+		yield b'{"items":['
+		need_comma = False
+		while rows:
+			items = b",".join(encoding.dumps(_get_statistic_item(row)) for row in rows)
+			yield (b"," if need_comma else b"") + items
+			need_comma = True
+			rows = cursor.fetchmany(settings.BULK_BATCH_SIZE)
+		yield b"]}"
+	finally:
+		cursor.close()
+
+
+def _parse_import_request(data: Union[str, bytes]) -> ShopUnitImportRequest:
+	"""Разбирает запрос импорта, проверяя элементы быстрым путём без построения их через pydantic"""
+
+	try:
+		fields = json.loads(data)
+	except ValueError as e:
+		raise ValidationError([ErrorWrapper(e, loc="__root__")], ShopUnitImportRequest)
+
+	if type(fields) is not dict:
+		raise _import_validation_error(("__root__",), "value is not a valid dict")
+	if "items" not in fields:
+		raise _import_validation_error(("items",), "field required")
+
+	import_data = ShopUnitImportRequest.parse_obj({"updateDate": fields.get("updateDate"), "items": []})
+	import_data.items = _validate_import_items(fields["items"])
+	return import_data
+
+
+def _validate_import_items(items: list) -> list[ImportItem]:
+	"""Проверяет элементы импорта из JSON по правилам ShopUnitImport в одном цикле, без построения моделей через pydantic"""
+
+	if type(items) is not list:
+		raise _import_validation_error(("items",), "value is not a valid list")
+
+	unit_types = {unit_type.value: unit_type for unit_type in models.ShopUnitType}
+	# У многих элементов один родитель, поэтому его UUID разбирается один раз
+	parent_uuids = {}
+	import_items = []
+
+	for idx, item in enumerate(items):
+		if type(item) is not dict:
+			raise _import_validation_error(("items", idx), "value is not a valid dict")
+
+		for field in ("id", "type", "name"):
+			if field not in item:
+				raise _import_validation_error(("items", idx, field), "field required")
+
+		try:
+			uuid = UUID(item["id"])
+		except (TypeError, ValueError, AttributeError):
+			raise _import_validation_error(("items", idx, "id"), "value is not a valid uuid")
+
+		parent_id = item.get("parentId")
+		if parent_id is not None:
+			parent_uuid = parent_uuids.get(parent_id) if type(parent_id) is str else None
+			if parent_uuid is None:
+				try:
+					parent_uuid = parent_uuids[parent_id] = UUID(parent_id)
+				except (TypeError, ValueError, AttributeError):
+					raise _import_validation_error(("items", idx, "parentId"), "value is not a valid uuid")
+			parent_id = parent_uuid
+
+		unit_type = unit_types.get(item["type"]) if type(item["type"]) is str else None
+		if unit_type is None:
+			raise _import_validation_error(("items", idx, "type"), "value is not a valid enumeration member")
+
+		price = item.get("price")
+		if price is not None:
+			if type(price) is not int:
+				raise _import_validation_error(("items", idx, "price"), "field 'price' must be of type integer")
+			if price < 0:
+				raise _import_validation_error(("items", idx, "price"), "price must be greater than or equal to zero")
+
+		name = item["name"]
+		if type(name) is not str:
+			raise _import_validation_error(("items", idx, "name"), "field 'name' must be of type string")
+
+		if unit_type == models.ShopUnitType.CATEGORY and price is not None:
+			raise _import_validation_error(("items", idx, "__root__"), "field 'price' must be empty for CATEGORY")
+		if unit_type == models.ShopUnitType.OFFER and price is None:
+			raise _import_validation_error(("items", idx, "__root__"), "field 'price' cannot be empty for OFFER")
+
+		import_items.append(ImportItem(uuid, parent_id, unit_type, price, name))
+	return import_items
+
+
+def _import_validation_error(loc: tuple, message: str) -> ValidationError:
+	"""Возвращает ошибку проверки запроса импорта в том же виде, что и pydantic"""
+
+	return ValidationError([ErrorWrapper(ValueError(message), loc=loc)], ShopUnitImportRequest)
+
+
+def _import_units(
+		import_data: ShopUnitImportRequest,
+		units: dict[UUID, models.ShopUnit],
+		deferred_items: list[ImportItem] = None
+) -> set[models.ShopUnit]:
+	"""Сохраняет элементы импорта, пересчитывая агрегаты их предков, и возвращает категории для пересчёта цены"""
+
+	unit_indexes = _get_unit_indexes(import_data)
+	loaded_uuids = set(units)
+	units.update(_get_existing_units(import_data, units))
+	_load_ancestors(units)
+	_lock_units(units, units.keys() - loaded_uuids)
+	new_units = []
+	updated_units = []
+	moved_units = []
+	moved_paths = []
+	unit_set = set()
+
+	for item in _get_ordered_items(import_data, unit_indexes, units, deferred_items):
+		parent = units.get(item.parent_id) if item.parent_id is not None else None
+		unit = units.get(item.uuid)
+
+		if unit is None:
+			unit = models.ShopUnit(
+				uuid=item.uuid,
+				name=item.name,
+				date=import_data.update_date,
+				unit_type=models.ShopUnitType[item.unit_type],
+				price=item.price
+			)
+			units[unit.uuid] = unit
+			new_units.append(unit)
+		else:
+			validations.validate_type(unit.unit_type, item.unit_type)
+			_add_offer_aggregates(unit, -unit.offer_sum, -unit.offer_count, units)
+			if unit.parent_id != item.parent_id:
+				moved_units.append(unit)
+				if unit.parent_id is not None:
+					unit_set.add(units[unit.parent_id])
+			unit.name = item.name
+			unit.date = import_data.update_date
+			unit.unit_type = models.ShopUnitType[item.unit_type]
+			unit.price = item.price
+			updated_units.append(unit)
+
+		validations.validate_parent(parent)
+		validations.validate_ancestor(unit, parent)
+		unit.parent = parent
+		path = (parent.path if parent is not None else "/") + f"{unit.uuid}/"
+		if unit.path and unit.path != path:
+			moved_paths.append((unit.path, path))
+			_move_paths(unit.path, path, units)
+		unit.path = path
+
+		if unit.unit_type == models.ShopUnitType.OFFER:
+			unit.offer_sum, unit.offer_count = unit.price, 1
+		_add_offer_aggregates(unit, unit.offer_sum, unit.offer_count, units)
+
+		if unit.unit_type == models.ShopUnitType.CATEGORY:
+			curr_unit = unit
+		else:
+			curr_unit = unit.parent
+
+		if curr_unit is not None:
+			unit_set.add(curr_unit)
+
+	# Пути поддеревьев переносятся в том же порядке, что и в памяти, до записи самих элементов импорта
+	for old_path, new_path in moved_paths:
+		models.ShopUnit.custom_objects.move_paths(old_path, new_path)
+	models.ShopUnit.objects.bulk_create(new_units, batch_size=settings.BULK_BATCH_SIZE)
+	models.ShopUnit.objects.bulk_update(
+		updated_units,
+		fields=("name", "date", "parent", "unit_type", "price", "offer_sum", "offer_count", "path"),
+		batch_size=settings.BULK_BATCH_SIZE
+	)
+	_update_closure(new_units, moved_units, units)
+	transaction.on_commit(cache.bump_catalog_version)
+	_invalidate_nodes(unit.uuid for unit in (*new_units, *updated_units))
+
+	for unit in (*new_units, *updated_units):
+		if unit.unit_type == models.ShopUnitType.OFFER:
+			_add_unit_statistic(unit)
+	return unit_set
+
+
+def _update_closure(
+		new_units: list[models.ShopUnit],
+		moved_units: list[models.ShopUnit],
+		units: dict[UUID, models.ShopUnit]
+) -> None:
+	"""Обновляет таблицу замыкания: переносит связи поддеревьев перемещённых объектов и добавляет связи новых"""
+
+	# Поддеревья перемещаются до добавления новых объектов, чтобы связи новых объектов не переносились повторно.
+	# Сначала все перемещённые поддеревья отсоединяются от прежних предков, затем присоединяются от внешних к
+	# вложенным: вложенное поддерево ещё не связано с внешним, поэтому его связи с новыми предками не дублируются
+	for unit in moved_units:
+		models.ShopUnitClosure.custom_objects.detach_subtree(unit.uuid)
+
+	moved_ancestors = [(unit, _get_ancestors(unit, units)) for unit in moved_units]
+	for unit, ancestors in sorted(moved_ancestors, key=lambda item: len(item[1])):
+		models.ShopUnitClosure.custom_objects.attach_subtree(unit.uuid, [ancestor.uuid for ancestor in ancestors])
+
+	links = []
+	for unit in new_units:
+		links.append(models.ShopUnitClosure(ancestor_id=unit.uuid, descendant_id=unit.uuid, depth=0))
+		for depth, ancestor in enumerate(_get_ancestors(unit, units), start=1):
+			links.append(models.ShopUnitClosure(ancestor_id=ancestor.uuid, descendant_id=unit.uuid, depth=depth))
+	models.ShopUnitClosure.objects.bulk_create(links, batch_size=settings.BULK_BATCH_SIZE)
+
+
+def _iter_chunks(items: Iterable, chunk_size: int) -> Iterator[list]:
+	"""Разбивает последовательность на списки длиной не больше chunk_size"""
+
+	chunk = []
+	for item in items:
+		chunk.append(item)
+		if len(chunk) == chunk_size:
+			yield chunk
+			chunk = []
+	if chunk:
+		yield chunk
+
+
+def _evict_offers(units: dict[UUID, models.ShopUnit]) -> None:
+	"""Удаляет сохранённые товары из карты загруженных объектов, оставляя категории с их агрегатами"""
+
+	for uuid in [uuid for uuid, unit in units.items() if unit.unit_type == models.ShopUnitType.OFFER]:
+		del units[uuid]
 
 
 def _get_unit_indexes(data: ShopUnitImportRequest) -> dict[UUID, int]:
@@ -212,56 +977,215 @@ def _get_unit_indexes(data: ShopUnitImportRequest) -> dict[UUID, int]:
 	return unit_indexes
 
 
-def _get_parent_and_item(idx: int, data: ShopUnitImportRequest, unit_indexes: dict) -> (models.ShopUnit, ShopUnitImport):
-	"""Возвращает элемент и его родителя, проверяя существует ли родитель в базе или в передаваемом списке"""
+def _get_existing_units(
+		data: ShopUnitImportRequest,
+		units: dict[UUID, models.ShopUnit] = None
+) -> dict[UUID, models.ShopUnit]:
+	"""Возвращает карту ещё не загруженных объектов ShopUnit, на которые ссылается импорт (элементы и их родители)"""
 
-	item = data.items[idx]
-	parent = None
+	uuids = {item.uuid for item in data.items}
+	uuids.update(item.parent_id for item in data.items if item.parent_id is not None)
+	if units:
+		uuids.difference_update(units.keys())
+	return models.ShopUnit.objects.in_bulk(uuids)
 
-	while item.parent_id is not None:
-		try:
-			parent = models.ShopUnit.objects.get(uuid=item.parent_id)
-			break
-		except models.ShopUnit.DoesNotExist:
-			if unit_indexes.get(item.parent_id) is None:
-				raise ValueError("parent with given uuid not found")
-			else:
-				parent_idx = unit_indexes[item.parent_id]
-				data.items[idx], data.items[parent_idx] \
-					= data.items[parent_idx], data.items[idx]
-				unit_indexes[item.uuid], unit_indexes[item.parent_id] = \
-					unit_indexes[item.parent_id], unit_indexes[item.uuid]
-				item = data.items[idx]
-	return parent, item
-
-
-def _update_parent_price(units: Iterable[models.ShopUnit], date: datetime.datetime = None) -> None:
-	"""Обновляет цену у категории и её родителей на среднюю цену всех её товаров и товаров дочерних категорий"""
-
-	for curr_unit in units:
-		while curr_unit is not None:
-			parent_price = models.ShopUnit.custom_objects.get_parent_price(str(curr_unit.uuid))
-
-			if parent_price.price is None:
-				curr_unit.price = None
-			else:
-				curr_unit.price = parent_price.price // parent_price.ch_count
-
-			if date is not None:
-				curr_unit.date = date
-			curr_unit.save()
-			_add_unit_statistic(curr_unit)
-			curr_unit = curr_unit.parent
+
+def _get_ordered_items(
+		data: ShopUnitImportRequest,
+		unit_indexes: dict[UUID, int],
+		units: dict[UUID, models.ShopUnit],
+		deferred_items: list[ImportItem] = None
+) -> list[ImportItem]:
+	"""Возвращает элементы импорта в порядке «родитель раньше потомка», проверяя родителей и отсутствие циклов.
+	Элементы с ещё неизвестным родителем откладываются в deferred_items, если он передан"""
+
+	ordered_items = []
+	# 0 - элемент не просмотрен, 1 - элемент в текущей цепочке, 2 - элемент добавлен в результат, 3 - элемент отложен
+	states = [0] * len(data.items)
+
+	for idx in range(len(data.items)):
+		chain = []
+		parent_found = True
+		while idx is not None and states[idx] == 0:
+			states[idx] = 1
+			chain.append(idx)
+			parent_id = data.items[idx].parent_id
+			idx = unit_indexes.get(parent_id)
+
+			if idx is None and parent_id is not None and parent_id not in units:
+				if deferred_items is None:
+					raise ValueError("parent with given uuid not found")
+				parent_found = False
+
+		if idx is not None and states[idx] == 1:
+			raise ValueError("units must not form a cycle")
+
+		if not parent_found or (idx is not None and states[idx] == 3):
+			for chain_idx in chain:
+				states[chain_idx] = 3
+				deferred_items.append(data.items[chain_idx])
+			continue
+
+		for chain_idx in reversed(chain):
+			states[chain_idx] = 2
+			ordered_items.append(data.items[chain_idx])
+	return ordered_items
+
+
+def _get_ancestors(unit: models.ShopUnit, units: dict[UUID, models.ShopUnit]) -> list[models.ShopUnit]:
+	"""Возвращает предков объекта ShopUnit от родителя до корня, дополняя карту загруженных объектов недостающими"""
+
+	ancestors = []
+	parent_id = unit.parent_id
+
+	while parent_id is not None:
+		if parent_id == unit.uuid:
+			raise ValueError("units must not form a cycle")
+		if parent_id not in units:
+			units.update(models.ShopUnit.objects.in_bulk(set(_get_path_ancestor_ids(unit)) - units.keys()))
+			if parent_id not in units:
+				units[parent_id] = models.ShopUnit.objects.get(uuid=parent_id)
+		ancestors.append(units[parent_id])
+		parent_id = units[parent_id].parent_id
+	return ancestors
+
+
+def _get_path_ancestor_ids(unit: models.ShopUnit) -> list[UUID]:
+	"""Возвращает UUID предков объекта ShopUnit от корня до родителя по материализованному пути"""
+
+	return [UUID(uuid) for uuid in unit.path.strip("/").split("/")[:-1]]
+
+
+def _load_ancestors(units: dict[UUID, models.ShopUnit]) -> None:
+	"""Дозагружает в карту объектов ShopUnit всех предков загруженных объектов одним запросом по их путям"""
+
+	# Предки объекта с загруженным родителем совпадают с предками родителя, поэтому пути разбираются только
+	# у объектов, родитель которых ещё не загружен
+	ancestor_ids = set()
+	for unit in units.values():
+		if unit.parent_id is not None and unit.parent_id not in units:
+			ancestor_ids.update(_get_path_ancestor_ids(unit))
+	ancestor_ids.difference_update(units.keys())
+
+	if ancestor_ids:
+		units.update(models.ShopUnit.objects.in_bulk(ancestor_ids))
+
+
+def _move_paths(old_path: str, new_path: str, units: dict[UUID, models.ShopUnit]) -> None:
+	"""Заменяет начало пути у загруженных объектов поддерева перемещённого объекта"""
+
+	for unit in units.values():
+		if unit.path.startswith(old_path):
+			unit.path = new_path + unit.path[len(old_path):]
+
+
+def _lock_units(units: dict[UUID, models.ShopUnit], uuids: set[UUID]) -> None:
+	"""Блокирует строки объектов ShopUnit от корня к листьям, заменяя их в карте актуальными версиями.
+	Предки, появившиеся у объектов после параллельного перемещения, дозагружаются и блокируются следом"""
+
+	while uuids:
+		# Единый порядок блокировок (глубина, UUID) исключает взаимные блокировки между импортами
+		lock_order = sorted(uuids, key=lambda uuid: (len(_get_ancestors(units[uuid], units)), uuid))
+		locked_units = {unit.uuid: unit for unit in models.ShopUnit.custom_objects.lock_by_uuids(lock_order)}
+
+		for uuid in uuids - locked_units.keys():
+			del units[uuid]
+		units.update(locked_units)
+
+		loaded_uuids = set(units)
+		_load_ancestors(units)
+		uuids = units.keys() - loaded_uuids
+
+
+def _add_offer_aggregates(
+		unit: models.ShopUnit,
+		offer_sum: int,
+		offer_count: int,
+		units: dict[UUID, models.ShopUnit]
+) -> None:
+	"""Прибавляет сумму цен и количество товаров поддерева объекта ShopUnit к агрегатам всех его предков"""
+
+	for ancestor in _get_ancestors(unit, units):
+		ancestor.offer_sum += offer_sum
+		ancestor.offer_count += offer_count
+
+
+def _update_parent_price(
+		units: Iterable[models.ShopUnit],
+		loaded_units: dict[UUID, models.ShopUnit],
+		date: datetime.datetime = None
+) -> None:
+	"""Обновляет цену у категорий и их предков на среднюю цену товаров поддерева, пересчитывая каждого предка один раз"""
+
+	affected_units = {}
+	for unit in units:
+		chain = (unit, *_get_ancestors(unit, loaded_units))
+		for depth, curr_unit in enumerate(reversed(chain)):
+			affected_units[curr_unit.uuid] = (depth, curr_unit)
+
+	updated_units = [unit for _, unit in sorted(affected_units.values(), key=lambda x: x[0], reverse=True)]
+	for curr_unit in updated_units:
+		if curr_unit.offer_count == 0:
+			curr_unit.price = None
+		else:
+			curr_unit.price = curr_unit.offer_sum // curr_unit.offer_count
+
+		if date is not None:
+			curr_unit.date = date
+
+	models.ShopUnit.objects.bulk_update(
+		updated_units,
+		fields=("date", "price", "offer_sum", "offer_count"),
+		batch_size=settings.BULK_BATCH_SIZE
+	)
+	for curr_unit in updated_units:
+		_add_unit_statistic(curr_unit)
+	_invalidate_nodes(curr_unit.uuid for curr_unit in updated_units)
+
+
+def _invalidate_nodes(uuids: Iterable[UUID]) -> None:
+	"""Сбрасывает кэш ответов /nodes для указанных объектов после фиксации транзакции"""
+
+	if settings.NODES_CACHE_ENABLED:
+		uuids = [str(uuid) for uuid in uuids]
+		transaction.on_commit(lambda: cache.invalidate_nodes(uuids))
+
+
+@contextmanager
+def _statistic_buffer() -> Iterator[StatisticBuffer]:
+	"""Накапливает записи истории, добавленные внутри блока, и сохраняет их одним запросом при выходе из него"""
+
+	buffer = getattr(_local, "statistic_buffer", None)
+	if buffer is not None:
+		yield buffer
+		return
+
+	buffer = _local.statistic_buffer = StatisticBuffer()
+	try:
+		yield buffer
+		buffer.flush()
+	finally:
+		_local.statistic_buffer = None
 
 
 def _add_unit_statistic(unit: models.ShopUnit) -> None:
-	"""Сохраняет изменение объекта ShopUnit в базу данных"""
+	"""Сохраняет изменение объекта ShopUnit в базу данных или в буфер истории текущей транзакции"""
+
+	buffer = getattr(_local, "statistic_buffer", None)
+	if buffer is not None:
+		buffer.add(unit)
+	else:
+		_get_unit_statistic(unit).save()
+
+
+def _get_unit_statistic(unit: models.ShopUnit) -> models.ShopUnitStatistic:
+	"""Возвращает несохранённую запись истории изменения объекта ShopUnit"""
 
-	models.ShopUnitStatistic.objects.create(
+	return models.ShopUnitStatistic(
 		shop_unit=unit,
 		name=unit.name,
 		date=unit.date,
-		parent_id=unit.parent.uuid if unit.parent is not None else None,
+		parent_id=unit.parent_id,
 		unit_type=unit.unit_type,
 		price=unit.price
 	)
@@ -56,6 +56,25 @@ IMPORT_UPDATE_OK = {
 	"updateDate": "2022-02-01T12:00:01.000Z"
 }
 
+IMPORT_REPARENT_OK = {
+	"items": [
+		{
+			"type": "CATEGORY",
+			"name": "Флагманы",
+			"id": "069cb8d7-bbdd-47d3-ad8f-82ef4c269df5",
+			"parentId": "069cb8d7-bbdd-47d3-ad8f-82ef4c269df1"
+		},
+		{
+			"type": "OFFER",
+			"name": "jPhone 13",
+			"id": "863e1a7a-1304-42ae-943b-179184c077e3",
+			"parentId": "069cb8d7-bbdd-47d3-ad8f-82ef4c269df5",
+			"price": 89999
+		}
+	],
+	"updateDate": "2022-02-01T12:00:01.000Z"
+}
+
 IMPORT_NOT_FOUND = {
 	"items": [
 		{
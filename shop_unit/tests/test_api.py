@@ -1,13 +1,23 @@
+import io
 import json
+import asyncio
 import datetime
+import threading
 import urllib.parse
+from unittest import mock
+from uuid import uuid4
 
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
+from psycopg2 import errors
 
 from shop_unit.tests.utils import deep_sort_children
 from shop_unit.tests import config
-from shop_unit import models
+from shop_unit import async_views, models, services
 
 
 class ImportsTestCase(TestCase):
@@ -19,11 +29,115 @@ class ImportsTestCase(TestCase):
 			response = self.client.post(reverse('imports'), data=batch, content_type="application/json")
 			self.assertEqual(response.status_code, 200)
 
+	@override_settings(IMPORT_STREAMING_THRESHOLD=0, IMPORT_CHUNK_SIZE=1)
+	def test_imports_stream_ok(self):
+		for batch in config.IMPORT_BATCHES:
+			response = self.client.post(reverse('imports'), data=batch, content_type="application/json")
+			self.assertEqual(response.status_code, 200)
+
+		response = self.client.get(reverse('nodes', args=(config.UUID_OK,)))
+		response_data = json.loads(response.content)
+		self.assertEqual(deep_sort_children(response_data), deep_sort_children(config.EXPECTED_TREE))
+
+	@override_settings(IMPORT_STREAMING_THRESHOLD=0)
+	def test_imports_stream_err(self):
+		response = self.client.post(reverse('imports'), data=config.IMPORT_BATCHES[1], content_type="application/json")
+		self.assertEqual(response.status_code, 400)
+
 	def test_imports_err(self):
 		response = self.client.post(reverse('imports'), data=config.IMPORT_BATCHES[1], content_type="application/json")
 		self.assertEqual(response.status_code, 400)
 
 
+class ImportJobTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+
+	def test_import_job_ok(self):
+		job_ids = []
+		for batch in reversed(config.IMPORT_BATCHES):
+			response = self.client.post(
+				f"{reverse('imports')}?async=true",
+				data=batch,
+				content_type="application/json"
+			)
+			self.assertEqual(response.status_code, 202)
+			job_ids.append(json.loads(response.content)["id"])
+
+		response = self.client.get(reverse('import_job', args=(job_ids[0],)))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(json.loads(response.content)["status"], models.ImportJobStatus.PENDING)
+
+		call_command("process_imports", once=True, stdout=io.StringIO())
+
+		for job_id in job_ids:
+			response = self.client.get(reverse('import_job', args=(job_id,)))
+			self.assertEqual(json.loads(response.content)["status"], models.ImportJobStatus.DONE)
+
+		response = self.client.get(reverse('nodes', args=(config.UUID_OK,)))
+		response_data = json.loads(response.content)
+		self.assertEqual(deep_sort_children(response_data), deep_sort_children(config.EXPECTED_TREE))
+
+	def test_import_job_failed(self):
+		response = self.client.post(
+			f"{reverse('imports')}?async=true",
+			data=config.IMPORT_NOT_FOUND,
+			content_type="application/json"
+		)
+		self.assertEqual(response.status_code, 202)
+		job_id = json.loads(response.content)["id"]
+
+		call_command("process_imports", once=True, stdout=io.StringIO())
+		response = self.client.get(reverse('import_job', args=(job_id,)))
+		self.assertEqual(json.loads(response.content)["status"], models.ImportJobStatus.FAILED)
+
+	def test_import_job_err(self):
+		response = self.client.post(
+			f"{reverse('imports')}?async=true",
+			data=config.IMPORT_FORMAT_ERR_DATE,
+			content_type="application/json"
+		)
+		self.assertEqual(response.status_code, 400)
+
+	def test_import_job_conflict_failed(self):
+		job_ids = []
+		other_batch = {
+			"items": [{"type": "CATEGORY", "name": "Другая категория", "id": config.UUID_NOT_FOUND}],
+			"updateDate": "2022-02-03T12:00:00.000Z"
+		}
+		for batch in (config.IMPORT_BATCHES[0], other_batch):
+			response = self.client.post(f"{reverse('imports')}?async=true", data=batch, content_type="application/json")
+			job_ids.append(json.loads(response.content)["id"])
+
+		create_or_update_units = services.create_or_update_units
+
+		def conflicting_import(payload):
+			if json.loads(payload)["updateDate"] == config.IMPORT_BATCHES[0]["updateDate"]:
+				raise OperationalError() from errors.DeadlockDetected()
+			return create_or_update_units(payload)
+
+		# Задача, которая не применяется из-за конфликтов, завершается с ошибкой и не блокирует следующие
+		with mock.patch.object(services, "create_or_update_units", conflicting_import):
+			call_command("process_imports", once=True, stdout=io.StringIO())
+
+		statuses = [models.ImportJob.objects.get(uuid=job_id).status for job_id in job_ids]
+		self.assertEqual(statuses, [models.ImportJobStatus.FAILED, models.ImportJobStatus.DONE])
+
+	def test_process_imports_error_logged(self):
+		stderr = io.StringIO()
+		side_effect = [OperationalError("connection lost"), KeyboardInterrupt()]
+		with mock.patch.object(services, "process_import_job", side_effect=side_effect) as process_import_job:
+			with self.assertRaises(KeyboardInterrupt):
+				call_command("process_imports", interval=0, stdout=io.StringIO(), stderr=stderr)
+		self.assertEqual(process_import_job.call_count, 2)
+		self.assertIn("connection lost", stderr.getvalue())
+
+	def test_import_job_not_found(self):
+		response = self.client.get(reverse('import_job', args=(config.UUID_NOT_FOUND,)))
+		self.assertEqual(response.status_code, 404)
+		self.assertEqual(json.loads(response.content), config.RESPONSE_NOT_FOUND)
+
+
 class DeleteTestCase(TestCase):
 	def setUp(self):
 		self.client = Client()
@@ -72,6 +186,142 @@ class NodesTestCase(TestCase):
 		self.assertEqual(json.loads(response.content), config.RESPONSE_VALIDATION_FAILED)
 
 
+class NodesPartialTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		for batch in config.IMPORT_BATCHES:
+			self.client.post(reverse('imports'), data=batch, content_type="application/json")
+
+	@override_settings(BULK_BATCH_SIZE=2)
+	def test_nodes_stream_ok(self):
+		response = self.client.get(reverse('nodes', args=(config.UUID_OK,)), {"stream": "true"})
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+		response_data = json.loads(b"".join(response.streaming_content))
+		deep_sort_children(response_data)
+
+		expected_tree = json.loads(self.client.get(reverse('nodes', args=(config.UUID_OK,))).content)
+		deep_sort_children(expected_tree)
+		self.assertEqual(response_data, expected_tree)
+
+	def test_nodes_depth_ok(self):
+		response = self.client.get(reverse('nodes', args=(config.UUID_OK,)), {"depth": 1})
+		self.assertEqual(response.status_code, 200)
+		response_data = json.loads(response.content)
+		self.assertEqual(len(response_data["children"]), 2)
+		self.assertTrue(all("children" not in child for child in response_data["children"]))
+
+		response = self.client.get(reverse('nodes', args=(config.UUID_OK,)), {"depth": 0})
+		self.assertNotIn("children", json.loads(response.content))
+
+	def test_nodes_children_paging_ok(self):
+		children_ids = []
+		for offset in range(3):
+			response = self.client.get(
+				reverse('nodes', args=(config.UUID_OK,)),
+				{"childrenOffset": offset, "childrenLimit": 1}
+			)
+			children_ids.extend(child["id"] for child in json.loads(response.content)["children"])
+		self.assertEqual(len(children_ids), 2)
+		self.assertEqual(len(set(children_ids)), 2)
+
+	def test_nodes_partial_not_found(self):
+		response = self.client.get(reverse('nodes', args=(config.UUID_NOT_FOUND,)), {"stream": "true"})
+		self.assertEqual(response.status_code, 404)
+
+	def test_nodes_partial_err(self):
+		for params in ({"depth": "err"}, {"depth": -1}, {"childrenLimit": "err"}):
+			response = self.client.get(reverse('nodes', args=(config.UUID_OK,)), params)
+			self.assertEqual(response.status_code, 400)
+
+
+class NodesBatchTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		for batch in config.IMPORT_BATCHES:
+			self.client.post(reverse('imports'), data=batch, content_type="application/json")
+
+	def test_nodes_batch_ok(self):
+		uuids = [config.UUID_OK, config.UUID_NOT_FOUND, "err_uuid"]
+		response = self.client.post(reverse('nodes_batch'), data={"ids": uuids}, content_type="application/json")
+		self.assertEqual(response.status_code, 200)
+		response_data = json.loads(response.content)
+
+		expected_tree = json.loads(self.client.get(reverse('nodes', args=(config.UUID_OK,))).content)
+		deep_sort_children(expected_tree)
+		deep_sort_children(response_data[config.UUID_OK])
+		self.assertEqual(response_data[config.UUID_OK], expected_tree)
+		self.assertEqual(response_data[config.UUID_NOT_FOUND], config.RESPONSE_NOT_FOUND)
+		self.assertEqual(response_data["err_uuid"], config.RESPONSE_VALIDATION_FAILED)
+
+	def test_nodes_batch_err(self):
+		for data in ({"ids": config.UUID_OK}, {"uuids": [config.UUID_OK]}, [config.UUID_OK]):
+			response = self.client.post(reverse('nodes_batch'), data=data, content_type="application/json")
+			self.assertEqual(response.status_code, 400)
+			self.assertEqual(json.loads(response.content), config.RESPONSE_VALIDATION_FAILED)
+
+
+@override_settings(NODES_CACHE_ENABLED=True)
+class NodesCacheTestCase(TestCase):
+	def setUp(self):
+		caches["nodes"].clear()
+		self.client = Client()
+		with self.captureOnCommitCallbacks(execute=True):
+			for batch in config.IMPORT_BATCHES:
+				self.client.post(reverse('imports'), data=batch, content_type="application/json")
+
+	def get_etag(self, uuid):
+		response = self.client.get(reverse('nodes', args=(uuid,)))
+		self.assertEqual(response.status_code, 200)
+		return response["ETag"]
+
+	def test_nodes_ok(self):
+		response = self.client.get(reverse('nodes', args=(config.UUID_OK,)))
+		self.assertEqual(response.status_code, 200)
+		self.assertIn("ETag", response)
+		response_data = json.loads(response.content)
+		deep_sort_children(response_data)
+		expected_tree = json.loads(json.dumps(config.EXPECTED_TREE, default=str))
+		deep_sort_children(expected_tree)
+		self.assertEqual(response_data, expected_tree)
+
+		with self.assertNumQueries(0):
+			cached_response = self.client.get(reverse('nodes', args=(config.UUID_OK,)))
+		self.assertEqual(cached_response.content, response.content)
+
+	def test_nodes_not_modified(self):
+		etag = self.get_etag(config.UUID_OK)
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('nodes', args=(config.UUID_OK,)), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response["ETag"], etag)
+
+	def test_nodes_invalidated_by_import(self):
+		smartphones_id, tv_id = "d515e43f-f3f6-4471-bb77-6b455017a2d2", "1cc0129a-2bfe-474c-9ee6-d435bf5fc8f2"
+		etags = {uuid: self.get_etag(uuid) for uuid in (config.UUID_OK, smartphones_id, tv_id)}
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.post(reverse('imports'), data=config.IMPORT_REPARENT_OK, content_type="application/json")
+
+		for uuid, status_code in ((config.UUID_OK, 200), (smartphones_id, 200), (tv_id, 304)):
+			response = self.client.get(reverse('nodes', args=(uuid,)), HTTP_IF_NONE_MATCH=etags[uuid])
+			self.assertEqual(response.status_code, status_code)
+
+	def test_nodes_invalidated_by_delete(self):
+		offer_id = config.IMPORT_OK["items"][0]["id"]
+		etag = self.get_etag(offer_id)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.delete(reverse('delete', args=(config.UUID_OK,)))
+
+		response = self.client.get(reverse('nodes', args=(offer_id,)), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 404)
+
+	def test_nodes_err(self):
+		response = self.client.get(reverse('nodes', args=("err_uuid",)))
+		self.assertEqual(response.status_code, 400)
+
+
 class SalesTestCase(TestCase):
 	def setUp(self):
 		self.client = Client()
@@ -93,6 +343,98 @@ class SalesTestCase(TestCase):
 		self.assertEqual(response.status_code, 400)
 		self.assertEqual(json.loads(response.content), config.RESPONSE_VALIDATION_FAILED)
 
+	@override_settings(BULK_BATCH_SIZE=2)
+	def test_sales_stream_ok(self):
+		params = {"date": "2022-02-04T00:00:00.000Z", "limit": 2}
+		response = self.client.get("/sales", {**params, "stream": "true"})
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+		response_data = json.loads(b"".join(response.streaming_content))
+
+		expected_data = json.loads(self.client.get("/sales", params).content)
+		self.assertEqual(response_data, expected_data)
+
+	def test_sales_pages_ok(self):
+		units = []
+		params = {"date": "2022-02-04T00:00:00.000Z", "limit": 2}
+		while True:
+			response_data = json.loads(self.client.get("/sales", params).content)
+			units.extend(unit["id"] for unit in response_data["items"])
+			if "nextCursor" not in response_data:
+				break
+			params["cursor"] = response_data["nextCursor"]
+
+		response = self.client.get("/sales", {"date": "2022-02-04T00:00:00.000Z"})
+		self.assertEqual(units, [unit["id"] for unit in json.loads(response.content)["items"]])
+
+	def test_sales_pages_err(self):
+		for params in ({"limit": "err"}, {"limit": 0}, {"limit": 1, "cursor": "err_cursor"}):
+			response = self.client.get("/sales", {"date": "2022-02-04T00:00:00.000Z", **params})
+			self.assertEqual(response.status_code, 400)
+
+
+class NodeSnapshotTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+
+	def test_snapshot_ok(self):
+		for batch in config.IMPORT_BATCHES[:2]:
+			self.client.post(reverse('imports'), data=batch, content_type="application/json")
+		expected_tree = json.loads(self.client.get(reverse('nodes', args=(config.UUID_OK,))).content)
+		deep_sort_children(expected_tree)
+
+		for batch in config.IMPORT_BATCHES[2:]:
+			self.client.post(reverse('imports'), data=batch, content_type="application/json")
+		date = config.IMPORT_BATCHES[1]["updateDate"]
+		response = self.client.get(reverse('node_snapshot', args=(config.UUID_OK,)), {"date": date})
+		self.assertEqual(response.status_code, 200)
+		response_data = json.loads(response.content)
+		deep_sort_children(response_data)
+		self.assertEqual(response_data, expected_tree)
+
+	def test_snapshot_moved_out_ok(self):
+		old_parent, new_parent, offer = (str(uuid4()) for _ in range(3))
+		self.client.post(reverse('imports'), data={
+			"items": [
+				{"type": "CATEGORY", "name": "C1", "id": old_parent},
+				{"type": "CATEGORY", "name": "C2", "id": new_parent},
+				{"type": "OFFER", "name": "Offer", "id": offer, "parentId": old_parent, "price": 100}
+			],
+			"updateDate": "2022-02-01T12:00:00.000Z"
+		}, content_type="application/json")
+		self.client.post(reverse('imports'), data={
+			"items": [{"type": "OFFER", "name": "Offer", "id": offer, "parentId": new_parent, "price": 200}],
+			"updateDate": "2022-02-02T12:00:00.000Z"
+		}, content_type="application/json")
+
+		# Товар, перенесённый после заданного момента, остаётся в снимке прежней категории
+		response = self.client.get(reverse('node_snapshot', args=(old_parent,)), {"date": "2022-02-01T12:00:00.000Z"})
+		response_data = json.loads(response.content)
+		self.assertEqual(response_data["price"], 100)
+		self.assertEqual([(child["id"], child["price"]) for child in response_data["children"]], [(offer, 100)])
+
+		response = self.client.get(reverse('node_snapshot', args=(new_parent,)), {"date": "2022-02-01T12:00:00.000Z"})
+		self.assertEqual(json.loads(response.content)["children"], [])
+
+		response = self.client.get(reverse('node_snapshot', args=(old_parent,)), {"date": "2022-02-02T12:00:00.000Z"})
+		self.assertEqual(json.loads(response.content)["children"], [])
+
+	def test_snapshot_not_found(self):
+		for batch in config.IMPORT_BATCHES:
+			self.client.post(reverse('imports'), data=batch, content_type="application/json")
+		response = self.client.get(reverse('node_snapshot', args=(config.UUID_OK,)), {"date": "2022-01-01T00:00:00.000Z"})
+		self.assertEqual(response.status_code, 404)
+		response = self.client.get(
+			reverse('node_snapshot', args=(config.UUID_NOT_FOUND,)), {"date": "2022-02-04T00:00:00.000Z"}
+		)
+		self.assertEqual(response.status_code, 404)
+
+	def test_snapshot_err(self):
+		response = self.client.get(reverse('node_snapshot', args=(config.UUID_OK,)), {"date": "2022.02.04 00:00:00"})
+		self.assertEqual(response.status_code, 400)
+		response = self.client.get(reverse('node_snapshot', args=("err_uuid",)), {"date": "2022-02-04T00:00:00.000Z"})
+		self.assertEqual(response.status_code, 400)
+
 
 class NodeStatisticTestCase(TestCase):
 	def setUp(self):
@@ -113,7 +455,92 @@ class NodeStatisticTestCase(TestCase):
 		self.assertEqual(response.status_code, 404)
 		self.assertEqual(json.loads(response.content), config.RESPONSE_NOT_FOUND)
 
+	def test_stats_method_not_allowed(self):
+		response = self.client.post(f"/node/{config.UUID_OK}/statistic?{self.params}")
+		self.assertEqual(response.status_code, 405)
+
+	@override_settings(BULK_BATCH_SIZE=1)
+	def test_stats_stream_ok(self):
+		response = self.client.get(f"/node/{config.UUID_OK}/statistic?{self.params}&stream=true")
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+
+		expected_data = json.loads(self.client.get(f"/node/{config.UUID_OK}/statistic?{self.params}").content)
+		self.assertEqual(json.loads(b"".join(response.streaming_content)), expected_data)
+
+		response = self.client.get(f"/node/{config.UUID_NOT_FOUND}/statistic?{self.params}&stream=true")
+		self.assertEqual(response.status_code, 404)
+
+	def test_stats_interval_ok(self):
+		response = self.client.get(f"/node/{config.UUID_OK}/statistic?{self.params}&interval=1d")
+		self.assertEqual(response.status_code, 200)
+		items = json.loads(response.content)["items"]
+		self.assertEqual([item["date"] for item in items], ["2022-02-01T00:00:00.000Z", "2022-02-02T00:00:00.000Z"])
+		self.assertTrue(all(item["minPrice"] <= item["avgPrice"] <= item["maxPrice"] for item in items if item["price"]))
+
+		response = self.client.get(f"/node/{config.UUID_OK}/statistic?{self.params}&interval=err")
+		self.assertEqual(response.status_code, 400)
+
 	def test_stats_err(self):
 		response = self.client.get(f"/node/err_uuid/statistic?{self.params}")
 		self.assertEqual(response.status_code, 400)
 		self.assertEqual(json.loads(response.content), config.RESPONSE_VALIDATION_FAILED)
+
+
+class AsyncViewsTestCase(TransactionTestCase):
+	def setUp(self):
+		self.client = Client()
+		self.factory = RequestFactory()
+		for batch in config.IMPORT_BATCHES:
+			self.client.post(reverse('imports'), data=batch, content_type="application/json")
+
+	def test_async_views_ok(self):
+		for path, params, view, args in (
+			(reverse('nodes', args=(config.UUID_OK,)), {}, async_views.nodes, (config.UUID_OK,)),
+			(reverse('nodes', args=(config.UUID_OK,)), {"stream": "true"}, async_views.nodes, (config.UUID_OK,)),
+			("/sales", {"date": "2022-02-04T00:00:00.000Z"}, async_views.sales, ()),
+		):
+			response = async_to_sync(view)(self.factory.get(path, params), *args)
+			self.assertEqual(response.status_code, 200)
+			self.assertFalse(response.streaming)
+			self.assertEqual(response.content, b"".join(self.client.get(path, params)))
+
+		response = async_to_sync(async_views.nodes)(self.factory.get("/nodes/err_uuid"), "err_uuid")
+		self.assertEqual(response.status_code, 400)
+
+	def test_async_read_not_blocked_by_import(self):
+		locked = threading.Event()
+		release = threading.Event()
+
+		def hold_lock():
+			try:
+				with transaction.atomic():
+					models.ShopUnit.objects.select_for_update().get(uuid=config.UUID_OK)
+					locked.set()
+					release.wait(5)
+			finally:
+				connection.close()
+
+		holder = threading.Thread(target=hold_lock)
+		holder.start()
+		locked.wait(5)
+
+		async def run():
+			import_request = self.factory.post(
+				reverse('imports'), data=config.IMPORT_UPDATE_OK, content_type="application/json"
+			)
+			import_task = asyncio.ensure_future(async_views.imports(import_request))
+			nodes_request = self.factory.get(reverse('nodes', args=(config.UUID_OK,)))
+			nodes_response = await asyncio.wait_for(async_views.nodes(nodes_request, config.UUID_OK), 5)
+			# Импорт ждёт блокировку, но чтение уже выполнено в другом потоке
+			self.assertFalse(import_task.done())
+			release.set()
+			return nodes_response, await import_task
+
+		try:
+			nodes_response, import_response = async_to_sync(run)()
+		finally:
+			release.set()
+			holder.join()
+		self.assertEqual(nodes_response.status_code, 200)
+		self.assertEqual(import_response.status_code, 200)
@@ -0,0 +1,56 @@
+import json
+
+from django.test import TestCase, Client, override_settings
+
+from shop_unit.tests.utils import deep_sort_children
+from shop_unit import cache, services
+from shop_unit.tests import config
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class CatalogTreeTestCase(TestCase):
+	def setUp(self):
+		cache.reset_catalog_tree()
+		with self.captureOnCommitCallbacks(execute=True):
+			services.create_or_update_units(json.dumps(config.IMPORT_OK))
+
+	def test_get_shop_unit_by_uuid_ok(self):
+		shop_unit_tree = services.get_shop_unit_by_uuid(config.UUID_OK)
+		with override_settings(CATALOG_CACHE_ENABLED=False):
+			expected_tree = services.get_shop_unit_by_uuid(config.UUID_OK)
+
+		deep_sort_children(shop_unit_tree)
+		deep_sort_children(expected_tree)
+		self.assertEqual(shop_unit_tree, expected_tree)
+
+	def test_get_shop_unit_by_uuid_not_found(self):
+		self.assertEqual(services.get_shop_unit_by_uuid(config.UUID_NOT_FOUND), {})
+
+	def test_get_catalog_tree_stats(self):
+		services.get_shop_unit_by_uuid(config.UUID_OK)
+		services.get_shop_unit_by_uuid(config.UUID_OK)
+		self.assertEqual(cache.get_catalog_tree_stats(), {"hits": 1, "misses": 1, "reloads": 1})
+
+		response = Client().get("/metrics/catalog-tree")
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual({key: value for key, value in json.loads(response.content).items() if key != "pid"}, {
+			"hits": 1, "misses": 1, "reloads": 1
+		})
+
+	def test_catalog_version_bumped_by_import(self):
+		version = cache.get_catalog_tree().version
+		with self.captureOnCommitCallbacks(execute=True):
+			services.create_or_update_units(json.dumps(config.IMPORT_REPARENT_OK))
+
+		shop_unit_tree = services.get_shop_unit_by_uuid(config.IMPORT_REPARENT_OK["items"][0]["id"])
+		self.assertGreater(cache.get_catalog_tree().version, version)
+		self.assertEqual(shop_unit_tree["price"], 89999)
+		self.assertEqual(shop_unit_tree["children"][0]["id"], config.IMPORT_REPARENT_OK["items"][1]["id"])
+		self.assertEqual(cache.get_catalog_tree_stats()["reloads"], 2)
+
+	def test_catalog_version_bumped_by_delete(self):
+		services.get_shop_unit_by_uuid(config.UUID_OK)
+		with self.captureOnCommitCallbacks(execute=True):
+			services.delete_shop_unit(config.UUID_OK)
+
+		self.assertEqual(services.get_shop_unit_by_uuid(config.UUID_OK), {})
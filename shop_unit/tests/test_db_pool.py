@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+
+import psycopg2
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, Client
+from psycopg2 import extensions
+
+from MegaMarket.db.postgresql_pool import pool
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+	def setUp(self):
+		self.pools = []
+
+	def tearDown(self):
+		for connection_pool in self.pools:
+			connection_pool.close_idle()
+
+	def get_pool(self, max_size: int = 2, timeout: float = 1, check_interval: float = 30) -> pool.ConnectionPool:
+		conn_params = connection.get_connection_params()
+		connection_pool = pool.ConnectionPool(lambda: psycopg2.connect(**conn_params), max_size, timeout, check_interval)
+		self.pools.append(connection_pool)
+		return connection_pool
+
+	def test_reuse_ok(self):
+		connection_pool = self.get_pool()
+		first = connection_pool.getconn()
+		connection_pool.putconn(first)
+		second = connection_pool.getconn()
+		self.assertIs(first, second)
+		connection_pool.putconn(second)
+
+		stats = connection_pool.get_stats()
+		self.assertEqual((stats["checkouts"], stats["connects"], stats["open"], stats["idle"]), (2, 1, 1, 1))
+
+	def test_wait_ok(self):
+		connection_pool = self.get_pool(max_size=1)
+		first = connection_pool.getconn()
+		threading.Timer(0.1, connection_pool.putconn, args=(first,)).start()
+
+		second = connection_pool.getconn()
+		self.assertIs(first, second)
+		connection_pool.putconn(second)
+		stats = connection_pool.get_stats()
+		self.assertEqual(stats["waits"], 1)
+		self.assertGreaterEqual(stats["max_wait_time"], 0.05)
+
+	def test_timeout_err(self):
+		connection_pool = self.get_pool(max_size=1, timeout=0.05)
+		first = connection_pool.getconn()
+		with self.assertRaises(pool.PoolTimeout):
+			connection_pool.getconn()
+		connection_pool.putconn(first)
+		self.assertEqual(connection_pool.get_stats()["timeouts"], 1)
+
+	def test_health_check_ok(self):
+		connection_pool = self.get_pool(check_interval=0)
+		first = connection_pool.getconn()
+		pid = first.info.backend_pid
+		connection_pool.putconn(first)
+
+		other = psycopg2.connect(**connection.get_connection_params())
+		other.autocommit = True
+		with other.cursor() as cursor:
+			cursor.execute("SELECT pg_terminate_backend(%s);", [pid])
+		other.close()
+		time.sleep(0.1)
+
+		second = connection_pool.getconn()
+		self.assertNotEqual(second.info.backend_pid, pid)
+		connection_pool.putconn(second)
+		self.assertEqual(connection_pool.get_stats()["discards"], 1)
+
+	def test_putconn_rollback_ok(self):
+		connection_pool = self.get_pool()
+		conn = connection_pool.getconn()
+		with conn.cursor() as cursor:
+			cursor.execute("SELECT 1;")
+		self.assertEqual(conn.info.transaction_status, extensions.TRANSACTION_STATUS_INTRANS)
+		connection_pool.putconn(conn)
+		self.assertEqual(conn.info.transaction_status, extensions.TRANSACTION_STATUS_IDLE)
+
+	def test_database_wrapper_ok(self):
+		backend = load_backend("MegaMarket.db.postgresql_pool")
+		wrapper = backend.DatabaseWrapper(connection.settings_dict, alias="pool_test")
+		try:
+			for _ in range(2):
+				with wrapper.cursor() as cursor:
+					cursor.execute("SELECT 1;")
+				wrapper.close()
+			stats = wrapper.pool.get_stats()
+			self.assertEqual((stats["checkouts"], stats["connects"], stats["in_use"]), (2, 1, 0))
+		finally:
+			wrapper.pool.close_idle()
+
+		response = Client().get("/metrics/db-pool")
+		self.assertEqual(response.status_code, 200)
+		self.assertIn("pools", json.loads(response.content))
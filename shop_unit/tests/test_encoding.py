@@ -0,0 +1,47 @@
+import json
+import datetime
+from unittest import skipIf
+from uuid import UUID
+
+from django.test import SimpleTestCase, override_settings
+
+from shop_unit import encoding
+from shop_unit.tests import config
+
+
+class EncodingTestCase(SimpleTestCase):
+	data = {
+		"id": UUID(config.UUID_OK),
+		"name": "Категория",
+		"date": datetime.datetime(2022, 2, 1, 12, 0, 0, 123456),
+		"parentId": None,
+		"price": 100,
+		"children": [{"id": config.UUID_CHILDREN_1, "children": None}],
+	}
+	expected_data = {
+		"id": config.UUID_OK,
+		"name": "Категория",
+		"date": "2022-02-01T12:00:00.123Z",
+		"parentId": None,
+		"price": 100,
+		"children": [{"id": config.UUID_CHILDREN_1, "children": None}],
+	}
+
+	def test_dumps_ok(self):
+		for name in encoding.ENCODERS:
+			with self.subTest(encoder=name), override_settings(JSON_ENCODER=name):
+				self.assertEqual(json.loads(encoding.dumps(self.data)), self.expected_data)
+
+	@skipIf(encoding.orjson is None, "orjson is not installed")
+	def test_auto_encoder_ok(self):
+		with override_settings(JSON_ENCODER="auto"):
+			self.assertIs(encoding.get_encoder(), encoding.ENCODERS["orjson"])
+
+	def test_dumps_err(self):
+		with override_settings(JSON_ENCODER="err"):
+			with self.assertRaisesMessage(ValueError, "JSON encoder 'err' is not available"):
+				encoding.dumps(self.data)
+		for name in encoding.ENCODERS:
+			with self.subTest(encoder=name), override_settings(JSON_ENCODER=name):
+				with self.assertRaises(TypeError):
+					encoding.dumps({"value": object()})
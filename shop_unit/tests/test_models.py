@@ -39,6 +39,7 @@ class ShopUnitTestCase(TestCase):
 			price=321,
 			parent=parent
 		)
+		models.ShopUnitClosure.custom_objects.rebuild()
 
 	def test_get_ok(self):
 		shop_unit = models.ShopUnit.objects.get(uuid=config.UUID_OK)
@@ -64,15 +65,29 @@ class ShopUnitTestCase(TestCase):
 		shop_units_tree = models.ShopUnit.custom_objects.bfs_by_uuid(config.UUID_NOT_FOUND)
 		self.assertEqual(len(shop_units_tree), 0)
 
-	def test_get_parent_price_ok(self):
-		parent_price = models.ShopUnit.custom_objects.get_parent_price(config.UUID_OK)
-		self.assertEqual(parent_price.ch_count, 3)
-		self.assertEqual(parent_price.price, 657)
+	def test_rebuild_closure_ok(self):
+		links = models.ShopUnitClosure.objects.values_list("ancestor_id", "descendant_id", "depth")
+		self.assertEqual(len(links), 7)
+		self.assertIn((UUID(config.UUID_OK), UUID(config.UUID_CHILDREN_1), 1), links)
+		self.assertIn((UUID(config.UUID_CHILDREN_1), UUID(config.UUID_CHILDREN_1), 0), links)
 
-	def test_get_parent_price_not_found(self):
-		parent_price = models.ShopUnit.custom_objects.get_parent_price(config.UUID_NOT_FOUND)
-		self.assertEqual(parent_price.ch_count, 0)
-		self.assertEqual(parent_price.price, None)
+	def test_move_subtree_ok(self):
+		models.ShopUnit.objects.filter(uuid=config.UUID_CHILDREN_1).update(parent=None)
+		models.ShopUnitClosure.custom_objects.detach_subtree(config.UUID_CHILDREN_1)
+		self.assertFalse(models.ShopUnitClosure.objects.filter(descendant_id=config.UUID_CHILDREN_1, depth__gt=0).exists())
+
+		models.ShopUnit.objects.filter(uuid=config.UUID_CHILDREN_1).update(parent_id=config.UUID_CHILDREN_2)
+		models.ShopUnitClosure.custom_objects.detach_subtree(config.UUID_CHILDREN_1)
+		models.ShopUnitClosure.custom_objects.attach_subtree(config.UUID_CHILDREN_1, [config.UUID_CHILDREN_2, config.UUID_OK])
+		self.assertEqual(
+			set(models.ShopUnitClosure.objects.filter(descendant_id=config.UUID_CHILDREN_1).values_list("ancestor_id", "depth")),
+			{(UUID(config.UUID_CHILDREN_1), 0), (UUID(config.UUID_CHILDREN_2), 1), (UUID(config.UUID_OK), 2)}
+		)
+
+	def test_delete_subtree_ok(self):
+		models.ShopUnit.custom_objects.delete_subtree(config.UUID_OK)
+		self.assertEqual(models.ShopUnit.objects.count(), 0)
+		self.assertEqual(models.ShopUnitClosure.objects.count(), 0)
 
 
 class ShopUnitStatisticTestCase(TestCase):
@@ -100,3 +115,39 @@ class ShopUnitStatisticTestCase(TestCase):
 	def test_get_err(self):
 		with self.assertRaises(models.ShopUnitStatistic.DoesNotExist):
 			models.ShopUnitStatistic.objects.get(shop_unit__uuid=config.UUID_NOT_FOUND)
+
+	def test_create_partition_ok(self):
+		manager = models.ShopUnitStatistic.custom_objects
+		self.assertTrue(manager.is_partitioned())
+		self.assertEqual(manager.get_default_partition_months(), [datetime.date(2022, 2, 1)])
+
+		manager.create_partition(datetime.date(2022, 2, 1))
+		self.assertEqual(manager.get_partition_months(), [datetime.date(2022, 2, 1)])
+		self.assertEqual(manager.get_default_partition_months(), [])
+		self.assertEqual(models.ShopUnitStatistic.objects.count(), 1)
+
+		self.assertEqual(manager.drop_partitions_before(datetime.datetime(2022, 3, 1)), 1)
+		self.assertEqual(models.ShopUnitStatistic.objects.count(), 0)
+
+	def test_rollup_before_ok(self):
+		shop_unit = models.ShopUnit.objects.get(uuid=config.UUID_OK)
+		for minutes, price in ((10, 100), (20, 300), (70, 50)):
+			models.ShopUnitStatistic.objects.create(
+				shop_unit=shop_unit,
+				name=f"Test shop_unit_statistic {price}",
+				date=datetime.datetime(2022, 2, 1) + datetime.timedelta(minutes=minutes),
+				unit_type=models.ShopUnitType.CATEGORY,
+				price=price
+			)
+
+		rolled_up = models.ShopUnitStatistic.custom_objects.rollup_before(
+			datetime.datetime(2022, 2, 2), datetime.timedelta(hours=1)
+		)
+		self.assertEqual(rolled_up, 1)
+
+		first_hour, second_hour = models.ShopUnitStatistic.objects.order_by("date")
+		self.assertEqual(first_hour.date, datetime.datetime(2022, 2, 1, 0, 20))
+		self.assertEqual(first_hour.name, "Test shop_unit_statistic 300")
+		self.assertEqual((first_hour.min_price, first_hour.max_price, first_hour.price_count), (100, 300, 2))
+		self.assertEqual(first_hour.price_sum, 400)
+		self.assertEqual(second_hour.price_count, None)
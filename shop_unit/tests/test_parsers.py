@@ -0,0 +1,73 @@
+import io
+import json
+
+from django.test import SimpleTestCase
+
+from shop_unit import parsers
+from shop_unit.tests import config
+
+
+class JsonStreamReaderTestCase(SimpleTestCase):
+	def test_iter_object_ok(self):
+		reader = parsers.JsonStreamReader(io.StringIO(json.dumps(config.IMPORT_OK, indent=2)), buffer_size=3)
+		data = {}
+
+		for key in reader.iter_object():
+			if key == "items":
+				data[key] = list(reader.iter_array())
+			else:
+				data[key] = reader.read_value()
+		reader.expect_end()
+		self.assertEqual(data, config.IMPORT_OK)
+
+	def test_read_value_number_on_buffer_boundary(self):
+		reader = parsers.JsonStreamReader(io.StringIO("[12345, 6]"), buffer_size=3)
+		self.assertEqual(list(reader.iter_array()), [12345, 6])
+
+	def test_read_value_tokens_on_buffer_boundary(self):
+		values = ["\u0416\\\"", True, False, None, -1.5e-3, {"a": [1, "b"]}]
+		for buffer_size in range(1, 8):
+			reader = parsers.JsonStreamReader(io.StringIO(json.dumps(values)), buffer_size=buffer_size)
+			self.assertEqual(list(reader.iter_array()), values)
+
+	def test_read_value_malformed_err(self):
+		stream = io.StringIO('[{"id": 1, "name": "a\tb"}, ' + '"' + "x" * 1000 + '"]')
+		reader = parsers.JsonStreamReader(stream, buffer_size=16)
+		with self.assertRaises(json.JSONDecodeError):
+			list(reader.iter_array())
+		# Ошибка обнаруживается без чтения остатка потока
+		self.assertLess(stream.tell(), 64)
+
+	def test_read_value_too_large_err(self):
+		stream = io.StringIO('["' + "x" * 1000 + '"]')
+		reader = parsers.JsonStreamReader(stream, buffer_size=16, max_value_size=100)
+		with self.assertRaisesMessage(ValueError, "JSON value is larger than 100 characters"):
+			list(reader.iter_array())
+		self.assertLess(stream.tell(), 200)
+
+	def test_iter_array_err(self):
+		reader = parsers.JsonStreamReader(io.StringIO('[{"id": 1} {"id": 2}]'), buffer_size=4)
+		with self.assertRaisesMessage(ValueError, "expected ',' or ']' in JSON document"):
+			list(reader.iter_array())
+
+
+class ReadImportRequestTestCase(SimpleTestCase):
+	def test_read_import_request_ok(self):
+		fields, items = parsers.read_import_request(io.BytesIO(json.dumps(config.IMPORT_OK).encode()))
+		self.assertEqual(fields, {"updateDate": config.IMPORT_OK["updateDate"]})
+		self.assertEqual(list(items), config.IMPORT_OK["items"])
+
+	def test_read_import_request_date_first(self):
+		data = {"updateDate": config.IMPORT_OK["updateDate"], "items": config.IMPORT_OK["items"]}
+		fields, items = parsers.read_import_request(io.BytesIO(json.dumps(data).encode()))
+		self.assertEqual(fields, {"updateDate": config.IMPORT_OK["updateDate"]})
+		self.assertEqual(list(items), config.IMPORT_OK["items"])
+
+	def test_read_import_request_no_items(self):
+		with self.assertRaisesMessage(ValueError, "field 'items' is required"):
+			parsers.read_import_request(io.BytesIO(b'{"updateDate": "2022-02-01T12:00:00.000Z"}'))
+
+	def test_read_import_request_trailing_data(self):
+		data = json.dumps(config.IMPORT_OK).encode() + b" {}"
+		with self.assertRaisesMessage(ValueError, "unexpected data after the end of JSON document"):
+			parsers.read_import_request(io.BytesIO(data))
@@ -0,0 +1,137 @@
+import json
+import time
+import unittest
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import connections, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from MegaMarket.db import routers
+from shop_unit.tests import config
+from shop_unit import models
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTestCase(SimpleTestCase):
+	def test_read_ok(self):
+		self.assertEqual(router.db_for_read(models.ShopUnit), "default")
+		with routers.use_replicas():
+			self.assertEqual(router.db_for_read(models.ShopUnit), "replica")
+			with routers.use_primary():
+				self.assertEqual(router.db_for_read(models.ShopUnit), "default")
+			self.assertEqual(router.db_for_write(models.ShopUnit), "default")
+
+		with override_settings(DATABASE_REPLICAS=[]), routers.use_replicas():
+			self.assertEqual(router.db_for_read(models.ShopUnit), "default")
+
+	def test_migrate_ok(self):
+		self.assertTrue(router.allow_migrate("default", "shop_unit"))
+		self.assertFalse(router.allow_migrate("replica", "shop_unit"))
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterAtomicTestCase(TestCase):
+	def test_read_in_transaction_ok(self):
+		with routers.use_replicas():
+			self.assertEqual(router.db_for_read(models.ShopUnit), "default")
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], DB_REPLICA_STICKY_SECONDS=5)
+class ReplicaMiddlewareTestCase(SimpleTestCase):
+	def setUp(self):
+		self.factory = RequestFactory()
+		self.databases_used = []
+
+	def view(self, request, status=200):
+		self.databases_used.append(router.db_for_read(models.ShopUnit))
+		return HttpResponse(status=status)
+
+	def call(self, request, status=200) -> HttpResponse:
+		return routers.replica_middleware(lambda request: self.view(request, status))(request)
+
+	def test_read_ok(self):
+		response = self.call(self.factory.get("/sales"))
+		self.assertEqual(self.databases_used, ["replica"])
+		self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+		# Пакетный POST /nodes только читает данные
+		self.call(self.factory.post("/nodes"))
+		self.assertEqual(self.databases_used, ["replica", "replica"])
+
+	def test_write_sticky_ok(self):
+		response = self.call(self.factory.post("/imports"))
+		self.assertEqual(self.databases_used, ["default"])
+		cookie = response.cookies[routers.STICKY_COOKIE]
+		self.assertEqual(cookie["max-age"], 5)
+		self.assertAlmostEqual(float(cookie.value), time.time() + 5, delta=1)
+
+		request = self.factory.get("/sales")
+		request.COOKIES[routers.STICKY_COOKIE] = cookie.value
+		response = self.call(request)
+		self.assertEqual(self.databases_used, ["default", "default"])
+		self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+		request.COOKIES[routers.STICKY_COOKIE] = str(time.time() - 1)
+		self.call(request)
+		self.assertEqual(self.databases_used[-1], "replica")
+
+	def test_write_err(self):
+		response = self.call(self.factory.delete("/delete/" + config.UUID_OK), status=404)
+		self.assertEqual(self.databases_used, ["default"])
+		self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+		request = self.factory.get("/sales")
+		request.COOKIES[routers.STICKY_COOKIE] = "err"
+		self.call(request)
+		self.assertEqual(self.databases_used[-1], "replica")
+
+	def test_streaming_ok(self):
+		def stream():
+			yield router.db_for_read(models.ShopUnit)
+
+		response = routers.replica_middleware(lambda request: StreamingHttpResponse(stream()))(self.factory.get("/sales"))
+		self.assertEqual(router.db_for_read(models.ShopUnit), "default")
+		self.assertEqual(b"".join(response.streaming_content), b"replica")
+
+	def test_async_ok(self):
+		async def view(request):
+			return self.view(request)
+
+		async_to_sync(routers.replica_middleware(view))(self.factory.get("/sales"))
+		response = async_to_sync(routers.replica_middleware(view))(self.factory.delete("/delete/" + config.UUID_OK))
+		self.assertEqual(self.databases_used, ["replica", "default"])
+		self.assertIn(routers.STICKY_COOKIE, response.cookies)
+
+	@override_settings(DATABASE_REPLICAS=[])
+	def test_no_replicas_ok(self):
+		response = self.call(self.factory.post("/imports"))
+		self.assertEqual(self.databases_used, ["default"])
+		self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+
+@unittest.skipUnless(settings.DATABASE_REPLICAS, "DB_REPLICA_HOSTS is not set")
+class ReplicaReadsTestCase(TransactionTestCase):
+	databases = "__all__"
+
+	def setUp(self):
+		self.client = Client()
+		self.replica = connections[settings.DATABASE_REPLICAS[0]]
+
+	@override_settings(NODES_CACHE_ENABLED=False)
+	def test_reads_ok(self):
+		with override_settings(DATABASE_REPLICAS=[self.replica.alias]), CaptureQueriesContext(self.replica) as queries:
+			response = self.client.post(reverse('imports'), data=config.IMPORT_OK, content_type="application/json")
+			self.assertEqual(response.status_code, 200)
+			# Сразу после импорта клиент читает с основной базы
+			response = self.client.get(reverse('nodes', args=(config.UUID_OK,)))
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(len(queries), 0)
+
+			self.client.cookies.pop(routers.STICKY_COOKIE)
+			response = self.client.get(reverse('nodes', args=(config.UUID_OK,)))
+			self.assertEqual(json.loads(response.content)["id"], config.UUID_OK)
+			self.assertGreater(len(queries), 0)
@@ -1,8 +1,13 @@
+import io
 import json
 import datetime
-from uuid import UUID
+import threading
+from uuid import UUID, uuid4
 
-from django.test import TestCase
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from psycopg2 import errors
 from pydantic.error_wrappers import ValidationError
 
 from shop_unit.tests.utils import deep_sort_children
@@ -31,30 +36,67 @@ class ServicesImportsTestCase(TestCase):
 		with self.assertRaisesMessage(ValueError, "there should not be multiple units with the same uuid"):
 			services._get_unit_indexes(self.data)
 
-	def test_get_parent_and_item_ok(self):
-		self.data.items[0].parent_id = None
-
-		parent, item = services._get_parent_and_item(0, self.data, self.unit_indexes)
-		self.assertEqual(parent, None)
-		self.assertEqual(item.uuid, UUID('d515e43f-f3f6-4471-bb77-6b455017a2d2'))
-
-		models.ShopUnit.objects.create(
-			uuid=item.uuid,
-			name=item.name,
-			date=self.data.update_date,
-			parent=parent,
-			unit_type=models.ShopUnitType[item.unit_type],
-			price=item.price
+	def test_get_existing_units_ok(self):
+		parent = models.ShopUnit.objects.create(
+			uuid=config.IMPORT_BATCHES[1]["items"][0]["parentId"],
+			name="Test",
+			date=datetime.datetime.now(),
+			unit_type=models.ShopUnitType.CATEGORY
 		)
+		with self.assertNumQueries(1):
+			units = services._get_existing_units(self.data)
+		self.assertEqual(list(units), [UUID(config.UUID_OK)])
+		self.assertEqual(units[UUID(config.UUID_OK)].name, parent.name)
+
+	def test_get_ordered_items_ok(self):
+		self.data.items.reverse()
+		unit_indexes = services._get_unit_indexes(self.data)
+		units = {UUID(config.UUID_OK): models.ShopUnit(uuid=config.UUID_OK)}
 
-		parent, item = services._get_parent_and_item(1, self.data, self.unit_indexes)
-		self.assertEqual(type(parent), models.ShopUnit)
-		self.assertEqual(parent.uuid, UUID('d515e43f-f3f6-4471-bb77-6b455017a2d2'))
-		self.assertEqual(item.uuid, UUID('863e1a7a-1304-42ae-943b-179184c077e3'))
+		with self.assertNumQueries(0):
+			items = services._get_ordered_items(self.data, unit_indexes, units)
+		self.assertEqual(len(items), 3)
+		self.assertEqual(items[0].uuid, UUID('d515e43f-f3f6-4471-bb77-6b455017a2d2'))
+		self.assertEqual({item.parent_id for item in items[1:]}, {items[0].uuid})
 
-	def test_get_parent_and_item_err(self):
+	def test_get_ordered_items_not_found(self):
 		with self.assertRaisesMessage(ValueError, "parent with given uuid not found"):
-			services._get_parent_and_item(0, self.data, self.unit_indexes)
+			services._get_ordered_items(self.data, self.unit_indexes, {})
+
+	def test_get_ordered_items_cycle(self):
+		self.data.items[0].parent_id = self.data.items[1].uuid
+		with self.assertRaisesMessage(ValueError, "units must not form a cycle"):
+			services._get_ordered_items(self.data, self.unit_indexes, {})
+
+	def test_validate_import_items_ok(self):
+		items = config.IMPORT_OK["items"]
+		self.assertEqual(
+			services._validate_import_items(items),
+			[services.ImportItem(**services.ShopUnitImport.parse_obj(item).dict()) for item in items]
+		)
+
+	def test_validate_import_items_err(self):
+		item = config.IMPORT_OK["items"][0]
+		invalid_items = [
+			"item",
+			{key: value for key, value in item.items() if key != "id"},
+			{**item, "id": "err_uuid"},
+			{**item, "parentId": 1},
+			{**item, "type": "SERVICE"},
+			{**item, "price": "100"},
+			{**item, "price": True},
+			{**item, "price": -1},
+			{**item, "price": None},
+			{**item, "name": None},
+			{**config.IMPORT_OK["items"][1], "price": 100},
+		]
+
+		for invalid_item in invalid_items:
+			with self.subTest(item=invalid_item):
+				with self.assertRaises(ValidationError):
+					services.ShopUnitImportRequest.parse_obj({**config.IMPORT_OK, "items": [invalid_item]})
+				with self.assertRaises(ValidationError):
+					services._validate_import_items([invalid_item])
 
 	def test_add_unit_statistic_ok(self):
 		shop_unit = models.ShopUnit.objects.create(
@@ -82,6 +124,180 @@ class ServicesImportsTestCase(TestCase):
 		self.assertEqual(shop_unit.name, config.IMPORT_OK["items"][0]["name"])
 		self.assertEqual(shop_unit.parent, shop_unit_parent)
 
+	def test_create_or_update_units_query_count(self):
+		services.create_or_update_units(json.dumps(config.IMPORT_BATCHES[0]))
+		query_counts = []
+
+		for size in (10, 100):
+			import_data = {
+				"items": [
+					{
+						"type": "OFFER",
+						"name": f"Offer {idx}",
+						"id": str(uuid4()),
+						"parentId": config.UUID_OK,
+						"price": idx
+					} for idx in range(size)
+				],
+				"updateDate": "2022-02-02T12:00:00.000Z"
+			}
+			with CaptureQueriesContext(connection) as queries:
+				services.create_or_update_units(json.dumps(import_data))
+			query_counts.append(len(queries))
+
+		self.assertEqual(query_counts[0], query_counts[1])
+		self.assertEqual(models.ShopUnit.objects.filter(unit_type=models.ShopUnitType.OFFER).count(), 110)
+
+	def test_create_or_update_units_offer_aggregates(self):
+		services.create_or_update_units(json.dumps(config.IMPORT_OK))
+		services.create_or_update_units(json.dumps(config.IMPORT_REPARENT_OK))
+
+		shop_unit_old_parent = models.ShopUnit.objects.get(uuid=config.IMPORT_OK["items"][1]["id"])
+		self.assertEqual((shop_unit_old_parent.offer_sum, shop_unit_old_parent.offer_count), (59999, 1))
+		self.assertEqual(shop_unit_old_parent.price, 59999)
+
+		shop_unit_new_parent = models.ShopUnit.objects.get(uuid=config.IMPORT_REPARENT_OK["items"][0]["id"])
+		self.assertEqual((shop_unit_new_parent.offer_sum, shop_unit_new_parent.offer_count), (89999, 1))
+		self.assertEqual(shop_unit_new_parent.price, 89999)
+
+		shop_unit_root = models.ShopUnit.objects.get(uuid=config.UUID_OK)
+		self.assertEqual((shop_unit_root.offer_sum, shop_unit_root.offer_count), (149998, 2))
+		self.assertEqual(shop_unit_root.price, 74999)
+
+	def test_create_or_update_units_closure(self):
+		services.create_or_update_units(json.dumps(config.IMPORT_OK))
+		services.create_or_update_units(json.dumps(config.IMPORT_REPARENT_OK))
+		services.create_or_update_units(json.dumps({
+			"items": [{
+				"type": "CATEGORY",
+				"name": "Смартфоны",
+				"id": config.IMPORT_OK["items"][1]["id"],
+				"parentId": config.IMPORT_REPARENT_OK["items"][0]["id"]
+			}],
+			"updateDate": "2022-02-03T12:00:00.000Z"
+		}))
+		links = set(models.ShopUnitClosure.objects.values_list("ancestor_id", "descendant_id", "depth"))
+
+		models.ShopUnitClosure.custom_objects.rebuild()
+		self.assertEqual(links, set(models.ShopUnitClosure.objects.values_list("ancestor_id", "descendant_id", "depth")))
+
+	def test_create_or_update_units_closure_nested_moves(self):
+		root_a, child_b, child_d, root_x = (str(uuid4()) for _ in range(4))
+		services.create_or_update_units(json.dumps({
+			"items": [
+				{"type": "CATEGORY", "name": "A", "id": root_a},
+				{"type": "CATEGORY", "name": "B", "id": child_b, "parentId": root_a},
+				{"type": "CATEGORY", "name": "D", "id": child_d, "parentId": root_a},
+				{"type": "OFFER", "name": "Offer", "id": str(uuid4()), "parentId": child_b, "price": 100},
+				{"type": "CATEGORY", "name": "X", "id": root_x}
+			],
+			"updateDate": "2022-02-01T12:00:00.000Z"
+		}))
+		# Вложенное поддерево перемещается раньше внешнего
+		services.create_or_update_units(json.dumps({
+			"items": [
+				{"type": "CATEGORY", "name": "B", "id": child_b, "parentId": child_d},
+				{"type": "CATEGORY", "name": "A", "id": root_a, "parentId": root_x}
+			],
+			"updateDate": "2022-02-02T12:00:00.000Z"
+		}))
+		links = set(models.ShopUnitClosure.objects.values_list("ancestor_id", "descendant_id", "depth"))
+
+		models.ShopUnitClosure.custom_objects.rebuild()
+		self.assertEqual(links, set(models.ShopUnitClosure.objects.values_list("ancestor_id", "descendant_id", "depth")))
+
+	def test_create_or_update_units_path(self):
+		self.test_create_or_update_units_closure()
+
+		for unit in models.ShopUnit.objects.all():
+			ancestors = [unit.uuid]
+			while ancestors[-1] is not None:
+				ancestors.append(models.ShopUnit.objects.get(uuid=ancestors[-1]).parent_id)
+			self.assertEqual(unit.path, "/" + "".join(f"{uuid}/" for uuid in reversed(ancestors[:-1])))
+
+	def test_create_or_update_units_path_cycle(self):
+		services.create_or_update_units(json.dumps(config.IMPORT_OK))
+		with self.assertRaisesMessage(ValueError, "units must not form a cycle"):
+			services.create_or_update_units(json.dumps({
+				"items": [{"type": "CATEGORY", "name": "Товары", "id": config.UUID_OK, "parentId": config.IMPORT_OK["items"][1]["id"]}],
+				"updateDate": "2022-02-03T12:00:00.000Z"
+			}))
+
+	def test_load_ancestors_query_count(self):
+		import_data = {"items": [], "updateDate": "2022-02-02T12:00:00.000Z"}
+		parent_id = None
+		for idx in range(12):
+			category_id = str(uuid4())
+			import_data["items"].append({"type": "CATEGORY", "name": f"Category {idx}", "id": category_id, "parentId": parent_id})
+			parent_id = category_id
+		services.create_or_update_units(json.dumps(import_data))
+
+		leaf = models.ShopUnit.objects.get(uuid=parent_id)
+		units = {leaf.uuid: leaf}
+		with CaptureQueriesContext(connection) as queries:
+			services._load_ancestors(units)
+			ancestors = services._get_ancestors(leaf, units)
+
+		self.assertEqual(len(queries), 1)
+		self.assertEqual(len(ancestors), 11)
+
+	def test_create_or_update_units_update_ancestor_once(self):
+		services.create_or_update_units(json.dumps(config.IMPORT_BATCHES[0]))
+		import_data = {"items": [], "updateDate": "2022-02-02T12:00:00.000Z"}
+
+		for idx in range(20):
+			category_id = str(uuid4())
+			import_data["items"].append({
+				"type": "CATEGORY",
+				"name": f"Category {idx}",
+				"id": category_id,
+				"parentId": config.UUID_OK
+			})
+			import_data["items"].append({
+				"type": "OFFER",
+				"name": f"Offer {idx}",
+				"id": str(uuid4()),
+				"parentId": category_id,
+				"price": idx
+			})
+		services.create_or_update_units(json.dumps(import_data))
+
+		shop_unit_root = models.ShopUnit.objects.get(uuid=config.UUID_OK)
+		self.assertEqual(shop_unit_root.price, 9)
+		self.assertEqual(models.ShopUnitStatistic.objects.filter(shop_unit=shop_unit_root).count(), 2)
+
+	def test_create_or_update_units_statistic_buffer(self):
+		with CaptureQueriesContext(connection) as queries:
+			statistic_count = services.create_or_update_units(json.dumps(config.IMPORT_OK))
+
+		self.assertEqual(statistic_count, 4)
+		self.assertEqual(models.ShopUnitStatistic.objects.count(), 4)
+		statistic_inserts = [
+			query for query in queries.captured_queries
+			if query["sql"].startswith('INSERT INTO "shop_unit_shopunitstatistic"')
+		]
+		self.assertEqual(len(statistic_inserts), 1)
+
+	def test_create_or_update_units_from_stream_ok(self):
+		data = io.BytesIO(json.dumps(config.IMPORT_OK).encode())
+		statistic_count = services.create_or_update_units_from_stream(data, chunk_size=1)
+		self.assertEqual(statistic_count, 4)
+
+		shop_unit_tree = services.get_shop_unit_by_uuid(config.UUID_OK)
+		self.assertEqual(deep_sort_children(shop_unit_tree), deep_sort_children(config.NODE_TREE_OK))
+
+	def test_create_or_update_units_from_stream_not_found(self):
+		data = io.BytesIO(json.dumps(config.IMPORT_NOT_FOUND).encode())
+		with self.assertRaisesMessage(ValueError, "parent with given uuid not found"):
+			services.create_or_update_units_from_stream(data, chunk_size=1)
+		self.assertFalse(models.ShopUnit.objects.exists())
+
+	def test_create_or_update_units_from_stream_duplicate(self):
+		import_data = {**config.IMPORT_OK, "items": config.IMPORT_OK["items"] + config.IMPORT_OK["items"][:1]}
+		data = io.BytesIO(json.dumps(import_data).encode())
+		with self.assertRaisesMessage(ValueError, "there should not be multiple units with the same uuid"):
+			services.create_or_update_units_from_stream(data, chunk_size=2)
+
 	def test_create_or_update_units_not_found(self):
 		with self.assertRaisesMessage(ValueError, "parent with given uuid not found"):
 			services.create_or_update_units(json.dumps(config.IMPORT_NOT_FOUND))
@@ -122,13 +338,18 @@ class ServicesDeleteTestCase(TestCase):
 		self.assertEqual(shop_unit.name, config.IMPORT_OK["items"][1]["name"])
 		self.assertEqual(shop_unit.price, 69999)
 
-		services.delete_shop_unit(config.IMPORT_OK["items"][0]["id"])
+		statistic_count = services.delete_shop_unit(config.IMPORT_OK["items"][0]["id"])
+		self.assertEqual(statistic_count, 2)
 		with self.assertRaises(models.ShopUnit.DoesNotExist):
 			models.ShopUnit.objects.get(uuid=config.IMPORT_OK["items"][0]["id"])
 
 		shop_unit = models.ShopUnit.objects.get(uuid=config.IMPORT_OK["items"][1]["id"])
 		self.assertEqual(shop_unit.name, config.IMPORT_OK["items"][1]["name"])
 		self.assertEqual(shop_unit.price, 59999)
+		self.assertEqual((shop_unit.offer_sum, shop_unit.offer_count), (59999, 1))
+
+		shop_unit = models.ShopUnit.objects.get(uuid=config.UUID_OK)
+		self.assertEqual((shop_unit.offer_sum, shop_unit.offer_count), (59999, 1))
 
 	def test_delete_shop_unit_not_found(self):
 		with self.assertRaises(models.ShopUnit.DoesNotExist):
@@ -147,6 +368,37 @@ class ServicesNodesTestCase(TestCase):
 		shop_unit_tree = services.get_shop_unit_by_uuid(config.UUID_OK)
 		self.assertEqual(deep_sort_children(shop_unit_tree), deep_sort_children(config.NODE_TREE_OK))
 
+	def test_get_shop_unit_by_uuid_serialized(self):
+		with self.assertNumQueries(1):
+			shop_unit_tree = json.loads(json.dumps(services.get_shop_unit_by_uuid(config.UUID_OK)))
+		expected_tree = json.loads(json.dumps(config.NODE_TREE_OK, default=str))
+
+		deep_sort_children(shop_unit_tree)
+		deep_sort_children(expected_tree)
+		self.assertEqual(shop_unit_tree, expected_tree)
+
+	def test_get_shop_units_by_uuids_ok(self):
+		child_uuid = "d515e43f-f3f6-4471-bb77-6b455017a2d2"
+		uuids = [config.UUID_OK, child_uuid, config.UUID_NOT_FOUND, "err_uuid"]
+		with self.assertNumQueries(1):
+			units = json.loads(json.dumps(services.get_shop_units_by_uuids(uuids)))
+
+		self.assertEqual(list(units), uuids)
+		for uuid in (config.UUID_OK, child_uuid):
+			expected_tree = json.loads(json.dumps(services.get_shop_unit_by_uuid(uuid)))
+			deep_sort_children(expected_tree)
+			deep_sort_children(units[uuid])
+			self.assertEqual(units[uuid], expected_tree)
+		self.assertEqual(units[config.UUID_NOT_FOUND], {})
+		self.assertIsNone(units["err_uuid"])
+
+	@override_settings(NODES_BATCH_MAX_SIZE=1)
+	def test_get_shop_units_by_uuids_err(self):
+		with self.assertRaisesMessage(ValueError, "ids must contain at most 1 items"):
+			services.get_shop_units_by_uuids([config.UUID_OK, config.UUID_NOT_FOUND])
+		with self.assertRaisesMessage(ValueError, "ids must be a list of strings"):
+			services.get_shop_units_by_uuids(config.UUID_OK)
+
 	def test_get_shop_unit_by_uuid_not_found(self):
 		shop_unit_tree = services.get_shop_unit_by_uuid(config.UUID_NOT_FOUND)
 		self.assertTrue(not shop_unit_tree)
@@ -176,11 +428,81 @@ class ServicesSalesTestCase(TestCase):
 		with self.assertRaisesMessage(ValueError, "date does not conform to ISO 8601 format"):
 			services.get_sales("2022.02.02 12:00:01")
 
+	def test_get_sales_pages_ok(self):
+		units = services.get_sales("2022-02-02T12:00:00.000Z", limit=1)
+		self.assertEqual(len(units["items"]), 1)
+		next_units = services.get_sales("2022-02-02T12:00:00.000Z", limit=1, cursor=units["nextCursor"])
+		self.assertEqual(len(next_units["items"]), 1)
+		self.assertNotIn("nextCursor", next_units)
+
+		all_units = services.get_sales("2022-02-02T12:00:00.000Z")
+		self.assertEqual(units["items"] + next_units["items"], all_units["items"])
+
+	def test_get_sales_pages_err(self):
+		with self.assertRaisesMessage(ValueError, "limit must be greater than zero"):
+			services.get_sales("2022-02-02T12:00:00.000Z", limit=0)
+		with self.assertRaisesMessage(ValueError, "cursor is not valid"):
+			services.get_sales("2022-02-02T12:00:00.000Z", limit=1, cursor="err_cursor")
+
 
 class ServicesNodeStatisticTestCase(TestCase):
 	def setUp(self):
 		services.create_or_update_units(json.dumps(config.IMPORT_OK))
 
+	def test_get_node_statistic_interval_ok(self):
+		services.create_or_update_units(json.dumps(config.IMPORT_UPDATE_OK))
+
+		units = services.get_node_statistic(
+			config.UUID_OK,
+			"2022-02-01T00:00:00.000Z",
+			"2022-02-02T00:00:00.000Z",
+			interval="1d",
+		)
+		raw_units = services.get_node_statistic(
+			config.UUID_OK,
+			"2022-02-01T00:00:00.000Z",
+			"2022-02-02T00:00:00.000Z",
+		)
+		self.assertEqual(len(raw_units["items"]), 2)
+		self.assertEqual(len(units["items"]), 1)
+		bucket = units["items"][0]
+		self.assertEqual(bucket["date"], "2022-02-01T00:00:00.000Z")
+		self.assertEqual(bucket["price"], raw_units["items"][-1]["price"])
+
+	def test_compact_statistic_ok(self):
+		services.create_or_update_units(json.dumps(config.IMPORT_UPDATE_OK))
+		params = (config.UUID_OK, "2022-02-01T00:00:00.000Z", "2022-02-02T00:00:00.000Z")
+		raw_units = services.get_node_statistic(*params)
+		daily_units = services.get_node_statistic(*params, interval="1d")
+
+		result = services.compact_statistic(
+			now=datetime.datetime(2022, 3, 1),
+			interval="1h",
+			rollup_after_days=7,
+			retention_days=0,
+		)
+		self.assertGreater(result["partitions_created"], 0)
+		self.assertGreater(result["rolled_up"], 0)
+
+		units = services.get_node_statistic(*params)
+		self.assertEqual(units["items"], raw_units["items"][-1:])
+		self.assertEqual(services.get_node_statistic(*params, interval="1d"), daily_units)
+
+		result = services.compact_statistic(now=datetime.datetime(2022, 4, 1), rollup_after_days=0, retention_days=7)
+		self.assertEqual(result["partitions_dropped"], 1)
+		with self.assertRaises(models.ShopUnitStatistic.DoesNotExist):
+			services.get_node_statistic(*params)
+
+	def test_get_node_statistic_interval_err(self):
+		for interval in ("0h", "1w", "err"):
+			with self.assertRaisesMessage(ValueError, "interval is not valid"):
+				services.get_node_statistic(
+					config.UUID_OK,
+					"2022-02-01T00:00:00.000Z",
+					"2022-02-02T00:00:00.000Z",
+					interval=interval,
+				)
+
 	def test_get_node_statistic_ok(self):
 		units = services.get_node_statistic(
 			config.UUID_OK,
@@ -228,3 +550,192 @@ class ServicesNodeStatisticTestCase(TestCase):
 				"2022-02-01T12:00:00.000Z",
 				"2022-02-02T12:00:00.000Z",
 			)
+
+
+class ServicesGroupCommitTestCase(TestCase):
+	def setUp(self):
+		self.category_id = str(uuid4())
+		services.create_or_update_units(json.dumps({
+			"items": [{"id": self.category_id, "name": "Category", "type": "CATEGORY"}],
+			"updateDate": "2022-02-01T12:00:00.000Z"
+		}))
+
+	def get_import(self, price, date, parent_id=None):
+		return services._parse_import_request(json.dumps({
+			"items": [{"id": str(uuid4()), "parentId": parent_id or self.category_id, "name": "Offer", "type": "OFFER", "price": price}],
+			"updateDate": date
+		}))
+
+	def test_apply_import_group_ok(self):
+		imports = [
+			self.get_import(100, "2022-02-02T12:00:00.000Z"),
+			self.get_import(300, "2022-02-03T12:00:00.000Z"),
+		]
+		with CaptureQueriesContext(connection) as queries:
+			services._apply_import_group(imports)
+
+		category = models.ShopUnit.objects.get(uuid=self.category_id)
+		self.assertEqual(category.price, 200)
+		self.assertEqual(category.date, imports[1].update_date)
+		for import_data in imports:
+			offer = models.ShopUnit.objects.get(uuid=import_data.items[0].uuid)
+			self.assertEqual(offer.date, import_data.update_date)
+
+		self.assertEqual(models.ShopUnitStatistic.objects.filter(shop_unit=category).count(), 2)
+		self.assertEqual(len([query for query in queries if "shop_unit_shopunitstatistic" in query["sql"]]), 1)
+
+	def test_apply_pending_imports_err(self):
+		group = [
+			services._PendingImport(self.get_import(100, "2022-02-02T12:00:00.000Z")),
+			services._PendingImport(self.get_import(100, "2022-02-02T12:00:00.000Z", config.UUID_NOT_FOUND)),
+		]
+		services._apply_pending_imports(group)
+
+		self.assertTrue(all(pending_import.done.is_set() for pending_import in group))
+		self.assertIsNone(group[0].error)
+		self.assertIsInstance(group[1].error, ValueError)
+		self.assertTrue(models.ShopUnit.objects.filter(uuid=group[0].import_data.items[0].uuid).exists())
+		self.assertFalse(models.ShopUnit.objects.filter(uuid=group[1].import_data.items[0].uuid).exists())
+
+
+class ServicesConcurrencyTestCase(TransactionTestCase):
+	def test_parallel_imports_into_disjoint_subtrees_ok(self):
+		root_id = str(uuid4())
+		category_ids = [str(uuid4()) for _ in range(4)]
+		services.create_or_update_units(json.dumps({
+			"items": [
+				{"id": root_id, "name": "Root", "type": "CATEGORY"},
+				*({"id": uuid, "parentId": root_id, "name": "Category", "type": "CATEGORY"} for uuid in category_ids),
+			],
+			"updateDate": "2022-02-01T12:00:00.000Z"
+		}))
+
+		imports_per_category = 5
+		barrier = threading.Barrier(len(category_ids))
+		failures = []
+
+		def run_imports(category_id):
+			try:
+				barrier.wait()
+				for price in range(imports_per_category):
+					services.create_or_update_units(json.dumps({
+						"items": [{"id": str(uuid4()), "parentId": category_id, "name": "Offer", "type": "OFFER", "price": price}],
+						"updateDate": "2022-02-02T12:00:00.000Z"
+					}))
+			except Exception as e:
+				failures.append(e)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=run_imports, args=(uuid,)) for uuid in category_ids]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(failures, [])
+		root = models.ShopUnit.objects.get(uuid=root_id)
+		self.assertEqual(root.offer_count, len(category_ids) * imports_per_category)
+		self.assertEqual(root.offer_sum, len(category_ids) * sum(range(imports_per_category)))
+		self.assertEqual(root.price, root.offer_sum // root.offer_count)
+
+	@override_settings(IMPORT_GROUP_COMMIT_WINDOW=0.5)
+	def test_grouped_imports_ok(self):
+		category_id = str(uuid4())
+		services.create_or_update_units(json.dumps({
+			"items": [{"id": category_id, "name": "Category", "type": "CATEGORY"}],
+			"updateDate": "2022-02-01T12:00:00.000Z"
+		}))
+
+		prices = [100, 200, 300, 400, 500, 600]
+		barrier = threading.Barrier(len(prices) + 1)
+		failures = []
+
+		def run_import(parent_id, price):
+			try:
+				barrier.wait()
+				services.create_or_update_units_grouped(json.dumps({
+					"items": [{"id": str(uuid4()), "parentId": parent_id, "name": "Offer", "type": "OFFER", "price": price}],
+					"updateDate": "2022-02-02T12:00:00.000Z"
+				}))
+			except Exception as e:
+				failures.append(e)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=run_import, args=(category_id, price)) for price in prices]
+		threads.append(threading.Thread(target=run_import, args=(config.UUID_NOT_FOUND, 100)))
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(len(failures), 1)
+		self.assertIsInstance(failures[0], ValueError)
+		category = models.ShopUnit.objects.get(uuid=category_id)
+		self.assertEqual(category.offer_count, len(prices))
+		self.assertEqual(category.price, sum(prices) // len(prices))
+
+
+class ServicesRetryTestCase(SimpleTestCase):
+	@override_settings(IMPORT_RETRY_ATTEMPTS=3, IMPORT_RETRY_DELAY=0)
+	def test_retry_on_conflict_ok(self):
+		calls = []
+
+		@services._retry_on_conflict
+		def func():
+			calls.append(1)
+			if len(calls) < 3:
+				raise OperationalError() from errors.DeadlockDetected()
+			return len(calls)
+
+		self.assertEqual(func(), 3)
+
+	@override_settings(IMPORT_RETRY_ATTEMPTS=3, IMPORT_RETRY_DELAY=0)
+	def test_retry_on_conflict_err(self):
+		calls = []
+
+		@services._retry_on_conflict
+		def func():
+			calls.append(1)
+			raise OperationalError() from errors.SerializationFailure()
+
+		with self.assertRaises(OperationalError):
+			func()
+		self.assertEqual(len(calls), 3)
+
+	def test_retry_on_conflict_other_error(self):
+		calls = []
+
+		@services._retry_on_conflict
+		def func():
+			calls.append(1)
+			raise ValueError("parent with given uuid not found")
+
+		with self.assertRaises(ValueError):
+			func()
+		self.assertEqual(len(calls), 1)
+
+
+class ServicesConflictTestCase(TestCase):
+	def setUp(self):
+		self.unit = models.ShopUnit.objects.create(
+			uuid=config.UUID_OK,
+			name="Test",
+			date=datetime.datetime(2022, 2, 1, tzinfo=datetime.timezone.utc),
+			unit_type=models.ShopUnitType.CATEGORY
+		)
+		models.ShopUnitClosure.custom_objects.rebuild()
+
+	def test_is_conflict_shop_unit_pk(self):
+		with self.assertRaises(IntegrityError) as context, transaction.atomic():
+			models.ShopUnit.objects.create(
+				uuid=config.UUID_OK, name="Test", date=self.unit.date, unit_type=models.ShopUnitType.CATEGORY
+			)
+		self.assertTrue(services._is_conflict(context.exception))
+
+	def test_is_conflict_other_unique(self):
+		# Повторная связь в таблице замыкания повторится при любом числе попыток
+		with self.assertRaises(IntegrityError) as context, transaction.atomic():
+			models.ShopUnitClosure.objects.create(ancestor_id=config.UUID_OK, descendant_id=config.UUID_OK, depth=0)
+		self.assertFalse(services._is_conflict(context.exception))
@@ -1,10 +1,17 @@
+from django.conf import settings
 from django.urls import path
-from shop_unit import views
+from shop_unit import async_views, views
+
+# При развертывании через ASGI используются асинхронные версии представлений
+handlers = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-	path('imports', views.imports, name='imports'),
-	path('delete/<uuid>', views.delete, name='delete'),
-	path('nodes/<uuid>', views.nodes, name='nodes'),
-	path('sales', views.sales, name='sales'),
-	path('node/<uuid>/statistic', views.node_statistic, name='node_statistic')
-]
\ No newline at end of file
+	path('imports', handlers.imports, name='imports'),
+	path('imports/<uuid>', handlers.import_job, name='import_job'),
+	path('delete/<uuid>', handlers.delete, name='delete'),
+	path('nodes', handlers.nodes_batch, name='nodes_batch'),
+	path('nodes/<uuid>', handlers.nodes, name='nodes'),
+	path('sales', handlers.sales, name='sales'),
+	path('node/<uuid>/statistic', handlers.node_statistic, name='node_statistic'),
+	path('node/<uuid>/snapshot', handlers.node_snapshot, name='node_snapshot')
+]
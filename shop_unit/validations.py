@@ -21,3 +21,9 @@ def validate_parent(parent: models.ShopUnit) -> None:
 
 	if parent is not None and parent.unit_type == models.ShopUnitType.OFFER:
 		raise ValueError("parent type cannot be OFFER")
+
+def validate_ancestor(unit: models.ShopUnit, parent: models.ShopUnit) -> None:
+	"""Проверяет, что новый родитель не является потомком объекта"""
+
+	if parent is not None and unit.path and parent.path.startswith(unit.path):
+		raise ValueError("units must not form a cycle")
@@ -1,28 +1,44 @@
-from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse, HttpResponse
-
-from shop_unit import services, models
-
+import json
+from uuid import UUID
 
-class ErrorResponse(JsonResponse):
-	def __init__(self, code: int, message: str, **kwargs):
-		self.code = code
-		self.message = message
-		super().__init__(self.get_data(), status=code, **kwargs)
+from django.conf import settings
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_http_methods
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 
-	def get_data(self):
-		return {"code": self.code, "message": self.message}
+from MegaMarket.db import routers
+from shop_unit import cache, encoding, services, models
+from shop_unit.responses import ErrorResponse, JsonResponse
 
 
 @require_http_methods(["POST"])
 def imports(request):
 	try:
-		services.create_or_update_units(request.read())
+		if request.GET.get("async") == "true":
+			job = services.create_import_job(request.read())
+			return JsonResponse({"id": job.uuid}, status=202)
+		if int(request.META.get("CONTENT_LENGTH") or 0) > settings.IMPORT_STREAMING_THRESHOLD:
+			services.create_or_update_units_from_stream(request)
+		elif settings.IMPORT_GROUP_COMMIT_WINDOW > 0:
+			services.create_or_update_units_grouped(request.read())
+		else:
+			services.create_or_update_units(request.read())
 	except Exception:
 		return ErrorResponse(400, "Validation Failed")
 	return HttpResponse(content_type="application/json")
 
 
+@require_http_methods(["GET"])
+def import_job(request, uuid):
+	try:
+		job = services.get_import_job(uuid)
+	except models.ImportJob.DoesNotExist:
+		return ErrorResponse(404, "Item not found")
+	except Exception:
+		return ErrorResponse(400, "Validation Failed")
+	return JsonResponse(job)
+
+
 @require_http_methods(["DELETE"])
 def delete(request, uuid):
 	try:
@@ -37,6 +53,10 @@ def delete(request, uuid):
 @require_http_methods(["GET"])
 def nodes(request, uuid):
 	try:
+		if request.GET.get("stream") == "true" or {"depth", "childrenOffset", "childrenLimit"} & request.GET.keys():
+			return _get_partial_nodes_response(request, uuid)
+		if settings.NODES_CACHE_ENABLED:
+			return _get_cached_nodes_response(request, uuid)
 		unit = services.get_shop_unit_by_uuid(uuid)
 		if not unit:
 			return ErrorResponse(404, "Item not found")
@@ -45,23 +65,105 @@ def nodes(request, uuid):
 	return JsonResponse(unit)
 
 
+def _get_partial_nodes_response(request, uuid: str) -> HttpResponse:
+	"""Возвращает ответ /nodes с ограничением глубины и страницей дочерних объектов, при stream=true - потоком"""
+
+	content = services.iter_shop_unit_json(
+		uuid,
+		depth=int(request.GET["depth"]) if "depth" in request.GET else None,
+		children_offset=int(request.GET.get("childrenOffset", 0)),
+		children_limit=int(request.GET["childrenLimit"]) if "childrenLimit" in request.GET else None
+	)
+	if content is None:
+		return ErrorResponse(404, "Item not found")
+	if request.GET.get("stream") == "true":
+		return StreamingHttpResponse(content, content_type="application/json")
+	return HttpResponse(b"".join(content), content_type="application/json")
+
+
+def _get_cached_nodes_response(request, uuid: str) -> HttpResponse:
+	"""Возвращает ответ /nodes из кэша по версии поддерева, либо 304, если клиент передал ту же версию в If-None-Match"""
+
+	uuid = str(UUID(uuid))
+	version = cache.get_node_version(uuid)
+	etag = f'"{version}"'
+
+	if etag in parse_etags(request.headers.get("If-None-Match", "")):
+		response = HttpResponseNotModified()
+	else:
+		content = cache.get_node_response(uuid, version)
+		if content is None:
+			# Ответ сохраняется под текущей версией, поэтому читается с основной базы, а не с отстающей реплики
+			with routers.use_primary():
+				unit = services.get_shop_unit_by_uuid(uuid)
+			if not unit:
+				return ErrorResponse(404, "Item not found")
+			content = encoding.dumps(unit)
+			cache.set_node_response(uuid, version, content)
+		response = HttpResponse(content, content_type="application/json")
+
+	response["ETag"] = etag
+	return response
+
+
+@routers.replica_reads
+@require_http_methods(["POST"])
+def nodes_batch(request):
+	try:
+		units = services.get_shop_units_by_uuids(json.loads(request.body)["ids"])
+	except Exception:
+		return ErrorResponse(400, "Validation Failed")
+
+	# Ошибки по отдельным UUID возвращаются на их месте, не прерывая весь запрос
+	for uuid, unit in units.items():
+		if unit is None:
+			units[uuid] = {"code": 400, "message": "Validation Failed"}
+		elif not unit:
+			units[uuid] = {"code": 404, "message": "Item not found"}
+	return JsonResponse(units)
+
+
 @require_http_methods(["GET"])
 def sales(request):
 	try:
 		date = request.headers.get("date") if request.GET.get('date') is None else request.GET.get('date')
-		units = services.get_sales(date)
+		limit = int(request.GET["limit"]) if "limit" in request.GET else None
+		if request.GET.get("stream") == "true":
+			return StreamingHttpResponse(
+				services.iter_sales_json(date, limit, request.GET.get("cursor")),
+				content_type="application/json"
+			)
+		units = services.get_sales(date, limit, request.GET.get("cursor"))
 	except Exception:
 		return ErrorResponse(400, "Validation Failed")
 	return JsonResponse(units)
 
 
+@require_http_methods(["GET"])
+def node_snapshot(request, uuid):
+	try:
+		date = request.headers.get("date") if request.GET.get('date') is None else request.GET.get('date')
+		unit = services.get_shop_unit_snapshot(uuid, date)
+		if not unit:
+			return ErrorResponse(404, "Item not found")
+	except Exception:
+		return ErrorResponse(400, "Validation Failed")
+	return JsonResponse(unit)
+
+
 @require_http_methods(["GET"])
 def node_statistic(request, uuid):
 	try:
 		date_start = request.headers.get("dateStart") if request.GET.get('dateStart') is None else request.GET.get(
 			'dateStart')
 		date_end = request.headers.get("dateEnd") if request.GET.get('dateEnd') is None else request.GET.get('dateEnd')
-		units = services.get_node_statistic(uuid, date_start, date_end)
+		interval = request.GET.get("interval")
+		if request.GET.get("stream") == "true":
+			return StreamingHttpResponse(
+				services.iter_node_statistic_json(uuid, date_start, date_end, interval),
+				content_type="application/json"
+			)
+		units = services.get_node_statistic(uuid, date_start, date_end, interval)
 	except models.ShopUnitStatistic.DoesNotExist:
 		return ErrorResponse(404, "Item not found")
 	except Exception: